@@ -0,0 +1,37 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Prometheus metrics of the ingest API, served on /metrics.
+
+# Seconds: a confirmed publish is a few ms, retries with backoff push it towards seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HTTP_REQUEST_LATENCY = Histogram(
+    "api_http_request_seconds",
+    "Latency of API requests by route, method and status code.",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+PUBLISH_LATENCY = Histogram(
+    "api_publish_seconds",
+    "Time to get tickets confirmed by RabbitMQ, including retries. kind is single or batch.",
+    ["mode", "kind"],
+    buckets=LATENCY_BUCKETS,
+)
+PUBLISHED = Counter(
+    "api_tickets_published_total",
+    "Tickets handed to RabbitMQ, by outcome: accepted, failed (publish error) or buffer_full.",
+    ["mode", "outcome"],
+)
+REJECTED = Counter(
+    "api_tickets_rejected_total",
+    "Batch items rejected before publishing because they failed validation.",
+)
+BATCH_SIZE = Histogram(
+    "api_batch_size",
+    "Items per batch request.",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 5000),
+)
+ASYNC_BUFFERED = Gauge(
+    "api_async_publish_buffered",
+    "Messages waiting in the async publisher's send buffer.",
+)
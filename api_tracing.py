@@ -0,0 +1,26 @@
+from typing import Optional
+import os
+import sys
+
+from opentelemetry import trace
+from opentelemetry.propagate import extract, inject
+
+# OpenTelemetry tracing of the ingest API. A ticket's trace starts at the HTTP request (or continues
+# the caller's traceparent) and travels to the worker in the AMQP headers of the published message.
+# The tracer provider is set up by the helper the services share: setup_tracing("ticket-api").
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared"))
+from tracing_setup import setup_tracing  # noqa: E402,F401
+
+tracer = trace.get_tracer("ticket_api")
+
+
+def context_from_headers(headers):
+    return extract(headers)
+
+
+def inject_headers(headers: Optional[dict] = None) -> dict:
+    """Adds the current trace context (traceparent) to a header dict."""
+    headers = dict(headers or {})
+    inject(headers)
+    return headers
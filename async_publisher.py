@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import random
+from typing import Dict, List, Optional
+
+import aio_pika
+
+from publisher import PublishError
+
+logger = logging.getLogger("ticket_api.async_publisher")
+
+
+class BufferFullError(PublishError):
+    """Raised when the in-process send buffer is full and the caller should back off."""
+
+
+class AsyncRabbitPublisher:
+    """
+    asyncio publisher used by the async ingest mode.
+
+    Requests drop their message into a bounded in-process buffer and await its broker
+    confirm; a fixed number of sender tasks drain the buffer over one robust connection
+    and a confirm-mode channel. When the buffer is full `publish` fails fast with
+    BufferFullError instead of queueing more work, which keeps memory bounded.
+    """
+
+    def __init__(self, host: str, port: int, login: str, password: str, exchange: str,
+                 queue_name: str, routing_key: str, buffer_size: int = 10000, senders: int = 64,
+                 max_retries: int = 3, backoff_base: float = 0.2, backoff_max: float = 5.0,
+                 queue_arguments: Optional[Dict] = None):
+        self.host = host
+        self.port = port
+        self.login = login
+        self.password = password
+        self.exchange_name = exchange
+        self.queue_name = queue_name
+        self.routing_key = routing_key
+        self.buffer_size = buffer_size
+        self.senders = senders
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_arguments = queue_arguments
+
+        self._buffer: Optional[asyncio.Queue] = None
+        self._connection = None
+        self._channel = None
+        self._exchange = None
+        self._tasks = []
+
+    # --- Lifecycle ---
+    async def start(self):
+        self._buffer = asyncio.Queue(maxsize=self.buffer_size)
+        # connect_robust re-establishes the connection and channel on its own.
+        self._connection = await aio_pika.connect_robust(
+            host=self.host, port=self.port, login=self.login, password=self.password
+        )
+        self._channel = await self._connection.channel(publisher_confirms=True)
+        await self.declare_topology(self._channel)
+        self._tasks = [asyncio.create_task(self._sender()) for _ in range(self.senders)]
+        logger.info(f"Async RabbitMQ publisher ready (buffer {self.buffer_size}, {self.senders} senders).")
+
+    async def declare_topology(self, channel):
+        self._exchange = await channel.declare_exchange(
+            self.exchange_name, aio_pika.ExchangeType.DIRECT, durable=True
+        )
+        queue = await channel.declare_queue(self.queue_name, durable=True, arguments=self.queue_arguments)
+        await queue.bind(self._exchange, routing_key=self.routing_key)
+
+    async def close(self):
+        """Lets the senders flush what is already buffered, then closes the connection."""
+        if self._buffer is not None:
+            await self._buffer.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._connection is not None and not self._connection.is_closed:
+            await self._connection.close()
+        logger.info("Async RabbitMQ publisher closed.")
+
+    # --- Publishing ---
+    @property
+    def buffered(self) -> int:
+        return self._buffer.qsize() if self._buffer is not None else 0
+
+    async def publish(self, body: bytes, routing_key: Optional[str] = None, **properties):
+        """Buffers one persistent message and waits until the broker has confirmed it."""
+        message = aio_pika.Message(body=body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT, **properties)
+        confirmed = asyncio.get_running_loop().create_future()
+        try:
+            self._buffer.put_nowait((message, routing_key or self.routing_key, confirmed))
+        except asyncio.QueueFull:
+            raise BufferFullError(f"Send buffer is full ({self.buffer_size} messages)")
+        await confirmed
+
+    async def publish_batch(self, bodies: List[bytes], priorities: Optional[List[int]] = None,
+                            routing_key: Optional[str] = None, headers: Optional[dict] = None) -> List[Optional[Exception]]:
+        """
+        Buffers a whole batch at once and waits for all of its confirms. The senders
+        pipeline the publishes on the shared channel, so confirms for the batch arrive
+        together instead of one round trip per message. Returns one entry per body:
+        None when confirmed, otherwise the error.
+        """
+        free = self.buffer_size - self._buffer.qsize()
+        if len(bodies) > free:
+            raise BufferFullError(f"Send buffer has room for {free} messages, batch has {len(bodies)}")
+
+        loop = asyncio.get_running_loop()
+        pending = []
+        for body, priority in zip(bodies, priorities or [None] * len(bodies)):
+            message = aio_pika.Message(
+                body=body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT, priority=priority, headers=headers
+            )
+            confirmed = loop.create_future()
+            self._buffer.put_nowait((message, routing_key or self.routing_key, confirmed))
+            pending.append(confirmed)
+
+        return await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _sender(self):
+        while True:
+            message, routing_key, confirmed = await self._buffer.get()
+            try:
+                await self._publish_with_retry(message, routing_key)
+            except asyncio.CancelledError:
+                if not confirmed.done():
+                    confirmed.set_exception(PublishError("Publisher closed before the message was confirmed"))
+                raise
+            except Exception as e:
+                # anything else (e.g. aiormq's ChannelInvalidStateError while the robust connection
+                # reconnects) fails this message only: the caller gets the error, the sender keeps going
+                if not isinstance(e, PublishError):
+                    logger.warning(f"Async publish failed unexpectedly: {e!r}")
+                if not confirmed.done():
+                    confirmed.set_exception(e if isinstance(e, PublishError) else PublishError(f"Failed to publish: {e!r}"))
+            else:
+                if not confirmed.done():
+                    confirmed.set_result(None)
+            finally:
+                self._buffer.task_done()
+
+    async def _publish_with_retry(self, message, routing_key: str):
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff(attempt))
+            try:
+                await self._exchange.publish(message, routing_key=routing_key, mandatory=True)
+                return
+            except aio_pika.exceptions.DeliveryError as e:
+                # Nacked or returned as unroutable: the broker answered, don't retry.
+                raise PublishError(f"Broker refused message: {e!r}") from e
+            except (aio_pika.exceptions.AMQPError, ConnectionError, asyncio.TimeoutError) as e:
+                last_error = e
+                logger.warning(f"Async publish attempt {attempt + 1} failed: {e!r}")
+
+        raise PublishError(f"Failed to publish after {self.max_retries + 1} attempts: {last_error!r}")
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
@@ -0,0 +1,150 @@
+"""
+What queue-driven scaling of the ticket workers buys over a fixed pool sized for the peak.
+
+Replays a day of ticket arrivals (a quiet night, a morning ramp, a midday peak, a short burst and
+an evening decline) in simulated time against the supervisor's ScalingPolicy. The workers are
+modelled, not started: each one handles --worker-capacity tickets per second once it is up,
+--startup-seconds after the supervisor asked for it. The policy sees what the management API
+would show every --interval seconds: ready messages, consumers and the publish/ack rates over
+the last poll. --mode depth gives it the ready messages only (the AMQP fallback).
+
+Reports worker-hours against a static pool of --max-workers, the backlog and the time tickets
+waited in the queue (first in, first out).
+
+    python benchmarks/bench_autoscale.py
+    python benchmarks/bench_autoscale.py --mode depth --burst-rate 30
+"""
+import argparse
+import bisect
+import math
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "workers"))
+from supervisor import QueueStats, ScalingPolicy  # noqa: E402
+
+DAY = 24 * 3600
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("rates", "depth", "both"), default="both")
+    parser.add_argument("--night-rate", type=float, default=0.5, help="tickets per second at night")
+    parser.add_argument("--peak-rate", type=float, default=10.0, help="tickets per second at the midday peak")
+    parser.add_argument("--burst-rate", type=float, default=20.0, help="tickets per second during the burst")
+    parser.add_argument("--burst-minutes", type=float, default=10)
+    parser.add_argument("--worker-capacity", type=float, default=2.0, help="tickets per second of one worker")
+    parser.add_argument("--startup-seconds", type=float, default=20)
+    parser.add_argument("--interval", type=float, default=15, help="seconds between polls")
+    parser.add_argument("--min-workers", type=int, default=1)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--scale-down-delay", type=float, default=300)
+    return parser.parse_args()
+
+
+def arrival_rate(args, t: float) -> float:
+    '''tickets per second at second `t` of the day'''
+    hour = t / 3600
+    if 7 <= hour < 20:
+        # office hours: a sine arc peaking at half past one
+        rate = args.night_rate + (args.peak_rate - args.night_rate) * math.sin(math.pi * (hour - 7) / 13)
+    else:
+        rate = args.night_rate
+    if 11 * 3600 <= t < 11 * 3600 + args.burst_minutes * 60:
+        # a mailing or an outage brings a wave of tickets
+        rate = max(rate, args.burst_rate)
+    return rate
+
+
+def simulate(args, policy=None, with_rates: bool = True) -> dict:
+    '''one simulated day with one-second steps. without a policy the pool stays at max_workers'''
+    workers = args.max_workers if policy is None else args.min_workers
+    starting = []  # seconds at which requested workers are up
+    backlog = 0.0
+    arrived, done = [0.0], [0.0]  # cumulative tickets, per second
+    worker_seconds = 0.0
+    peak_backlog = 0.0
+    timeline = []
+    last_poll_arrived = last_poll_done = 0.0
+
+    for t in range(DAY):
+        while starting and starting[0] <= t:
+            starting.pop(0)
+            workers += 1
+        arrivals = arrival_rate(args, t)
+        served = min(backlog + arrivals, workers * args.worker_capacity)
+        backlog += arrivals - served
+        arrived.append(arrived[-1] + arrivals)
+        done.append(done[-1] + served)
+        worker_seconds += workers + len(starting)
+        peak_backlog = max(peak_backlog, backlog)
+
+        if policy is not None and t % args.interval == 0 and t > 0:
+            stats = QueueStats(ready=int(backlog), consumers=workers)
+            if with_rates:
+                stats.publish_rate = (arrived[-1] - last_poll_arrived) / args.interval
+                stats.ack_rate = (done[-1] - last_poll_done) / args.interval
+            last_poll_arrived, last_poll_done = arrived[-1], done[-1]
+            current = workers + len(starting)
+            desired = policy.desired(current, stats, now=t)
+            if desired > current:
+                starting.extend([t + args.startup_seconds] * (desired - current))
+            elif desired < current:
+                # workers that are still starting are cancelled first, then running ones drain
+                cancelled = min(len(starting), current - desired)
+                del starting[len(starting) - cancelled:]
+                workers -= current - desired - cancelled
+        if t % 3600 == 0:
+            timeline.append(workers + len(starting))
+
+    # FIFO: a ticket arriving when `arrived` reached n is done when `done` reaches n
+    waits = []
+    for t in range(0, DAY, 5):
+        finished_at = bisect.bisect_left(done, arrived[t + 1], lo=t)
+        waits.append((finished_at - t, arrival_rate(args, t)))
+    waits.sort()
+    total = sum(weight for _, weight in waits)
+    p95, seen = None, 0.0
+    for wait, weight in waits:
+        seen += weight
+        if seen >= 0.95 * total:
+            p95 = wait
+            break
+    return {
+        "worker_hours": worker_seconds / 3600,
+        "peak_backlog": peak_backlog,
+        "wait_p95": p95,
+        "wait_max": waits[-1][0],
+        "timeline": timeline,
+        "capacity": None if policy is None else policy.capacity,
+    }
+
+
+def new_policy(args) -> ScalingPolicy:
+    return ScalingPolicy(min_workers=args.min_workers, max_workers=args.max_workers,
+                         scale_down_delay=args.scale_down_delay)
+
+
+def main():
+    args = parse_args()
+    runs = [("static pool", simulate(args))]
+    if args.mode in ("rates", "both"):
+        runs.append(("rates", simulate(args, new_policy(args), with_rates=True)))
+    if args.mode in ("depth", "both"):
+        runs.append(("depth", simulate(args, new_policy(args), with_rates=False)))
+
+    static_hours = runs[0][1]["worker_hours"]
+    tickets = sum(arrival_rate(args, t) for t in range(DAY))
+    print(f"tickets per day           {tickets:.0f} (peak {args.peak_rate}/s, burst {args.burst_rate}/s for {args.burst_minutes:.0f} min), "
+          f"{args.worker_capacity}/s per worker, {args.max_workers} workers max")
+    for label, result in runs:
+        learned = f", learned capacity {result['capacity']:.2f}/s" if result["capacity"] else ""
+        print(f"{label:<26}worker-hours {result['worker_hours']:6.1f} ({result['worker_hours'] / static_hours:4.0%} of static)   "
+              f"wait p95 {result['wait_p95']:4d}s, max {result['wait_max']:4d}s   peak backlog {result['peak_backlog']:6.0f}{learned}")
+    for label, result in runs[1:]:
+        print(f"workers by hour, {label:<9}" + " ".join(str(workers) for workers in result["timeline"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compares the old connection-per-request publish path with the pooled RabbitPublisher.
+
+Needs a reachable RabbitMQ (e.g. `docker compose up rabbitmq`) and the usual RABBITMQ_* env vars.
+
+    python benchmarks/bench_ingest_publish.py --requests 2000 --threads 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pika
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from publisher import RabbitPublisher  # noqa: E402
+
+load_dotenv()
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
+RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
+RABBITMQ_USER = os.getenv("RABBITMQ_USER", "user")
+RABBITMQ_PASS = os.getenv("RABBITMQ_PASS", "password")
+
+EXCHANGE_NAME = "bench.assistance.exchange"
+QUEUE_NAME = "bench.assistance.classification.queue"
+ROUTING_KEY = "bench.classify"
+
+BODY = b'{"userInput": "There is an unauthorized charge on my card", "Id": "bench-1"}'
+
+
+def connection_parameters() -> pika.ConnectionParameters:
+    credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
+    return pika.ConnectionParameters(host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=credentials)
+
+
+def publish_per_request(parameters):
+    '''the original create_ticket path: connect, declare, publish, close'''
+    connection = pika.BlockingConnection(parameters)
+    try:
+        channel = connection.channel()
+        channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type='direct', durable=True)
+        channel.queue_declare(queue=QUEUE_NAME, durable=True)
+        channel.queue_bind(exchange=EXCHANGE_NAME, queue=QUEUE_NAME, routing_key=ROUTING_KEY)
+        channel.basic_publish(
+            exchange=EXCHANGE_NAME,
+            routing_key=ROUTING_KEY,
+            body=BODY,
+            properties=pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE),
+        )
+    finally:
+        connection.close()
+
+
+def run(label, fn, requests, threads):
+    def timed(_):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<22} {requests / elapsed:>9.0f} req/s   p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16, help="concurrent callers (FastAPI threadpool stand-in)")
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    parameters = connection_parameters()
+    publisher = RabbitPublisher(parameters, EXCHANGE_NAME, QUEUE_NAME, ROUTING_KEY, pool_size=args.pool_size)
+    publisher.start(max_attempts=1)
+
+    try:
+        run("connection per request", lambda: publish_per_request(parameters), args.requests, args.threads)
+        run("pooled + confirms", lambda: publisher.publish(BODY), args.requests, args.threads)
+    finally:
+        with publisher.channel() as channel:
+            channel.queue_purge(QUEUE_NAME)
+        publisher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+End-to-end pipeline benchmark: synthetic tickets -> incoming queue -> TicketWorker -> Redis cache
+-> AI server -> reason queue, measured from publish to the reason message.
+
+Runs on a plain CPU machine: the real TicketWorker and the real AI server app (with the stub
+engine and its prefill/decode latency model) run in this process, and RabbitMQ and Redis are
+replaced by the in-process stand-ins in standins.py. With --services external the worker talks
+to the RabbitMQ and Redis from compose.yml (RABBITMQ_*/REDIS_HOST env vars) instead, and
+--ai-url points it at an already running AI server (e.g. vLLM on a GPU box).
+Tickets are published in the worker's message format, so the ingest API is not part of the
+measurement (see bench_ingest_publish.py for that hop).
+With --replicas N the AI server runs as N stub server processes on localhost instead, and the
+worker balances over them; --slow-replica makes the last one that many times slower to decode,
+to watch the worker route around it and eject it.
+
+Reports throughput, end-to-end latency percentiles, cache hit rate and worker utilization.
+--save writes the results as JSON, --baseline compares a run against a saved one.
+
+    python benchmarks/bench_pipeline.py --tickets 2000 --rate 80 --concurrency 32
+    python benchmarks/bench_pipeline.py --duplicate-ratio 0.6 --arrival burst --save baseline.json
+    python benchmarks/bench_pipeline.py --cache-key-strategy simhash --baseline baseline.json
+    python benchmarks/bench_pipeline.py --replicas 3 --slow-replica 5
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
+
+import pika
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "workers"))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "service", "ai_services"))
+from priority import ticket_priority  # noqa: E402
+from standins import InMemoryBroker, InMemoryRedis  # noqa: E402
+from ticket_generator import ARRIVAL_PROCESSES, TicketGenerator, arrival_offsets  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    load = parser.add_argument_group("load")
+    load.add_argument("--tickets", type=int, default=1000)
+    load.add_argument("--rate", type=float, default=50, help="mean arrivals per second")
+    load.add_argument("--arrival", choices=ARRIVAL_PROCESSES, default="poisson")
+    load.add_argument("--duplicate-ratio", type=float, default=0.3, help="share of exact repeats of earlier tickets")
+    load.add_argument("--near-duplicate-ratio", type=float, default=0.1, help="share of cosmetic variants of earlier tickets")
+    load.add_argument("--off-domain-ratio", type=float, default=0.05)
+    load.add_argument("--resubmit-ratio", type=float, default=0.0,
+                      help="share of tickets published a second time under the same id, up to --resubmit-within seconds later")
+    load.add_argument("--resubmit-within", type=float, default=2.0)
+    load.add_argument("--seed", type=int, default=7)
+
+    worker = parser.add_argument_group("worker")
+    worker.add_argument("--concurrency", type=int, default=16)
+    worker.add_argument("--prefetch", type=int, default=None, help="defaults to 2x concurrency")
+    worker.add_argument("--cache-key-strategy", default="normalized", choices=("raw", "normalized", "simhash"))
+    worker.add_argument("--local-cache-size", type=int, default=10000)
+    worker.add_argument("--ai-batch-max-items", type=int, default=1)
+    worker.add_argument("--max-priority", type=int, default=0, help="x-max-priority of the incoming queue")
+    worker.add_argument("--retry-delay-ms", type=int, default=1000, help="how long failed tickets wait before a retry")
+    worker.add_argument("--idempotency", choices=("on", "off"), default="on", help="reuse results of ticket ids seen before")
+    worker.add_argument("--result-batch-max-items", type=int, default=64, help="processed tickets per publish transaction")
+
+    engine = parser.add_argument_group("AI server")
+    engine.add_argument("--ai-url", default=None, help="use a running AI server instead of the in-process stub")
+    engine.add_argument("--prefill-ms-per-token", type=float, default=0.02)
+    engine.add_argument("--decode-ms-per-token", type=float, default=1.0)
+    engine.add_argument("--max-num-seqs", type=int, default=32, help="concurrent sequences in the stub engine")
+    engine.add_argument("--replicas", type=int, default=1, help="run this many stub AI server processes")
+    engine.add_argument("--slow-replica", type=float, default=1.0, help="decode slowdown of the last replica")
+    engine.add_argument("--max-queued", type=int, default=64,
+                        help="engine queue depth before the AI server sheds tickets with 503 (-1: never)")
+    engine.add_argument("--prefix-caching", choices=("on", "off"), default="on")
+    engine.add_argument("--guided-decoding", choices=("on", "off"), default="off")
+    engine.add_argument("--preclassifier", choices=("on", "shadow", "off"), default="on")
+
+    services = parser.add_argument_group("services")
+    services.add_argument("--services", choices=("inmemory", "external"), default="inmemory")
+    services.add_argument("--redis-latency-ms", type=float, default=0.2, help="round trip of the in-memory redis")
+    services.add_argument("--commit-latency-ms", type=float, default=2.0,
+                          help="tx.commit of the in-memory broker: round trip plus writing the messages to disk")
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--timeout", type=float, default=300, help="give up waiting for results after this long")
+    output.add_argument("--save", help="write the results to this JSON file")
+    output.add_argument("--baseline", help="compare with results saved by --save")
+    return parser.parse_args()
+
+
+def configure_environment(args, ai_url: str):
+    '''the worker and the AI server read their settings from the environment'''
+    os.environ.update({
+        "VLLM_API_URL": ai_url,
+        "WORKER_CONCURRENCY": str(args.concurrency),
+        "WORKER_PREFETCH": str(args.prefetch or args.concurrency * 2),
+        "WORKER_METRICS_PORT": "0",
+        "CACHE_KEY_STRATEGY": args.cache_key_strategy,
+        "LOCAL_CACHE_SIZE": str(args.local_cache_size),
+        "AI_BATCH_MAX_ITEMS": str(args.ai_batch_max_items),
+        "RABBITMQ_MAX_PRIORITY": str(args.max_priority),
+        "TICKET_RETRY_DELAY_MS": str(args.retry_delay_ms),
+        "IDEMPOTENCY_TTL_SECONDS": "86400" if args.idempotency == "on" else "0",
+        "RESULT_BATCH_MAX_ITEMS": str(args.result_batch_max_items),
+        "AI_ENGINE": "stub",
+        "AI_MAX_NUM_SEQS": str(args.max_num_seqs),
+        "AI_MAX_QUEUED_REQUESTS": str(args.max_queued),
+        "AI_ENABLE_PREFIX_CACHING": "true" if args.prefix_caching == "on" else "false",
+        "AI_GUIDED_DECODING": "true" if args.guided_decoding == "on" else "false",
+        "AI_PRECLASSIFIER": args.preclassifier,
+        "TRACING_EXPORTER": "none",
+    })
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_ai_server(args, port: int):
+    '''serves the real ai_server app with the stub engine on a background thread'''
+    import uvicorn
+    import ai_server
+    from stub_engine import StubEngine
+
+    ai_server.engine = StubEngine(
+        prefill_ms_per_token=args.prefill_ms_per_token,
+        decode_ms_per_token=args.decode_ms_per_token,
+        enable_prefix_caching=args.prefix_caching == "on",
+        max_num_seqs=args.max_num_seqs,
+    )
+    server = uvicorn.Server(uvicorn.Config(ai_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="ai-server", daemon=True).start()
+    # started, then warmed up
+    while not ai_server.lifecycle.ready:
+        if not ai_server.lifecycle.live:
+            raise SystemExit(f"AI server failed to start: {ai_server.lifecycle.error}")
+        time.sleep(0.01)
+    return server, ai_server.engine
+
+
+def start_ai_replicas(args) -> list:
+    '''starts --replicas stub AI server processes, returns their /generate URLs once they are healthy'''
+    urls = []
+    for index in range(args.replicas):
+        port = free_port()
+        slowdown = args.slow_replica if index == args.replicas - 1 else 1.0
+        env = dict(
+            os.environ,
+            AI_SERVER_PORT=str(port),
+            AI_STUB_PREFILL_MS_PER_TOKEN=str(args.prefill_ms_per_token * slowdown),
+            AI_STUB_DECODE_MS_PER_TOKEN=str(args.decode_ms_per_token * slowdown),
+        )
+        process = subprocess.Popen(
+            [sys.executable, "ai_server.py"], cwd=os.path.join(BENCH_DIR, "..", "service", "ai_services"),
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        atexit.register(process.terminate)
+        urls.append(f"http://127.0.0.1:{port}/generate")
+
+    for url in urls:
+        health_url = url.rsplit("/", 1)[0] + "/health/ready"
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if requests.get(health_url, timeout=1).ok:
+                    break
+            except requests.exceptions.RequestException:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"AI server replica {health_url} did not come up")
+            time.sleep(0.2)
+    return urls
+
+
+class InMemoryTransport:
+
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+
+    def publish(self, exchange, routing_key, body, properties):
+        self.broker.publish(exchange, routing_key, body, properties)
+
+    def results(self, queue, stop: threading.Event):
+        while not stop.is_set():
+            message = self.broker.get(queue, timeout=0.2)
+            if message is not None:
+                yield message[0]
+
+
+class ExternalTransport:
+
+    '''pika connections to a real broker: one for publishing (benchmark thread), one for the collector'''
+
+    def __init__(self, parameters: pika.ConnectionParameters):
+        self.parameters = parameters
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+
+    def publish(self, exchange, routing_key, body, properties):
+        self.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+
+    def results(self, queue, stop: threading.Event):
+        connection = pika.BlockingConnection(self.parameters)
+        channel = connection.channel()
+        for method, _, body in channel.consume(queue, inactivity_timeout=0.2):
+            if stop.is_set():
+                break
+            if method is not None:
+                channel.basic_ack(method.delivery_tag)
+                yield body
+        channel.cancel()
+        connection.close()
+
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return float("nan")
+    index = min(len(samples) - 1, max(0, round(q / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def sample(name: str, **labels) -> float:
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def run(args) -> dict:
+    port = free_port()
+    ai_url = args.ai_url or f"http://127.0.0.1:{port}/generate"
+    configure_environment(args, ai_url)
+    if args.replicas > 1 and not args.ai_url:
+        os.environ["VLLM_API_URL"] = ",".join(start_ai_replicas(args))
+    engine = None
+    if not args.ai_url and args.replicas == 1:
+        _, engine = start_ai_server(args, port)
+        # leave the warm-up out of the engine counts
+        warmup_generations = engine.generate_calls
+        warmup_tokens = sample("ai_server_completion_tokens_total")
+
+    import ticket_worker
+
+    patches = contextlib.ExitStack()
+    redis_standins = []
+    if args.services == "inmemory":
+        broker = InMemoryBroker(args.commit_latency_ms)
+
+        def redis_factory(**kwargs):
+            redis_standins.append(InMemoryRedis(args.redis_latency_ms, decode_responses=kwargs.get("decode_responses", False)))
+            return redis_standins[-1]
+        patches.enter_context(mock.patch.object(ticket_worker.pika, "BlockingConnection", broker.connect))
+        patches.enter_context(mock.patch.object(ticket_worker.redis, "Redis", redis_factory))
+        transport = InMemoryTransport(broker)
+
+    # the worker prints a few lines per ticket
+    with patches, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        worker = ticket_worker.TicketWorker()
+        if args.services == "external":
+            credentials = pika.PlainCredentials(worker.rabbit_user, worker.rabbit_pass)
+            transport = ExternalTransport(pika.ConnectionParameters(worker.rabbit_host, 5672, '/', credentials))
+
+        # worker utilization: time executor threads spend on tickets
+        busy = [0.0]
+        busy_lock = threading.Lock()
+        handle_message = worker._handle_message
+
+        def timed_handle_message(*handler_args):
+            started = time.perf_counter()
+            try:
+                return handle_message(*handler_args)
+            finally:
+                with busy_lock:
+                    busy[0] += time.perf_counter() - started
+        worker._handle_message = timed_handle_message
+
+        threading.Thread(target=worker.run, name="ticket-worker", daemon=True).start()
+        while worker.executor is None or worker.ticket_cache is None:
+            time.sleep(0.01)
+
+        generator = TicketGenerator(args.seed, args.duplicate_ratio, args.near_duplicate_ratio, args.off_domain_ratio)
+        tickets = list(generator.tickets(args.tickets))
+        offsets = arrival_offsets(args.arrival, args.rate, args.tickets, seed=args.seed)
+        deliveries = list(zip(tickets, offsets))
+        rng = random.Random(args.seed)
+        deliveries += [(ticket, offset + rng.uniform(0, args.resubmit_within))
+                       for ticket, offset in zip(tickets, offsets) if rng.random() < args.resubmit_ratio]
+        deliveries.sort(key=lambda delivery: delivery[1])
+
+        # latency of a ticket id is up to its first reason message, later ones are the resubmits'
+        sent_at, answered, latencies = {}, set(), []
+        stop = threading.Event()
+
+        def collect():
+            for body in transport.results(worker.outgoing_queue, stop):
+                ticket_id = json.loads(body).get("id")
+                if ticket_id in sent_at and ticket_id not in answered:
+                    answered.add(ticket_id)
+                    latencies.append(time.perf_counter() - sent_at[ticket_id])
+        collector = threading.Thread(target=collect, name="collector", daemon=True)
+        collector.start()
+
+        print(f"publishing {args.tickets} tickets at ~{args.rate:.0f}/s ({args.arrival})", file=sys.stderr)
+        started = time.perf_counter()
+        for ticket, offset in deliveries:
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            priority = ticket_priority(ticket["userInput"], max_priority=args.max_priority) if args.max_priority else None
+            sent_at.setdefault(ticket["id"], time.perf_counter())
+            transport.publish(
+                worker.exchange_name, worker.incoming_routing_key, json.dumps(ticket).encode(),
+                pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE, priority=priority),
+            )
+        published_in = time.perf_counter() - started
+
+        # a ticket is done once it is published or given up on; failed attempts come back from the retry queue
+        def handled():
+            return sample("worker_tickets_total", outcome="published") + sample("worker_tickets_rerouted_total", destination="dead_letter")
+        deadline = time.monotonic() + args.timeout
+        while handled() < len(deliveries) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        while len(latencies) < len(sent_at) - sample("worker_tickets_rerouted_total", destination="dead_letter") \
+                and time.monotonic() < deadline:
+            time.sleep(0.05)
+        wall = time.perf_counter() - started
+        stop.set()
+        collector.join(timeout=1)
+        if args.services == "inmemory":
+            worker.rabbit_channel.stop_consuming()
+
+    latencies.sort()
+    sources = {source: sample("worker_cache_lookups_total", source=source) for source in ("local", "redis", "coalesced", "generated")}
+    lookups = sum(sources.values())
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("save", "baseline")},
+        "tickets": args.tickets,
+        "distinct_texts": len({t["userInput"] for t in tickets}),
+        "resubmitted": len(deliveries) - len(tickets),
+        "duplicates": {state: sample("worker_duplicate_tickets_total", state=state) for state in ("done", "pending")},
+        "completed": len(latencies),
+        "failed": args.tickets - len(latencies),
+        "publish_seconds": published_in,
+        "wall_seconds": wall,
+        "throughput_per_second": len(latencies) / wall,
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else float("nan"),
+        },
+        "cache": {
+            **sources,
+            "hit_rate": (lookups - sources["generated"]) / lookups if lookups else 0.0,
+        },
+        "worker_utilization": busy[0] / (args.concurrency * wall),
+        "retries": sample("worker_tickets_rerouted_total", destination="retry"),
+        "dead_lettered": sample("worker_tickets_rerouted_total", destination="dead_letter"),
+        "shed_by_ai_server": sample("ai_server_shed_total") if engine else None,
+        "ai_requests": sum(sample("worker_ai_requests_total", endpoint=e, outcome="ok") for e in ("generate", "generate_batch")),
+        "engine_generations": engine.generate_calls - warmup_generations if engine else None,
+        "completion_tokens": sample("ai_server_completion_tokens_total") - warmup_tokens if engine else None,
+        "replica_requests": {r.base_url: r.requests for r in worker.ai_client.router.replicas},
+        "redis_round_trips": sum(r.round_trips for r in redis_standins) if redis_standins else None,
+        "result_batches": sample("worker_result_batch_size_count"),
+    }
+
+
+def report(results: dict, baseline: dict = None):
+    rows = [
+        ("tickets (distinct texts)", f"{results['tickets']} ({results['distinct_texts']})", None),
+        ("completed / failed", f"{results['completed']} / {results['failed']}", None),
+        ("resubmitted ids", f"{results['resubmitted']} (result reused {results['duplicates']['done']:.0f}, "
+                            f"waited {results['duplicates']['pending']:.0f})", None),
+        ("throughput", f"{results['throughput_per_second']:.1f} tickets/s", ("throughput_per_second",)),
+        ("latency p50", f"{results['latency_ms']['p50']:.1f} ms", ("latency_ms", "p50")),
+        ("latency p95", f"{results['latency_ms']['p95']:.1f} ms", ("latency_ms", "p95")),
+        ("latency p99", f"{results['latency_ms']['p99']:.1f} ms", ("latency_ms", "p99")),
+        ("latency max", f"{results['latency_ms']['max']:.1f} ms", ("latency_ms", "max")),
+        ("cache hit rate", f"{results['cache']['hit_rate']:.1%} "
+                           f"(local {results['cache']['local']:.0f}, redis {results['cache']['redis']:.0f}, "
+                           f"coalesced {results['cache']['coalesced']:.0f}, generated {results['cache']['generated']:.0f})",
+         ("cache", "hit_rate")),
+        ("worker utilization", f"{results['worker_utilization']:.1%}", ("worker_utilization",)),
+        ("retries / dead-lettered", f"{results['retries']:.0f} / {results['dead_lettered']:.0f}", None),
+        ("AI server requests", f"{results['ai_requests']:.0f}", ("ai_requests",)),
+        ("result publish batches", f"{results['result_batches']:.0f} "
+                                   f"({results['completed'] / max(1, results['result_batches']):.1f} tickets per commit)",
+         ("result_batches",)),
+    ]
+    if results["engine_generations"] is not None:
+        rows.append(("engine generations", f"{results['engine_generations']}", ("engine_generations",)))
+        rows.append(("completion tokens", f"{results['completion_tokens']:.0f}", ("completion_tokens",)))
+        rows.append(("shed by AI server (503)", f"{results['shed_by_ai_server']:.0f}", None))
+    if len(results["replica_requests"]) > 1:
+        rows.append(("requests per replica", " / ".join(f"{n}" for n in results["replica_requests"].values()), None))
+    if results["redis_round_trips"] is not None:
+        rows.append(("redis round trips", f"{results['redis_round_trips']}", ("redis_round_trips",)))
+
+    for label, value, path in rows:
+        line = f"{label:<26}{value}"
+        if baseline and path:
+            current, before = results, baseline
+            for key in path:
+                current, before = current[key], before.get(key) if isinstance(before, dict) else None
+            if before:
+                line += f"   ({(current - before) / before:+.1%} vs baseline)"
+        print(line)
+
+
+def main():
+    args = parse_args()
+    results = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
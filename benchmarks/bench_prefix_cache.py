@@ -0,0 +1,126 @@
+"""
+Measures what the shared few-shot prefix costs per request, with and without prefix caching.
+
+Reports prompt tokens, tokens served from the prefix cache and time-to-first-token for a
+set of distinct tickets. Runs on CPU against the stub engine by default; pass --engine vllm
+on a GPU box to measure the real model.
+
+    python benchmarks/bench_prefix_cache.py --engine stub --requests 200 --concurrency 16
+    python benchmarks/bench_prefix_cache.py --engine vllm --prefix-caching on
+"""
+import argparse
+import asyncio
+import gc
+import os
+import statistics
+import sys
+import time
+import uuid
+
+AI_SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "service", "ai_services")
+sys.path.insert(0, AI_SERVICES_DIR)
+from prompts.prompt import BankingPrompts  # noqa: E402
+from stub_engine import StubEngine  # noqa: E402
+
+MODEL_NAME = "Qwen/Qwen2.5-0.5B-Instruct-GPTQ-Int8"
+
+CUSTOMER_TEXTS = [
+    "My debit card was declined at the supermarket even though I have money in my checking account.",
+    "I was charged a monthly fee on my savings account, I thought it was free.",
+    "How do I increase the limit on my credit card?",
+    "A wire transfer I sent on Monday still hasn't arrived, please email me.",
+    "Someone logged into my online banking from another country.",
+    "What is the interest rate on your 30 year mortgage?",
+]
+
+
+def build_engine(backend: str, prefix_caching: bool):
+    if backend == "stub":
+        # roughly a small model on a busy GPU: prefill is cheap per token but the prefix is long
+        return StubEngine(prefill_ms_per_token=0.05, decode_ms_per_token=1.0, enable_prefix_caching=prefix_caching)
+
+    from vllm.engine.arg_utils import AsyncEngineArgs
+    from vllm.engine.async_llm_engine import AsyncLLMEngine
+    engine_args = AsyncEngineArgs(
+        model=MODEL_NAME,
+        quantization="gptq",
+        gpu_memory_utilization=0.90,
+        max_model_len=4096,
+        enable_prefix_caching=prefix_caching,
+    )
+    return AsyncLLMEngine.from_engine_args(engine_args)
+
+
+def sampling_params(backend: str):
+    if backend == "stub":
+        class _Params:
+            max_tokens = 64
+        return _Params()
+
+    from vllm.sampling_params import SamplingParams
+    return SamplingParams(temperature=0.0, max_tokens=64)
+
+
+async def one_request(engine, params, prompt: str):
+    started = time.perf_counter()
+    ttft = None
+    prompt_tokens = cached_tokens = 0
+    async for output in engine.generate(prompt, params, f"bench-{uuid.uuid4().hex}"):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+            prompt_tokens = len(output.prompt_token_ids)
+            cached_tokens = output.num_cached_tokens or 0
+    return ttft, prompt_tokens, cached_tokens
+
+
+async def run_mode(backend: str, prefix_caching: bool, requests: int, concurrency: int):
+    engine = build_engine(backend, prefix_caching)
+    params = sampling_params(backend)
+    prefix = BankingPrompts.get_few_shot_prefix()
+
+    # warm up once so both modes start from the same state (model loaded, prefix seen)
+    await one_request(engine, params, prefix + BankingPrompts.get_request_tail("warm up", "warm-0"))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i):
+        text = f"{CUSTOMER_TEXTS[i % len(CUSTOMER_TEXTS)]} (ref {i})"
+        async with semaphore:
+            return await one_request(engine, params, prefix + BankingPrompts.get_request_tail(text, f"bench-{i}"))
+
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(limited(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    ttfts = sorted(sample[0] * 1000 for sample in samples)
+    label = "prefix caching on " if prefix_caching else "prefix caching off"
+    print(
+        f"{label}  prompt tokens {statistics.mean(s[1] for s in samples):7.0f}"
+        f"  cached {statistics.mean(s[2] for s in samples):7.0f}"
+        f"  prefilled {statistics.mean(s[1] - s[2] for s in samples):6.0f}"
+        f"  TTFT p50 {statistics.median(ttfts):7.1f} ms  p95 {ttfts[int(len(ttfts) * 0.95) - 1]:7.1f} ms"
+        f"  {requests / elapsed:6.1f} req/s"
+    )
+
+    if hasattr(engine, "shutdown"):
+        engine.shutdown()
+    del engine
+    gc.collect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=["stub", "vllm"], default="stub")
+    parser.add_argument("--prefix-caching", choices=["on", "off", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"shared prefix: {len(BankingPrompts.get_few_shot_prefix())} characters")
+    modes = {"on": [True], "off": [False], "both": [False, True]}[args.prefix_caching]
+    for prefix_caching in modes:
+        asyncio.run(run_mode(args.engine, prefix_caching, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
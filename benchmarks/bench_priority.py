@@ -0,0 +1,101 @@
+"""
+Overload scenario for priority scheduling.
+
+Tickets arrive faster than a worker can process them. Each gets its priority from the API's
+`ticket_priority` and is scheduled by the worker's PriorityExecutor, with a fixed simulated
+inference time. The same arrival trace is replayed FIFO (every ticket priority 0) and with
+priorities, and end-to-end latency percentiles are reported per priority class.
+
+    python benchmarks/bench_priority.py --rate 200 --duration 5 --concurrency 8 --service-ms 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "workers"))
+from priority import ticket_priority, HIGHEST  # noqa: E402
+from priority_executor import PriorityExecutor  # noqa: E402
+
+FRAUD_TEXTS = [
+    "There is an unauthorized charge of $500 on my credit card.",
+    "My card was stolen and someone is using it right now.",
+    "I think my online banking was hacked.",
+]
+ROUTINE_TEXTS = [
+    "What is my savings account balance?",
+    "How do I order a new cheque book?",
+    "What are the branch opening hours on Saturday?",
+    "Can I change the date of my loan payment?",
+]
+
+
+def arrival_trace(rate: float, duration: float, fraud_ratio: float, seed: int):
+    '''poisson arrivals: (offset seconds, text)'''
+    rng = random.Random(seed)
+    trace, offset = [], 0.0
+    while offset < duration:
+        offset += rng.expovariate(rate)
+        texts = FRAUD_TEXTS if rng.random() < fraud_ratio else ROUTINE_TEXTS
+        trace.append((offset, rng.choice(texts)))
+    return trace
+
+
+def replay(trace, concurrency: int, service_s: float, use_priority: bool):
+    executor = PriorityExecutor(max_workers=concurrency, thread_name_prefix="bench")
+    latencies = {}
+    lock = threading.Lock()
+
+    def handle(arrived_at, priority):
+        time.sleep(service_s)
+        with lock:
+            latencies.setdefault(priority, []).append(time.perf_counter() - arrived_at)
+
+    started = time.perf_counter()
+    for offset, text in trace:
+        delay = started + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        priority = ticket_priority(text)
+        executor.submit(priority if use_priority else 0, handle, time.perf_counter(), priority)
+    executor.shutdown(wait=True)
+    return latencies
+
+
+def report(label, latencies):
+    print(label)
+    for priority in sorted(latencies, reverse=True):
+        samples = sorted(latencies[priority])
+        name = "fraud/critical" if priority == HIGHEST else f"priority {priority}"
+        print(
+            f"  {name:<16} n={len(samples):<5} p50 {statistics.median(samples) * 1000:8.0f} ms"
+            f"  p95 {samples[int(len(samples) * 0.95) - 1] * 1000:8.0f} ms"
+            f"  p99 {samples[max(0, int(len(samples) * 0.99) - 1)] * 1000:8.0f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=200, help="arrivals per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of arrivals")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--service-ms", type=float, default=50, help="simulated inference time per ticket")
+    parser.add_argument("--fraud-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    capacity = args.concurrency / (args.service_ms / 1000)
+    print(f"offered load {args.rate:.0f}/s vs capacity {capacity:.0f}/s ({args.rate / capacity:.0%})")
+
+    trace = arrival_trace(args.rate, args.duration, args.fraud_ratio, args.seed)
+    report("FIFO", replay(trace, args.concurrency, args.service_ms / 1000, use_priority=False))
+    report("priority", replay(trace, args.concurrency, args.service_ms / 1000, use_priority=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+What token budgeting buys: a decode budget (max_tokens) sized from the completion lengths seen per
+kind of ticket instead of a flat AI_MAX_TOKENS, and customer text cut to fit the context.
+
+Runs tickets through the AI server's generate_ticket against the stub engine, once with the flat
+budget and no input limit (as before) and once with the server's TokenBudget. Part of the tickets
+are very long messages, which do not fit the context without the input limit.
+
+Reports failures, the max_tokens given out and what a sequence may grow to in the KV cache:
+its uncached prompt (the few-shot prefix is shared through the prefix cache) plus max_tokens. The
+ratio of that footprint between the runs is how many more sequences the same KV cache can hold
+when it is sized for the budgets the scheduler is asked to honour. vLLM allocates KV blocks as
+tokens are generated, so on a GPU the gain shows up as fewer preemptions of long-running
+generations and a tighter bound on runaway ones rather than as an admission limit.
+
+    python benchmarks/bench_token_budget.py --tickets 1000 --long-ratio 0.02
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import statistics
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "service", "ai_services"))
+from ticket_generator import TicketGenerator  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=1000)
+    parser.add_argument("--long-ratio", type=float, default=0.02, help="share of tickets that are very long messages")
+    parser.add_argument("--long-chars", type=int, default=24000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-model-len", type=int, default=4096)
+    parser.add_argument("--max-tokens", type=int, default=1024, help="the flat decode budget (AI_MAX_TOKENS)")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+def tickets(args) -> list:
+    generator = TicketGenerator(args.seed, duplicate_ratio=0.0)
+    result = []
+    for i, ticket in enumerate(generator.tickets(args.tickets)):
+        if args.long_ratio and i % round(1 / args.long_ratio) == 0:
+            # a pasted statement or email thread in front of the actual complaint
+            filler = "Transaction history: card payment, 42.10 EUR, grocery store. "
+            ticket["userInput"] = (filler * (args.long_chars // len(filler))) + ticket["userInput"]
+        result.append(ticket)
+    return result
+
+
+async def run_mode(ai_server, budgeted: bool, batch: list, concurrency: int) -> dict:
+    ai_server.engine = ai_server.build_engine()
+    ai_server.token_budget = None
+    if budgeted:
+        await ai_server.load_token_budget()
+
+    footprints, budgets, outcomes = [], [], []
+    generate = ai_server.engine.generate
+
+    async def recording_generate(prompt, sampling_params, request_id, **kwargs):
+        async for output in generate(prompt, sampling_params, request_id, **kwargs):
+            if len(output.outputs[0].token_ids) == 1:
+                uncached = len(output.prompt_token_ids) - output.num_cached_tokens
+                footprints.append(uncached + sampling_params.max_tokens)
+                budgets.append(sampling_params.max_tokens)
+            yield output
+    ai_server.engine.generate = recording_generate
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(ticket):
+        async with slots:
+            _, status_code = await ai_server.generate_ticket(ticket)
+            outcomes.append(status_code)
+
+    # the prefix is in the cache from warm-up on a running server
+    await ai_server.engine.generate(ai_server.FEW_SHOT_PREFIX, ai_server.SamplingParams(max_tokens=1), "prefix").__anext__()
+    await asyncio.gather(*(one(ticket) for ticket in batch))
+    steady = sorted(footprints[len(footprints) // 2:])
+    return {
+        "failed": sum(1 for status_code in outcomes if status_code >= 500),
+        "max_tokens_mean": statistics.fmean(budgets[len(budgets) // 2:]),
+        "footprint_mean": statistics.fmean(steady),
+        "footprint_p95": steady[int(len(steady) * 0.95)],
+        "caps": ai_server.token_budget.describe() if budgeted else None,
+    }
+
+
+async def main():
+    args = parse_args()
+    os.environ.update({
+        "AI_ENGINE": "stub",
+        "AI_ENABLE_PREFIX_CACHING": "true",
+        "AI_MAX_NUM_SEQS": str(args.concurrency),
+        "AI_MAX_QUEUED_REQUESTS": "-1",
+        "AI_MAX_MODEL_LEN": str(args.max_model_len),
+        "AI_MAX_TOKENS": str(args.max_tokens),
+        "TRACING_EXPORTER": "none",
+    })
+    logging.disable(logging.WARNING)
+    with contextlib.redirect_stderr(None):
+        import ai_server
+
+    batch = tickets(args)
+    flat = await run_mode(ai_server, False, batch, args.concurrency)
+    budgeted = await run_mode(ai_server, True, batch, args.concurrency)
+
+    print(f"tickets                   {len(batch)} ({sum(len(t['userInput']) > args.long_chars for t in batch)} long)")
+    print(f"prompt prefix             {budgeted['caps']['prefix_tokens']} tokens, customer text budget {budgeted['caps']['input_budget']}")
+    for label, result in (("flat max_tokens", flat), ("token budget", budgeted)):
+        print(f"{label:<26}failed {result['failed']:>4}   max_tokens mean {result['max_tokens_mean']:7.1f}   "
+              f"KV tokens per sequence mean {result['footprint_mean']:7.1f}, p95 {result['footprint_p95']}")
+    print(f"learned output overhead   " + ", ".join(f"{kind} {tokens}" for kind, tokens in budgeted["caps"]["output_overhead"].items()))
+    print(f"sequences per KV cache    x{flat['footprint_mean'] / budgeted['footprint_mean']:.2f} (mean), "
+          f"x{flat['footprint_p95'] / budgeted['footprint_p95']:.2f} (p95)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+"""
+Per-ticket cost of the worker's side of the worker -> AI server hop: sending the ticket, parsing
+the answer, and serializing the processed ticket for the reason queue.
+
+Compares the original path (module-level requests.post, i.e. a new TCP connection per ticket, the
+stdlib json module, and the pretty-printed copy of every ticket) with the worker's AiClient and
+publish code as they are now (WORKER_DEBUG off). The AI server is the stub engine with no latency,
+running in its own process, so the CPU time measured here is the worker's alone. The JSON work of
+a ticket is also timed on its own, since the HTTP client accounts for most of the rest.
+
+    python benchmarks/bench_worker_hop.py --tickets 2000
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import types
+
+import orjson
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "workers"))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "service", "ai_services"))
+from prompts.prompt import BankingPrompts  # noqa: E402
+
+INPUTS = [example["input"] for example in BankingPrompts.EXAMPLES]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_server(port: int) -> subprocess.Popen:
+    env = dict(os.environ, AI_ENGINE="stub", AI_SERVER_PORT=str(port), AI_PRECLASSIFIER="off", TRACING_EXPORTER="none")
+    process = subprocess.Popen(
+        [sys.executable, "ai_server.py"], cwd=os.path.join(BENCH_DIR, "..", "service", "ai_services"),
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                return process
+        except requests.exceptions.RequestException:
+            pass
+        if time.monotonic() > deadline:
+            process.terminate()
+            raise SystemExit("stub AI server did not come up")
+        time.sleep(0.2)
+
+
+def payload(i: int) -> dict:
+    return {"userInput": INPUTS[i % len(INPUTS)], "customerName": None, "customerid": None, "id": f"hop-{i}", "priority": 0}
+
+
+def original_path(url: str):
+    '''what _get_ai_ticket, process_user_request and _publish_processed_ticket used to do per ticket'''
+    def ticket(i: int):
+        response = requests.post(url, headers={"Content-Type": "application/json"}, json=payload(i), timeout=30)
+        response.raise_for_status()
+        processed_ticket = response.json()
+        print(json.dumps(processed_ticket, indent=2))
+        return json.dumps(processed_ticket).encode('utf-8')
+    return ticket
+
+
+def current_path(url: str):
+    '''the worker's AiClient and publish code, with a channel that drops what it is given'''
+    os.environ.update({"VLLM_API_URL": url, "WORKER_METRICS_PORT": "0", "WORKER_DEBUG": "false", "TRACING_EXPORTER": "none"})
+    import ticket_worker
+
+    with contextlib.redirect_stdout(None):
+        worker = ticket_worker.TicketWorker()
+    published = []
+    worker.rabbit_channel = types.SimpleNamespace(basic_publish=lambda **kwargs: published.append(kwargs["body"]))
+
+    def ticket(i: int):
+        processed_ticket = worker._get_ai_ticket(**payload(i))
+        worker._publish_processed_ticket(processed_ticket)
+        return published.pop()
+    return ticket
+
+
+def json_passes(response_body: bytes, count: int):
+    '''just the JSON work of one ticket: request body, response, pretty copy (original only), publish body'''
+    request = payload(0)
+    timings = {}
+    for label, dumps, loads, pretty in (
+        ("original", lambda v: json.dumps(v).encode(), json.loads, lambda v: json.dumps(v, indent=2)),
+        ("current", orjson.dumps, orjson.loads, None),
+    ):
+        started = time.process_time()
+        for _ in range(count):
+            dumps(request)
+            processed_ticket = loads(response_body)
+            if pretty is not None:
+                pretty(processed_ticket)
+            dumps(processed_ticket)
+        timings[label] = (time.process_time() - started) / count
+        print(f"{label:<12} json cpu/ticket {timings[label] * 1e6:6.1f} us")
+    return timings
+
+
+def run(label: str, ticket, count: int):
+    wall, cpu = [], []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        ticket(0)  # warm up (imports, first connection)
+        for i in range(count):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            ticket(i)
+            cpu.append(time.process_time() - cpu_start)
+            wall.append(time.perf_counter() - wall_start)
+    print(f"{label:<12} cpu/ticket {statistics.fmean(cpu) * 1e6:8.0f} us   "
+          f"wall p50 {statistics.median(wall) * 1000:6.2f} ms   wall mean {statistics.fmean(wall) * 1000:6.2f} ms")
+    return statistics.fmean(cpu)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=2000)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_stub_server(port)
+    url = f"http://127.0.0.1:{port}/generate"
+    try:
+        before = run("original", original_path(url), args.tickets)
+        after = run("current", current_path(url), args.tickets)
+        print(f"worker cpu per ticket {(after - before) / before:+.1%}")
+        response_body = requests.post(url, json=payload(0), timeout=30).content
+        json_passes(response_body, args.tickets * 10)
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Evaluates the keyword pre-classifier on a labeled sample set.
+
+Reports precision/recall of the "non-banking" rejection (the decision that skips the GPU),
+how many generations it would save, accuracy of the department prior when it fires, and the
+per-ticket classification time.
+
+    python benchmarks/eval_preclassifier.py [--samples benchmarks/data/preclassifier_samples.jsonl]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "service", "ai_services"))
+from preclassifier import KeywordPreClassifier  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", default=os.path.join(BENCH_DIR, "data", "preclassifier_samples.jsonl"))
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.samples) as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+
+    classifier = KeywordPreClassifier.from_banking_prompts()
+
+    started = time.perf_counter()
+    results = [classifier.classify(sample["text"]) for sample in samples]
+    per_ticket_us = (time.perf_counter() - started) / len(samples) * 1e6
+
+    true_reject = sum(1 for s, r in zip(samples, results) if not r.is_banking and not s["is_banking"])
+    false_reject = sum(1 for s, r in zip(samples, results) if not r.is_banking and s["is_banking"])
+    missed_reject = sum(1 for s, r in zip(samples, results) if r.is_banking and not s["is_banking"])
+    rejected = true_reject + false_reject
+    off_domain = true_reject + missed_reject
+
+    priors = [(s, r) for s, r in zip(samples, results) if r.department is not None]
+    correct_priors = sum(1 for s, r in priors if s.get("department") == r.department)
+    banking = sum(1 for s in samples if s["is_banking"])
+
+    print(f"samples               {len(samples)} ({banking} banking, {off_domain} off-domain)")
+    print(f"reject precision      {true_reject / rejected if rejected else 0:.2f}  ({true_reject}/{rejected})")
+    print(f"reject recall         {true_reject / off_domain if off_domain else 0:.2f}  ({true_reject}/{off_domain})")
+    print(f"GPU calls saved       {rejected}/{len(samples)} ({rejected / len(samples):.0%})")
+    print(f"department prior      fires on {len(priors)}/{banking} banking tickets, correct {correct_priors}/{len(priors)}")
+    print(f"classification time   {per_ticket_us:.1f} us/ticket")
+
+    if args.show_errors:
+        for sample, result in zip(samples, results):
+            wrong_reject = (not result.is_banking) == sample["is_banking"]
+            wrong_prior = result.department is not None and result.department != sample.get("department")
+            if wrong_reject or wrong_prior:
+                print(f"  {sample['text']!r}: predicted banking={result.is_banking} dept={result.department} matched={result.matched}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+In-process stand-ins for Redis and RabbitMQ, so the worker can be benchmarked on a plain CPU
+machine without containers.
+
+They implement the subset of redis-py and pika's BlockingConnection that the worker uses, with
+the same threading rules the worker relies on: redis calls from any thread, pika calls only on
+the connection thread except `add_callback_threadsafe`. Each Redis round trip (a pipeline counts
+as one) can be given a fixed latency to model a network hop.
+"""
+import heapq
+import itertools
+import threading
+import time
+import types
+from typing import Optional
+
+
+class InMemoryRedis:
+
+    def __init__(self, latency_ms: float = 0.0, decode_responses: bool = False):
+        self.latency = latency_ms / 1000
+        self.decode_responses = decode_responses
+        self.round_trips = 0
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    # --- redis-py surface: every call is one round trip ---
+    def ping(self):
+        return self._round_trip([("ping", (), {})])[0]
+
+    def pipeline(self, transaction: bool = True):
+        return _Pipeline(self)
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        if not hasattr(type(self), "_op_" + name):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._round_trip([(name, args, kwargs)])[0]
+
+    def _round_trip(self, commands):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.round_trips += 1
+            return [getattr(self, "_op_" + name)(*args, **kwargs) for name, args, kwargs in commands]
+
+    # --- commands, run with the lock held ---
+    def _op_ping(self):
+        return True
+
+    def _op_get(self, key):
+        return self._out(self._lookup(key))
+
+    def _op_mget(self, keys):
+        return [self._out(self._lookup(key)) for key in keys]
+
+    def _op_set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._lookup(key) is not None:
+            return None
+        self._data[key] = self._in(value)
+        self._expires.pop(key, None)
+        ttl = px / 1000 if px is not None else ex
+        if ttl is not None:
+            self._expires[key] = time.monotonic() + ttl
+        return True
+
+    def _op_exists(self, *keys):
+        return sum(1 for key in keys if self._lookup(key) is not None)
+
+    def _op_delete(self, *keys):
+        return sum(1 for key in keys if self._remove(key))
+
+    def _op_expire(self, key, seconds):
+        if self._lookup(key) is None:
+            return False
+        self._expires[key] = time.monotonic() + seconds
+        return True
+
+    def _op_pexpire(self, key, milliseconds):
+        return self._op_expire(key, milliseconds / 1000)
+
+    def _op_eval(self, script, numkeys, *args):
+        '''runs the worker's lua scripts, recognised by their text, as the commands they are made of'''
+        from result_publisher import ResultOutbox
+        import redis_lock
+        keys, argv = args[:numkeys], [self._in(arg) for arg in args[numkeys:]]
+        if script == ResultOutbox.TRIM_IF_HOLDER:
+            if self._lookup(keys[1]) != argv[0]:
+                return 0
+            self._op_ltrim(keys[0], int(argv[1]), -1)
+            self._op_pexpire(keys[1], int(argv[2]))
+            return 1
+        if script == redis_lock.RELEASE_IF_HOLDER:
+            return self._op_delete(keys[0]) if self._lookup(keys[0]) == argv[0] else 0
+        if script == redis_lock.RENEW_IF_HOLDER:
+            return self._op_pexpire(keys[0], int(argv[1])) if self._lookup(keys[0]) == argv[0] else 0
+        raise NotImplementedError("no stand-in for this lua script")
+
+    def _op_sadd(self, key, *members):
+        current = self._lookup(key)
+        if current is None:
+            current = self._data[key] = set()
+        before = len(current)
+        current.update(self._in(member) for member in members)
+        return len(current) - before
+
+    def _op_smembers(self, key):
+        return {self._out(member) for member in (self._lookup(key) or ())}
+
+    def _op_rpush(self, key, *values):
+        current = self._lookup(key)
+        if current is None:
+            current = self._data[key] = []
+        current.extend(self._in(value) for value in values)
+        return len(current)
+
+    def _op_lrange(self, key, start, end):
+        current = self._lookup(key) or []
+        return [self._out(value) for value in current[start:None if end == -1 else end + 1]]
+
+    def _op_ltrim(self, key, start, end):
+        current = self._lookup(key)
+        if current is not None:
+            current[:] = current[start:None if end == -1 else end + 1]
+        return True
+
+    def _op_llen(self, key):
+        return len(self._lookup(key) or [])
+
+    def _lookup(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._remove(key)
+        return self._data.get(key)
+
+    def _remove(self, key) -> bool:
+        self._expires.pop(key, None)
+        return self._data.pop(key, None) is not None
+
+    @staticmethod
+    def _in(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    def _out(self, value):
+        if value is None or not self.decode_responses or not isinstance(value, bytes):
+            return value
+        return value.decode()
+
+
+class _Pipeline:
+
+    def __init__(self, redis: InMemoryRedis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        if not hasattr(InMemoryRedis, "_op_" + name):
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self, raise_on_error: bool = True):
+        commands, self._commands = self._commands, []
+        return self._redis._round_trip(commands)
+
+
+class InMemoryBroker:
+
+    '''direct exchanges, durable-looking queues and x-max-priority, all in one process.
+    `connect` is a drop-in for pika.BlockingConnection. a tx_commit takes `commit_latency_ms`, the round
+    trip and the disk write of a real broker'''
+
+    def __init__(self, commit_latency_ms: float = 0.0):
+        self.commit_latency = commit_latency_ms / 1000
+        self._queues = {}
+        self._bindings = {}
+        self._sequence = itertools.count()
+        self._changed = threading.Condition()
+
+    def connect(self, parameters=None) -> "InMemoryConnection":
+        return InMemoryConnection(self)
+
+    def declare_queue(self, name: str, arguments: Optional[dict] = None):
+        arguments = arguments or {}
+        with self._changed:
+            if name not in self._queues:
+                self._queues[name] = {
+                    "max_priority": arguments.get("x-max-priority", 0),
+                    "messages": [],
+                    # a TTL queue with a dead-letter exchange (the worker's retry queue)
+                    "ttl_ms": arguments.get("x-message-ttl"),
+                    "dead_letter": (arguments.get("x-dead-letter-exchange"), arguments.get("x-dead-letter-routing-key")),
+                }
+
+    def bind(self, exchange: str, queue: str, routing_key: str):
+        with self._changed:
+            self._bindings.setdefault((exchange, routing_key), set()).add(queue)
+
+    def publish(self, exchange: str, routing_key: str, body: bytes, properties=None):
+        properties = properties or types.SimpleNamespace(priority=None, headers=None)
+        with self._changed:
+            for name in self._bindings.get((exchange, routing_key), ()):
+                queue = self._queues[name]
+                if queue["ttl_ms"] is not None and queue["dead_letter"][0] is not None:
+                    # nobody consumes these queues: the message just moves on once it expires
+                    timer = threading.Timer(queue["ttl_ms"] / 1000, self.publish, (*queue["dead_letter"], body, properties))
+                    timer.daemon = True
+                    timer.start()
+                    continue
+                priority = min(properties.priority or 0, queue["max_priority"])
+                heapq.heappush(queue["messages"], (-priority, next(self._sequence), body, properties))
+            self._changed.notify_all()
+
+    def get(self, queue: str, timeout: Optional[float] = None):
+        '''takes the next message off a queue, (body, properties) or None after `timeout`'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while True:
+                message = self._pop(queue)
+                if message is not None:
+                    return message
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+    def requeue(self, queue: str, body: bytes, properties):
+        with self._changed:
+            priority = min(properties.priority or 0, self._queues[queue]["max_priority"])
+            heapq.heappush(self._queues[queue]["messages"], (-priority, next(self._sequence), body, properties))
+            self._changed.notify_all()
+
+    def depth(self, queue: str) -> int:
+        with self._changed:
+            return len(self._queues[queue]["messages"])
+
+    def _pop(self, queue: str):
+        messages = self._queues[queue]["messages"]
+        if not messages:
+            return None
+        _, _, body, properties = heapq.heappop(messages)
+        return body, properties
+
+
+class InMemoryConnection:
+
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        self.is_open = True
+        self._callbacks = []
+        self._timers = []  # (deadline, sequence, callback)
+        self._timer_sequence = itertools.count()
+
+    def channel(self) -> "InMemoryChannel":
+        return InMemoryChannel(self)
+
+    def add_callback_threadsafe(self, callback):
+        with self.broker._changed:
+            self._callbacks.append(callback)
+            self.broker._changed.notify_all()
+
+    def call_later(self, delay: float, callback):
+        timer = (time.monotonic() + delay, next(self._timer_sequence), callback)
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def remove_timeout(self, timer):
+        if timer in self._timers:
+            self._timers.remove(timer)
+            heapq.heapify(self._timers)
+
+    def next_timer_in(self) -> Optional[float]:
+        return max(0.0, self._timers[0][0] - time.monotonic()) if self._timers else None
+
+    def process_data_events(self, time_limit: float = 0):
+        with self.broker._changed:
+            if not self._callbacks and time_limit:
+                # like pika: waits up to time_limit for something to do
+                timer = self.next_timer_in()
+                self.broker._changed.wait(time_limit if timer is None else min(time_limit, timer))
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+        while self._timers and self._timers[0][0] <= time.monotonic():
+            heapq.heappop(self._timers)[2]()
+
+    def close(self):
+        self.is_open = False
+
+
+class InMemoryChannel:
+
+    def __init__(self, connection: InMemoryConnection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.prefetch_count = 0
+        self._consumers = []
+        self._unacked = {}
+        self._delivery_tags = itertools.count(1)
+        self._consuming = False
+        self._transaction = None  # messages published since the last tx_commit, in tx mode
+        self.is_open = True
+
+    def basic_qos(self, prefetch_count: int = 0):
+        self.prefetch_count = prefetch_count
+
+    def exchange_declare(self, exchange: str, exchange_type: str = "direct", durable: bool = False):
+        pass
+
+    def queue_declare(self, queue: str, durable: bool = False, arguments: Optional[dict] = None):
+        self.broker.declare_queue(queue, arguments)
+
+    def queue_bind(self, exchange: str, queue: str, routing_key: str):
+        self.broker.bind(exchange, queue, routing_key)
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes, properties=None, mandatory: bool = False):
+        if self._transaction is not None:
+            self._transaction.append((exchange, routing_key, body, properties))
+            return
+        self.broker.publish(exchange, routing_key, body, properties)
+
+    def tx_select(self):
+        self._transaction = []
+
+    def tx_commit(self):
+        if self.broker.commit_latency:
+            time.sleep(self.broker.commit_latency)
+        messages, self._transaction = self._transaction, []
+        for message in messages:
+            self.broker.publish(*message)
+
+    def basic_consume(self, queue: str, on_message_callback):
+        self._consumers.append((queue, on_message_callback))
+
+    def basic_ack(self, delivery_tag: int):
+        self._unacked.pop(delivery_tag, None)
+
+    def basic_nack(self, delivery_tag: int, requeue: bool = True):
+        queue, body, properties = self._unacked.pop(delivery_tag)
+        if requeue:
+            self.broker.requeue(queue, body, properties)
+
+    def start_consuming(self):
+        '''delivers messages up to the prefetch limit and runs threadsafe callbacks until stop_consuming'''
+        self._consuming = True
+        changed = self.broker._changed
+        while self._consuming:
+            self.connection.process_data_events()
+            delivered = False
+            for queue, callback in self._consumers:
+                if self.prefetch_count and len(self._unacked) >= self.prefetch_count:
+                    break
+                with changed:
+                    message = self.broker._pop(queue)
+                if message is None:
+                    continue
+                body, properties = message
+                delivery_tag = next(self._delivery_tags)
+                self._unacked[delivery_tag] = (queue, body, properties)
+                callback(self, types.SimpleNamespace(delivery_tag=delivery_tag), properties, body)
+                delivered = True
+            if not delivered:
+                timer = self.connection.next_timer_in()
+                with changed:
+                    if not self.connection._callbacks and self._consuming:
+                        changed.wait(0.05 if timer is None else min(0.05, timer))
+
+    def stop_consuming(self):
+        self._consuming = False
+        with self.broker._changed:
+            self.broker._changed.notify_all()
+
+    def close(self):
+        self.is_open = False
+        self.connection.close()
@@ -0,0 +1,115 @@
+"""
+Synthetic, reproducible ticket traffic built from BankingPrompts: the example inputs plus
+sentences made from the department routing keywords, a share of off-domain questions, exact
+repeats and near-duplicates (same text with different case, punctuation or spacing), and an
+arrival schedule.
+"""
+import math
+import os
+import random
+import sys
+from typing import Iterator, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "service", "ai_services"))
+from prompts.prompt import BankingPrompts  # noqa: E402
+
+TEMPLATES = [
+    "I have a problem with my {keyword}, can you help?",
+    "Something is wrong with the {keyword} on my account.",
+    "Why was my {keyword} request rejected yesterday?",
+    "I need information about {keyword} please.",
+    "My {keyword} is not working since this morning.",
+    "Can someone explain the fees for {keyword}?",
+]
+TAILS = ["", " Please call me.", " Please email me.", " It is urgent.", " Thanks."]
+OFF_DOMAIN = [
+    "What's the weather like today?",
+    "Recommend me a good pizza place nearby.",
+    "Who won the football match last night?",
+    "Write me a poem about the sea.",
+    "How do I fix my car's air conditioning?",
+]
+NAMES = ["Lina Haddad", "Omar Saleh", "Maya Nasser", "Karim Aziz", None]
+
+ARRIVAL_PROCESSES = ("poisson", "constant", "burst")
+
+
+class TicketGenerator:
+
+    '''yields worker-format ticket dicts (userInput, customerName, customerid, id).
+    duplicate_ratio: share of tickets repeating an earlier text exactly;
+    near_duplicate_ratio: share repeating an earlier text with cosmetic changes'''
+
+    def __init__(self, seed: int = 7, duplicate_ratio: float = 0.3, near_duplicate_ratio: float = 0.0,
+                 off_domain_ratio: float = 0.05):
+        self.rng = random.Random(seed)
+        self.duplicate_ratio = duplicate_ratio
+        self.near_duplicate_ratio = near_duplicate_ratio
+        self.off_domain_ratio = off_domain_ratio
+        self.keywords = sorted({k for keywords in BankingPrompts.get_department_routing().values() for k in keywords})
+        self.examples = [e["input"] for e in BankingPrompts.EXAMPLES if not e["output"].lstrip("{ \n").startswith('"error"')]
+        self.seen: List[str] = []
+        self.count = 0
+
+    def fresh_text(self) -> str:
+        if self.rng.random() < self.off_domain_ratio:
+            return self.rng.choice(OFF_DOMAIN)
+        if self.rng.random() < 0.2:
+            return self.rng.choice(self.examples)
+        template = self.rng.choice(TEMPLATES)
+        return template.format(keyword=self.rng.choice(self.keywords)) + self.rng.choice(TAILS)
+
+    def near_duplicate(self, text: str) -> str:
+        variants = [text.upper(), text.lower(), "  " + text.replace(" ", "  "), text.rstrip(".?!") + "!!", text + " "]
+        return self.rng.choice(variants)
+
+    def next_text(self) -> str:
+        roll = self.rng.random()
+        if self.seen and roll < self.duplicate_ratio:
+            return self.rng.choice(self.seen)
+        if self.seen and roll < self.duplicate_ratio + self.near_duplicate_ratio:
+            return self.near_duplicate(self.rng.choice(self.seen))
+        text = self.fresh_text()
+        self.seen.append(text)
+        return text
+
+    def next_ticket(self) -> dict:
+        self.count += 1
+        name = self.rng.choice(NAMES)
+        return {
+            "userInput": self.next_text(),
+            "customerName": name,
+            "customerid": f"C{self.rng.randrange(10**6):06d}" if name else None,
+            "id": f"bench-{self.count:07d}",
+        }
+
+    def tickets(self, count: int) -> Iterator[dict]:
+        for _ in range(count):
+            yield self.next_ticket()
+
+
+def arrival_offsets(process: str, rate: float, count: int, seed: int = 7,
+                    burst_factor: float = 1.8, burst_period: float = 2.0) -> List[float]:
+    '''send times in seconds from the start, averaging `rate` per second.
+    poisson: exponential gaps; constant: evenly spaced; burst: poisson at rate * burst_factor for
+    the first half of every `burst_period` and rate * (2 - burst_factor) for the second half'''
+    if process not in ARRIVAL_PROCESSES:
+        raise ValueError(f"unknown arrival process {process!r}, expected one of {ARRIVAL_PROCESSES}")
+    if not 1 <= burst_factor < 2:
+        raise ValueError("burst_factor must be in [1, 2) to keep the mean rate")
+    rng = random.Random(seed)
+    offsets, now = [], 0.0
+    high = rate * burst_factor
+    low = rate * (2 - burst_factor)
+    for _ in range(count):
+        if process == "constant":
+            now += 1 / rate
+        elif process == "poisson":
+            now += rng.expovariate(rate)
+        else:
+            in_burst = math.fmod(now, burst_period) < burst_period / 2
+            now += rng.expovariate(high if in_burst else low)
+        offsets.append(now)
+    return offsets
+
@@ -1,11 +1,25 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, status, Request
-from pydantic import BaseModel,Field
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from opentelemetry.trace import SpanKind
+from pydantic import BaseModel,Field,ValidationError
 import pika
 import os
+import json
+import time
 from typing import Optional
 from dotenv import load_dotenv
 
+from publisher import RabbitPublisher, PublishError
+from async_publisher import AsyncRabbitPublisher, BufferFullError
+from priority import ticket_priority, HIGHEST
+import api_metrics as metrics
+from api_tracing import tracer, setup_tracing, context_from_headers, inject_headers
+
 load_dotenv()
+setup_tracing("ticket-api")
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
 RABBITMQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
 RABBITMQ_USER = os.getenv("RABBITMQ_USER", "user")
@@ -16,66 +30,310 @@ EXCHANGE_NAME = os.getenv("RABBITMQ_EXCHANGE")
 INCOMING_QUEUE = os.getenv("RABBITMQ_INCOMING_QUEUE")
 INCOMING_ROUTING_KEY = os.getenv("RABBITMQ_INCOMING_ROUTING_KEY")
 
+PUBLISHER_POOL_SIZE = int(os.getenv("RABBITMQ_PUBLISHER_POOL_SIZE", 8))
+PUBLISHER_MAX_RETRIES = int(os.getenv("RABBITMQ_PUBLISHER_MAX_RETRIES", 3))
+
+# "sync" publishes from FastAPI's threadpool, "async" uses aio-pika and a bounded send buffer.
+INGEST_MODE = os.getenv("INGEST_MODE", "sync").lower()
+INGEST_BUFFER_SIZE = int(os.getenv("INGEST_BUFFER_SIZE", 10000))
+INGEST_MAX_INFLIGHT = int(os.getenv("INGEST_MAX_INFLIGHT", 64))
+INGEST_RETRY_AFTER_SECONDS = int(os.getenv("INGEST_RETRY_AFTER_SECONDS", 1))
+MAX_BATCH_SIZE = int(os.getenv("INGEST_MAX_BATCH_SIZE", 1000))
+
+# x-max-priority of the incoming queue, 0 keeps a plain FIFO queue. Must match the worker's setting,
+# and an existing queue has to be re-created to change it.
+MAX_PRIORITY = int(os.getenv("RABBITMQ_MAX_PRIORITY", 0))
+QUEUE_ARGUMENTS = {"x-max-priority": MAX_PRIORITY} if MAX_PRIORITY > 0 else None
+
+
+# --- Publisher (one pool for the whole app) ---
+credentials = pika.PlainCredentials(RABBITMQ_USER,RABBITMQ_PASS)
+parameters = pika.ConnectionParameters(
+    host=RABBITMQ_HOST,
+    port=RABBITMQ_PORT,
+    #virtual_host=RABBITMQ_VHOST,    ---> if arena specifies one add. 
+    credentials=credentials
+    )
+publisher = RabbitPublisher(
+    parameters,
+    exchange=EXCHANGE_NAME,
+    queue_name=INCOMING_QUEUE,
+    routing_key=INCOMING_ROUTING_KEY,
+    pool_size=PUBLISHER_POOL_SIZE,
+    max_retries=PUBLISHER_MAX_RETRIES,
+    queue_arguments=QUEUE_ARGUMENTS,
+)
+async_publisher = AsyncRabbitPublisher(
+    host=RABBITMQ_HOST,
+    port=RABBITMQ_PORT,
+    login=RABBITMQ_USER,
+    password=RABBITMQ_PASS,
+    exchange=EXCHANGE_NAME,
+    queue_name=INCOMING_QUEUE,
+    routing_key=INCOMING_ROUTING_KEY,
+    buffer_size=INGEST_BUFFER_SIZE,
+    senders=INGEST_MAX_INFLIGHT,
+    max_retries=PUBLISHER_MAX_RETRIES,
+    queue_arguments=QUEUE_ARGUMENTS,
+)
+metrics.ASYNC_BUFFERED.set_function(lambda: async_publisher.buffered)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect and declare the exchange/queue once, instead of on every request.
+    if INGEST_MODE == "async":
+        await async_publisher.start()
+        yield
+        await async_publisher.close()
+    else:
+        publisher.start()
+        yield
+        publisher.close()
+
 
 # --- Initialization ---
 app = FastAPI(
     title="AI Ticket System API",
     description="An API to submit user requests for AI processing.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """Latency histogram per route, and a server span that continues the caller's trace if it sent one."""
+    started = time.perf_counter()
+    with tracer.start_as_current_span(
+        f"{request.method} {request.url.path}",
+        context=context_from_headers(request.headers),
+        kind=SpanKind.SERVER,
+    ) as span:
+        response = await call_next(request)
+        span.set_attribute("http.response.status_code", response.status_code)
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_LATENCY.labels(
+        route.path if route else "unmatched", request.method, response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 # --- Pydantic Model 
 class UserRequest(BaseModel):
     userInput: str
     customerName: Optional[str] = Field(None, description="The customer's name, if available.")
     customerId: Optional[str] = Field(None, description="The customer's ID, if available.")
     Id: str = Field(..., description="The unique identifier for this ticket from the source system.")
+    customerTier: Optional[str] = Field(None, description="The customer's tier (e.g. 'premium'), if available.")
+
+
+def _priority_for(user_request: UserRequest) -> int:
+    """Message priority from cheap signals: fraud wording, urgency, customer tier."""
+    return ticket_priority(user_request.userInput, user_request.customerTier, MAX_PRIORITY or HIGHEST)
 
-# --- API Endpoint (with self-contained connection logic) ---
-@app.post("/api/v1/ticket", status_code=status.HTTP_202_ACCEPTED)
+def _publish_span(ticket_id: Optional[str] = None, batch_size: Optional[int] = None):
+    """Producer span around a publish; the message headers carry its context to the worker."""
+    attributes = {"messaging.destination.name": INCOMING_ROUTING_KEY or ""}
+    if ticket_id is not None:
+        attributes["ticket.id"] = ticket_id
+    if batch_size is not None:
+        attributes["messaging.batch.message_count"] = batch_size
+    return tracer.start_as_current_span("publish ticket", kind=SpanKind.PRODUCER, attributes=attributes)
+
+
+# --- API Endpoints ---
 def create_ticket(user_request: UserRequest):
     """
-    Accepts user input, establishes a connection to RabbitMQ,
-    and publishes the message for processing.
+    Accepts user input and publishes it for processing over the shared,
+    pooled RabbitMQ publisher. Returns once the broker has confirmed the message.
     """
-    connection = None
+    message_body = user_request.model_dump_json()
+
+    started = time.perf_counter()
     try:
-        # Establish a new connection for this specific request.
-        credentials = pika.PlainCredentials(RABBITMQ_USER,RABBITMQ_PASS)
-        parameters = pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            #virtual_host=RABBITMQ_VHOST,    ---> if arena specifies one add. 
-            credentials=credentials
+        with _publish_span(user_request.Id):
+            properties = pika.BasicProperties(
+                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE,
+                priority=_priority_for(user_request),
+                headers=inject_headers(),
             )
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-
-        channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type='direct', durable=True)
-        #  Ensure the queue exists.
-        channel.queue_declare(queue=INCOMING_QUEUE, durable=True)
-        
-        channel.queue_bind(
-            exchange=EXCHANGE_NAME, 
-            queue=INCOMING_QUEUE, 
-            routing_key=INCOMING_ROUTING_KEY
+            publisher.publish(message_body.encode('utf-8'), properties=properties)
+    except PublishError as e:
+        metrics.PUBLISHED.labels("sync", "failed").inc()
+        return JSONResponse(
+            {"status": "error", "message": f"Failed to queue request: {e}"},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
+    finally:
+        metrics.PUBLISH_LATENCY.labels("sync", "single").observe(time.perf_counter() - started)
+
+    metrics.PUBLISHED.labels("sync", "accepted").inc()
+    return {"status": "accepted", "message": "Your request has been queued for processing."}
+
 
-        message_body = user_request.model_dump_json()
+async def create_ticket_async(user_request: UserRequest):
+    """
+    Async ingest mode: buffers the message for the aio-pika publisher and waits for
+    its confirm without holding a threadpool thread. Answers 503 with Retry-After
+    when the send buffer is full.
+    """
+    message_body = user_request.model_dump_json()
 
-        channel.basic_publish(
-            exchange=EXCHANGE_NAME,              
-            routing_key=INCOMING_ROUTING_KEY,     
-            body=message_body.encode('utf-8'),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE
+    started = time.perf_counter()
+    try:
+        with _publish_span(user_request.Id):
+            await async_publisher.publish(
+                message_body.encode('utf-8'), priority=_priority_for(user_request), headers=inject_headers()
             )
+    except BufferFullError as e:
+        metrics.PUBLISHED.labels("async", "buffer_full").inc()
+        return JSONResponse(
+            {"status": "error", "message": f"Ingest buffer is full, retry later: {e}"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(INGEST_RETRY_AFTER_SECONDS)},
         )
+    except PublishError as e:
+        metrics.PUBLISHED.labels("async", "failed").inc()
+        return JSONResponse(
+            {"status": "error", "message": f"Failed to queue request: {e}"},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+    finally:
+        metrics.PUBLISH_LATENCY.labels("async", "single").observe(time.perf_counter() - started)
 
-        return {"status": "accepted", "message": "Your request has been queued for processing."}
+    metrics.PUBLISHED.labels("async", "accepted").inc()
+    return {"status": "accepted", "message": "Your request has been queued for processing."}
 
-    except pika.exceptions.AMQPError as e:
-        return {"status": "error", "message": f"Failed to queue request: {e}"}, 500
-    finally:
-        if connection and not connection.is_closed:
-            connection.close()
\ No newline at end of file
+
+app.post("/api/v1/ticket", status_code=status.HTTP_202_ACCEPTED)(
+    create_ticket_async if INGEST_MODE == "async" else create_ticket
+)
+
+
+class BatchTooLargeError(ValueError):
+    pass
+
+
+async def _read_batch_items(request: Request) -> list:
+    """
+    Reads the raw batch body: a JSON array, or NDJSON (one object per line) when the
+    content type says so. NDJSON is parsed line by line as the body streams in.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonlines" not in content_type:
+        items = json.loads(await request.body())
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of tickets")
+        if len(items) > MAX_BATCH_SIZE:
+            raise BatchTooLargeError(f"Batch has {len(items)} items, the limit is {MAX_BATCH_SIZE}")
+        return items
+
+    items = []
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                items.append(_parse_ndjson_line(line))
+        if len(items) > MAX_BATCH_SIZE:
+            raise BatchTooLargeError(f"Batch has more than {MAX_BATCH_SIZE} items")
+    if pending.strip():
+        items.append(_parse_ndjson_line(pending))
+    if len(items) > MAX_BATCH_SIZE:
+        raise BatchTooLargeError(f"Batch has more than {MAX_BATCH_SIZE} items")
+    return items
+
+
+def _parse_ndjson_line(line: bytes):
+    # A broken line only rejects that item, not the whole batch.
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        return ValueError(f"Invalid JSON line: {e}")
+
+
+@app.post("/api/v1/tickets:batch", status_code=status.HTTP_202_ACCEPTED)
+async def create_tickets_batch(request: Request):
+    """
+    Accepts a JSON array or an NDJSON stream of tickets, validates every item in one
+    pass and publishes the valid ones together: one transaction on a pooled channel in
+    sync mode, pipelined confirms on the shared channel in async mode. Answers with a
+    per-item accepted/rejected status.
+    """
+    try:
+        items = await _read_batch_items(request)
+    except BatchTooLargeError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": f"Invalid batch body: {e}"}, status_code=status.HTTP_400_BAD_REQUEST)
+    if not items:
+        return JSONResponse({"status": "error", "message": "Batch has no tickets"}, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    results = []
+    valid_indexes = []
+    bodies = []
+    priorities = []
+    for index, item in enumerate(items):
+        if isinstance(item, Exception):
+            results.append({"index": index, "status": "rejected", "error": str(item)})
+            continue
+        try:
+            user_request = UserRequest.model_validate(item)
+        except ValidationError as e:
+            results.append({"index": index, "status": "rejected", "error": e.errors(include_url=False, include_context=False)})
+            continue
+        results.append({"index": index, "Id": user_request.Id, "status": "accepted"})
+        valid_indexes.append(index)
+        bodies.append(user_request.model_dump_json().encode('utf-8'))
+        priorities.append(_priority_for(user_request))
+
+    metrics.BATCH_SIZE.observe(len(items))
+    metrics.REJECTED.inc(len(items) - len(bodies))
+    started = time.perf_counter()
+    try:
+        with _publish_span(batch_size=len(bodies)):
+            # One span for the whole batch, every message carries its context.
+            headers = inject_headers()
+            if INGEST_MODE == "async":
+                errors = await async_publisher.publish_batch(bodies, priorities, headers=headers)
+            else:
+                await run_in_threadpool(publisher.publish_batch, bodies, priorities, headers=headers)
+                errors = [None] * len(bodies)
+    except BufferFullError as e:
+        metrics.PUBLISHED.labels(INGEST_MODE, "buffer_full").inc(len(bodies))
+        return JSONResponse(
+            {"status": "error", "message": f"Ingest buffer is full, retry later: {e}"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(INGEST_RETRY_AFTER_SECONDS)},
+        )
+    except PublishError as e:
+        errors = [e] * len(bodies)
+    metrics.PUBLISH_LATENCY.labels(INGEST_MODE, "batch").observe(time.perf_counter() - started)
+
+    for index, error in zip(valid_indexes, errors):
+        metrics.PUBLISHED.labels(INGEST_MODE, "accepted" if error is None else "failed").inc()
+        if error is not None:
+            results[index]["status"] = "rejected"
+            results[index]["error"] = f"Failed to queue request: {error}"
+
+    accepted = sum(1 for result in results if result["status"] == "accepted")
+    return JSONResponse(
+        {
+            "status": "accepted" if accepted == len(results) else "partial" if accepted else "rejected",
+            "accepted": accepted,
+            "rejected": len(results) - accepted,
+            "results": results,
+        },
+        status_code=(
+            status.HTTP_202_ACCEPTED if accepted
+            else status.HTTP_500_INTERNAL_SERVER_ERROR if bodies
+            else status.HTTP_400_BAD_REQUEST
+        ),
+    )
@@ -0,0 +1,34 @@
+import re
+from typing import Optional
+
+# Cheap signals only: this runs on the ingest path for every ticket.
+FRAUD_PATTERN = re.compile(
+    r"\b(fraud\w*|unauthori[sz]ed|stolen|hacked|scam\w*|suspicious|identity theft|security breach|phishing)\b",
+    re.IGNORECASE,
+)
+URGENT_PATTERN = re.compile(
+    r"\b(urgent\w*|immediately|asap|emergency|locked out|can'?t access|cannot access|blocked)\b",
+    re.IGNORECASE,
+)
+PRIORITY_TIERS = {"premium", "private", "vip", "business", "corporate"}
+
+HIGHEST = 9
+HIGH = 6
+ELEVATED = 3
+NORMAL = 1
+
+
+def ticket_priority(userInput: str, customerTier: Optional[str] = None, max_priority: int = HIGHEST) -> int:
+    """
+    AMQP priority for a ticket (higher is more urgent): fraud reports first,
+    then urgent wording, then priority customer tiers. Clamped to the queue's x-max-priority.
+    """
+    if FRAUD_PATTERN.search(userInput):
+        priority = HIGHEST
+    elif URGENT_PATTERN.search(userInput):
+        priority = HIGH
+    elif customerTier and customerTier.strip().lower() in PRIORITY_TIERS:
+        priority = ELEVATED
+    else:
+        priority = NORMAL
+    return min(priority, max_priority)
@@ -0,0 +1,304 @@
+import logging
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import pika
+from pika.adapters.blocking_connection import ReturnedMessage
+
+logger = logging.getLogger("ticket_api.publisher")
+
+
+class PublishError(Exception):
+    """Raised when a message could not be handed to RabbitMQ and confirmed."""
+
+
+class _PooledChannel:
+    """
+    One pool slot: a dedicated BlockingConnection and a channel in confirm mode.
+    pika connections are not thread safe, so every slot is used by one thread at a time.
+    """
+
+    def __init__(self, parameters: pika.ConnectionParameters):
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+        self.channel.confirm_delivery()
+        self.tx_channel = None
+        self.returned: List[ReturnedMessage] = []
+        self.last_used = time.monotonic()
+
+    def get_tx_channel(self):
+        """
+        Transactional channel used for batches: BlockingChannel waits for every confirm
+        individually, while tx_commit acknowledges a whole batch in one round trip.
+        """
+        if self.tx_channel is None or not self.tx_channel.is_open:
+            self.tx_channel = self.connection.channel()
+            self.tx_channel.tx_select()
+            self.tx_channel.add_on_return_callback(self._on_returned)
+        return self.tx_channel
+
+    def _on_returned(self, channel, method, properties, body):
+        self.returned.append(ReturnedMessage(method, properties, body))
+
+    @property
+    def is_open(self) -> bool:
+        return self.connection.is_open and self.channel.is_open
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except pika.exceptions.AMQPError:
+            pass
+
+
+class RabbitPublisher:
+    """
+    Long-lived publisher shared by every request of the API process.
+
+    Connections are opened lazily up to `pool_size`, the exchange/queue topology is
+    declared once at startup, and every publish waits for the broker confirm so a
+    202 means the ticket is durably queued. Broken slots are dropped and re-opened
+    with exponential backoff.
+    """
+
+    def __init__(self, parameters: pika.ConnectionParameters, exchange: str, queue_name: str,
+                 routing_key: str, pool_size: int = 4, max_retries: int = 3,
+                 backoff_base: float = 0.2, backoff_max: float = 5.0, acquire_timeout: float = 5.0,
+                 queue_arguments: Optional[Dict] = None):
+        self.parameters = parameters
+        self.exchange = exchange
+        self.queue_name = queue_name
+        self.routing_key = routing_key
+        self.queue_arguments = queue_arguments
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._keepalive_thread = None
+
+    # --- Lifecycle ---
+    def start(self, max_attempts: Optional[int] = None):
+        """Opens the first pooled connection and declares the topology once."""
+        self._closed.clear()
+        slot = self._open_slot(max_attempts=max_attempts)
+        self.declare_topology(slot.channel)
+        self._release(slot)
+
+        # Idle BlockingConnections only service heartbeats when we touch them.
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="rabbit-keepalive", daemon=True)
+        self._keepalive_thread.start()
+        logger.info(f"RabbitMQ publisher ready (pool size {self.pool_size}).")
+
+    def declare_topology(self, channel):
+        channel.exchange_declare(exchange=self.exchange, exchange_type='direct', durable=True)
+        channel.queue_declare(queue=self.queue_name, durable=True, arguments=self.queue_arguments)
+        channel.queue_bind(exchange=self.exchange, queue=self.queue_name, routing_key=self.routing_key)
+
+    def close(self):
+        """Closes every pooled connection. Safe to call more than once."""
+        self._closed.set()
+        while True:
+            try:
+                slot = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            slot.close()
+        with self._lock:
+            self._created = 0
+        logger.info("RabbitMQ publisher closed.")
+
+    # --- Publishing ---
+    def publish(self, body: bytes, properties: Optional[pika.BasicProperties] = None,
+                routing_key: Optional[str] = None):
+        """Publishes one persistent message and blocks until the broker confirms it."""
+        if properties is None:
+            properties = pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE)
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt))
+            try:
+                with self.channel() as channel:
+                    channel.basic_publish(
+                        exchange=self.exchange,
+                        routing_key=routing_key or self.routing_key,
+                        body=body,
+                        properties=properties,
+                        mandatory=True,
+                    )
+                return
+            except (pika.exceptions.UnroutableError, pika.exceptions.NackError) as e:
+                # The broker answered, retrying on another connection won't help.
+                raise PublishError(f"Broker refused message: {e!r}") from e
+            except pika.exceptions.AMQPError as e:
+                last_error = e
+                logger.warning(f"Publish attempt {attempt + 1} failed: {e!r}")
+
+        raise PublishError(f"Failed to publish after {self.max_retries + 1} attempts: {last_error!r}")
+
+    def publish_batch(self, bodies: List[bytes], priorities: Optional[List[int]] = None,
+                      routing_key: Optional[str] = None, headers: Optional[dict] = None):
+        """
+        Publishes many persistent messages over one channel and commits them as a single
+        transaction, so the whole batch is either queued or not. Like `publish`, messages
+        are mandatory: if the broker can't route them, PublishError is raised.
+        """
+        if not bodies:
+            return
+        properties = [
+            pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE, priority=priority, headers=headers)
+            for priority in (priorities or [None] * len(bodies))
+        ]
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt))
+            try:
+                with self._borrow() as slot:
+                    channel = slot.get_tx_channel()
+                    slot.returned.clear()
+                    for body, message_properties in zip(bodies, properties):
+                        channel.basic_publish(
+                            exchange=self.exchange,
+                            routing_key=routing_key or self.routing_key,
+                            body=body,
+                            properties=message_properties,
+                            mandatory=True,
+                        )
+                    channel.tx_commit()
+                    # The broker returns unroutable messages before it acknowledges the commit,
+                    # this hands them to _on_returned.
+                    slot.connection.process_data_events(time_limit=0)
+                    if slot.returned:
+                        raise pika.exceptions.UnroutableError(slot.returned[:])
+                return
+            except pika.exceptions.UnroutableError as e:
+                # The broker answered, retrying on another connection won't help.
+                raise PublishError(f"Broker returned {len(e.messages)} of {len(bodies)} messages as unroutable") from e
+            except pika.exceptions.AMQPError as e:
+                # An uncommitted transaction dies with its channel, so the batch can be resent.
+                last_error = e
+                logger.warning(f"Batch publish attempt {attempt + 1} failed: {e!r}")
+
+        raise PublishError(f"Failed to publish batch after {self.max_retries + 1} attempts: {last_error!r}")
+
+    @contextmanager
+    def channel(self):
+        """Borrows a pooled confirm-mode channel."""
+        with self._borrow() as slot:
+            yield slot.channel
+
+    @contextmanager
+    def _borrow(self):
+        """
+        Borrows a pool slot; the slot is discarded if the block raises an AMQP error.
+        A returned or nacked message leaves its channel usable, so that slot goes back.
+        """
+        slot = self._acquire()
+        try:
+            yield slot
+        except (pika.exceptions.UnroutableError, pika.exceptions.NackError):
+            slot.last_used = time.monotonic()
+            self._release(slot)
+            raise
+        except pika.exceptions.AMQPError:
+            self._discard(slot)
+            raise
+        except Exception:
+            self._release(slot)
+            raise
+        else:
+            slot.last_used = time.monotonic()
+            self._release(slot)
+
+    # --- Pool internals ---
+    def _acquire(self) -> _PooledChannel:
+        if self._closed.is_set():
+            raise PublishError("Publisher is closed")
+
+        try:
+            slot = self._idle.get_nowait()
+        except queue.Empty:
+            slot = None
+            with self._lock:
+                can_grow = self._created < self.pool_size
+                if can_grow:
+                    self._created += 1
+            if can_grow:
+                try:
+                    return self._open_slot(max_attempts=1, counted=True)
+                except pika.exceptions.AMQPError:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                slot = self._idle.get(timeout=self.acquire_timeout)
+            except queue.Empty:
+                raise PublishError("Timed out waiting for a free RabbitMQ channel")
+
+        if not slot.is_open:
+            self._discard(slot)
+            return self._acquire()
+        return slot
+
+    def _release(self, slot: _PooledChannel):
+        if self._closed.is_set():
+            slot.close()
+            return
+        self._idle.put(slot)
+
+    def _discard(self, slot: _PooledChannel):
+        slot.close()
+        with self._lock:
+            self._created = max(0, self._created - 1)
+
+    def _open_slot(self, max_attempts: Optional[int] = None, counted: bool = False) -> _PooledChannel:
+        attempt = 0
+        while True:
+            try:
+                slot = _PooledChannel(self.parameters)
+                if not counted:
+                    with self._lock:
+                        self._created += 1
+                return slot
+            except pika.exceptions.AMQPConnectionError as e:
+                attempt += 1
+                if max_attempts is not None and attempt >= max_attempts:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"RabbitMQ connection failed ({e!r}), retrying in {delay:.1f}s ..")
+                time.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _keepalive_loop(self):
+        interval = max(1.0, (self.parameters.heartbeat or 60) / 2)
+        while not self._closed.wait(interval):
+            borrowed = []
+            while True:
+                try:
+                    borrowed.append(self._idle.get_nowait())
+                except queue.Empty:
+                    break
+            for slot in borrowed:
+                try:
+                    slot.connection.process_data_events(time_limit=0)
+                except pika.exceptions.AMQPError:
+                    self._discard(slot)
+                    continue
+                self._release(slot)
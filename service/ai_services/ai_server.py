@@ -1,87 +1,248 @@
 # we'll load our model into the gpu and expose it throught api endpoint 
-from typing import Optional
-from vllm.engine.arg_utils import AsyncEngineArgs
-from vllm.engine.async_llm_engine import AsyncLLMEngine
-from vllm.sampling_params import SamplingParams
-from vllm.utils import random_uuid
+from typing import Any, AsyncIterator, Optional, Tuple
+try:
+    from vllm.engine.arg_utils import AsyncEngineArgs
+    from vllm.engine.async_llm_engine import AsyncLLMEngine
+    from vllm.sampling_params import GuidedDecodingParams, SamplingParams
+    from vllm.utils import random_uuid
+except ImportError:
+    # CPU-only installs (benchmarks, AI_ENGINE=stub) run the stub engine without vllm
+    AsyncEngineArgs = AsyncLLMEngine = None
+    from stub_engine import StubGuidedDecodingParams as GuidedDecodingParams, StubSamplingParams as SamplingParams, random_uuid
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI,Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
 import uvicorn
+import argparse
+import asyncio
 import json
+import os
+import time
 import traceback
 import logging
 
 from prompts.prompt import BankingPrompts
+from stub_engine import StubEngine
+from json_stream import JsonObjectScanner
+from preclassifier import KeywordPreClassifier
+from lifecycle import ServerLifecycle
+from token_budget import TokenBudget
+import server_metrics as metrics
+from server_tracing import tracer, setup_tracing, context_from_carrier
 
 MODEL_NAME = "Qwen/Qwen2.5-0.5B-Instruct-GPTQ-Int8"
-app = FastAPI(title="vLLM inference Server for Banking")
+# "vllm" for the real GPU engine, "stub" for the CPU stand-in in stub_engine.py
+ENGINE_BACKEND = os.getenv("AI_ENGINE", "vllm").lower()
+MAX_BATCH_ITEMS = int(os.getenv("AI_MAX_BATCH_ITEMS", 64))
+ENABLE_PREFIX_CACHING = os.getenv("AI_ENABLE_PREFIX_CACHING", "true").lower() in ("1", "true", "yes")
+# constrain generation to the ticket JSON schema; output can't be malformed, so it needs far fewer tokens
+GUIDED_DECODING = os.getenv("AI_GUIDED_DECODING", "false").lower() in ("1", "true", "yes")
+# decode budget besides the customer text the ticket repeats (all of it without a tokenizer)
+MAX_TOKENS = int(os.getenv("AI_MAX_TOKENS", 512 if GUIDED_DECODING else 1024))
+MAX_MODEL_LEN = int(os.getenv("AI_MAX_MODEL_LEN", 4096))
+# customer text beyond this many tokens is cut in the middle, so long messages fit the context
+MAX_INPUT_TOKENS = int(os.getenv("AI_MAX_INPUT_TOKENS", 1024))
+# size max_tokens per kind of ticket from the completion lengths seen so far, AI_MAX_TOKENS is the ceiling
+ADAPTIVE_MAX_TOKENS = os.getenv("AI_ADAPTIVE_MAX_TOKENS", "true").lower() in ("1", "true", "yes")
+MAX_TOKENS_QUANTILE = float(os.getenv("AI_MAX_TOKENS_QUANTILE", 0.99))
+MAX_TOKENS_HEADROOM = float(os.getenv("AI_MAX_TOKENS_HEADROOM", 1.25))
+# "on": reject clearly off-domain input without the model and add routing hints, "shadow": only log, "off"
+PRECLASSIFIER_MODE = os.getenv("AI_PRECLASSIFIER", "on").lower()
+# "priority" lets urgent tickets (higher "priority" in the request body) jump the engine's waiting queue
+SCHEDULING_POLICY = os.getenv("AI_SCHEDULING_POLICY", "fcfs").lower()
+# admission control: the engine runs up to AI_MAX_NUM_SEQS sequences, at most AI_MAX_QUEUED_REQUESTS more
+# may wait in its queue (negative: no limit). beyond that, tickets are answered 503 with a Retry-After
+MAX_NUM_SEQS = int(os.getenv("AI_MAX_NUM_SEQS", 256))
+MAX_QUEUED_REQUESTS = int(os.getenv("AI_MAX_QUEUED_REQUESTS", 256))
+RETRY_AFTER_SECONDS = int(os.getenv("AI_RETRY_AFTER_SECONDS", 2))
+# model files are resolved once into this directory (e.g. a volume, default: the Hugging Face cache),
+# restarts then load them without asking the hub
+MODEL_CACHE_DIR = os.getenv("AI_MODEL_CACHE_DIR")
+# synthetic tickets run through the engine before the server reports ready
+WARMUP_TICKETS = int(os.getenv("AI_WARMUP_TICKETS", 4))
+# simulated model load time of the stub engine, to exercise the startup sequence on CPU
+STUB_LOAD_SECONDS = float(os.getenv("AI_STUB_LOAD_SECONDS", 0))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load and warm up in the background, so /health/live answers while the model loads
+    startup = asyncio.create_task(start_engine())
+    yield
+    startup.cancel()
+
+
+app = FastAPI(title="vLLM inference Server for Banking", lifespan=lifespan)
 engine = None
+lifecycle = ServerLifecycle()
+# built from the engine's tokenizer once it is loaded
+token_budget = None
+# generations submitted to the engine and not finished yet (running + waiting)
+engine_load = 0
 logger = logging.getLogger("vllm_server")
 
 
-def format_few_shot_prompt(userInput:str,id:str)-> str:
-    ''' no data ? prompt engineering '''
-    
-    # system prompt
-    prompt = BankingPrompts.SYSTEM_PROMPT
-    
-    # few shot example to guide the model
-    prompt += "\n\n---Examples---"
-    for example in BankingPrompts.EXAMPLES:
-        # We provide a placeholder ID for the examples since they are static
-        example_prompt_text = BankingPrompts.get_ticket_generation_prompt(example["input"], "Example-ID-123")
-        prompt += f"\n\n{example_prompt_text}\nResponse:\n{example['output']}"
-    
-    # add current user query
-    prompt+= "\n\n---Current request"
-    final_user_prompt  = BankingPrompts.get_ticket_generation_prompt(userInput,id)
-    prompt += f"\n\n{final_user_prompt}\nResponse:\n"
-    
-    return prompt
+# system prompt + few shot examples, built once. Every prompt starts with these exact bytes,
+# so with prefix caching the engine only has to prefill the customer's part.
+FEW_SHOT_PREFIX = BankingPrompts.get_few_shot_prefix()
 
 
-@app.post("/generate")
-async def generate(request: Request):
+TICKET_JSON_SCHEMA = BankingPrompts.get_ticket_json_schema()
+preclassifier = KeywordPreClassifier.from_banking_prompts()
+
+
+def build_sampling_params(max_tokens: int = MAX_TOKENS) -> SamplingParams:
+    ''' sampling settings for one ticket, guided by the ticket schema when AI_GUIDED_DECODING is on '''
+    guided_decoding = GuidedDecodingParams(json=TICKET_JSON_SCHEMA) if GUIDED_DECODING else None
+    return SamplingParams(temperature=0.4, top_p=0.9, max_tokens=max_tokens, guided_decoding=guided_decoding)
+
+
+def format_few_shot_prompt(userInput:str,id:str,routingHint:Optional[str]=None)-> str:
+    ''' no data ? prompt engineering: shared few-shot prefix + the current request as a single tail '''
+    return FEW_SHOT_PREFIX + BankingPrompts.get_request_tail(userInput,id,routingHint=routingHint)
+
+
+async def stream_ticket(body: dict, trace_context=None) -> AsyncIterator[Tuple[str, Any]]:
+    ''' runs one ticket request through the engine. yields ("delta", text) for each new piece of
+    generated text and finally ("result", (json content, http status)).
+    decoding is stopped as soon as the top-level JSON object is complete, the model tends to
+    keep talking after it and those tokens are thrown away anyway.
+    the request's span continues the traceparent of the item itself, else `trace_context` '''
+    global engine_load
     id=None
     generation_request_id = None
+    span = tracer.start_span(
+        "generate ticket",
+        context=(context_from_carrier(body) if isinstance(body, dict) else None) or trace_context,
+        kind=SpanKind.SERVER,
+    )
     try:
-        body = await request.json()
         userInput = body.get("userInput")
         id=body.get("id")
 
         
         if not userInput or not id:
-            return JSONResponse({"error": "userInput and id are required"}, status_code=400)
+            yield "result", ({"error": "userInput and id are required"}, 400)
+            return
+        span.set_attribute("ticket.id", id)
+
+        routing_hint = None
+        # decode budgets are learned per department the pre-classifier sees
+        ticket_kind = "general"
+        if PRECLASSIFIER_MODE in ("on", "shadow"):
+            pre = preclassifier.classify(userInput)
+            if not pre.is_banking:
+                logger.info(f"Pre-classifier flagged id: '{id}' as non-banking (score {pre.score}, mode {PRECLASSIFIER_MODE})")
+                if PRECLASSIFIER_MODE == "on":
+                    metrics.PRECLASSIFIED.labels("rejected").inc()
+                    span.set_attribute("preclassifier.rejected", True)
+                    yield "result", (BankingPrompts.get_rejection_response(), 200)
+                    return
+            elif PRECLASSIFIER_MODE == "on":
+                routing_hint = KeywordPreClassifier.routing_hint(pre)
+            ticket_kind = pre.department or ticket_kind
+            metrics.PRECLASSIFIED.labels("hinted" if routing_hint else "passed").inc()
+            if routing_hint:
+                span.set_attribute("preclassifier.department", pre.department)
+
+        if not engine_has_room():
+            logger.warning(f"Engine queue is full ({engine_load} generations in flight), shedding id: '{id}'")
+            metrics.SHED.inc()
+            span.set_attribute("admission.rejected", True)
+            yield "result", ({"error": "AI server is at capacity, retry later"}, 503)
+            return
 
         # generate unique id for the engine 
         generation_request_id = f"gen-{random_uuid()}"
         
         logger.info(f"Processing request for id: '{id}'. Assigned Generation id: '{generation_request_id}'")
 
-        final_prompt = format_few_shot_prompt(userInput,id)
-        generation_params = SamplingParams(temperature=0.4, top_p=0.9, max_tokens=1024)
+        max_tokens = MAX_TOKENS
+        input_tokens = 0
+        if token_budget is not None:
+            userInput, input_tokens = token_budget.fit_input(userInput)
+            if input_tokens > token_budget.input_budget:
+                logger.warning(f"Input of id: '{id}' has {input_tokens} tokens, cut to {token_budget.input_budget}")
+                metrics.INPUT_TRUNCATED.inc()
+                span.set_attribute("gen_ai.input.truncated_from", input_tokens)
+                input_tokens = token_budget.input_budget
+        final_prompt = format_few_shot_prompt(userInput,id,routing_hint)
+        if token_budget is not None:
+            max_tokens = token_budget.max_tokens_for(ticket_kind, token_budget.count_prompt(final_prompt), input_tokens)
+        metrics.MAX_TOKENS.observe(max_tokens)
+        span.set_attribute("gen_ai.request.max_tokens", max_tokens)
+        generation_params = build_sampling_params(max_tokens)
+
+        generate_kwargs = {}
+        if SCHEDULING_POLICY == "priority":
+            # vLLM schedules lower values first, tickets use AMQP semantics (higher is more urgent)
+            generate_kwargs["priority"] = -int(body.get("priority") or 0)
 
-        results_generator = engine.generate(final_prompt, generation_params, generation_request_id)
+        results_generator = engine.generate(final_prompt, generation_params, generation_request_id, **generate_kwargs)
+        scanner = JsonObjectScanner()
         generated_text = ""
-        async for request_output in results_generator:
-            if request_output.finished:
+        request_output = None
+        submitted_at = time.perf_counter()
+        submitted_ns = time.time_ns()
+        first_token_at = None
+        first_token_ns = None
+        metrics.IN_FLIGHT.inc()
+        engine_load += 1
+        try:
+            async for request_output in results_generator:
                 generated_text = request_output.outputs[0].text
-                break
+                if first_token_at is None and generated_text:
+                    first_token_at = time.perf_counter()
+                    first_token_ns = time.time_ns()
+                    metrics.TIME_TO_FIRST_TOKEN.observe(first_token_at - submitted_at)
+                seen = len(scanner.text)
+                object_done = scanner.feed_cumulative(generated_text)
+                if len(scanner.text) > seen:
+                    yield "delta", scanner.text[seen:]
+                if object_done and not request_output.finished:
+                    await engine.abort(generation_request_id)
+                    metrics.EARLY_STOPS.inc()
+                    logger.debug(f"JSON complete for id '{id}', stopped decoding early (Generation id: '{generation_request_id}')")
+                    break
+                if request_output.finished:
+                    break
+        finally:
+            # release the engine's generator now rather than whenever it gets garbage collected
+            await results_generator.aclose()
+            metrics.IN_FLIGHT.dec()
+            engine_load -= 1
+            _record_generation(request_output, submitted_at, first_token_at)
+            _trace_generation(span, request_output, submitted_ns, first_token_ns)
+            if token_budget is not None and request_output is not None:
+                if scanner.complete:
+                    token_budget.observe(ticket_kind, len(request_output.outputs[0].token_ids), input_tokens)
+                elif request_output.outputs[0].finish_reason == "length":
+                    logger.warning(f"id: '{id}' ran out of its {max_tokens} tokens before the ticket JSON was complete")
+                    metrics.OUTPUT_TRUNCATED.inc()
+                    token_budget.observe_truncated(ticket_kind, max_tokens, input_tokens)
 
         if not generated_text:
             logger.error(f"Failed to generate output for id: '{id}' (Generation id: '{generation_request_id}')") 
-            return JSONResponse({"error":"Failed to generate output from model"},status_code=500)
+            span.set_status(Status(StatusCode.ERROR, "no output from model"))
+            yield "result", ({"error":"Failed to generate output from model"}, 500)
+            return
         
         logger.info(f"Successfully generated response for id: '{id}' (Generation id: '{generation_request_id}')")
         logger.debug(f"Raw model output for id '{id}':\n{generated_text}")
 
-        start_index = generated_text.find('{')
-        if start_index == -1:
-            raise ValueError("No JSON object start '{' found in the model's output.")
+        if scanner.complete:
+            json_output = scanner.parse()
+        else:
+            start_index = generated_text.find('{')
+            if start_index == -1:
+                raise ValueError("No JSON object start '{' found in the model's output.")
 
-        json_decoder = json.JSONDecoder()
-        json_output, _ = json_decoder.raw_decode(generated_text[start_index:])
+            json_decoder = json.JSONDecoder()
+            json_output, _ = json_decoder.raw_decode(generated_text[start_index:])
         
         
         if "id" in json_output and json_output["id"] != id:
@@ -91,18 +252,278 @@ async def generate(request: Request):
              logger.warning(f"Model did not include id for request id '{id}'. Injecting correct id.")
              json_output["id"] = id
              
-        return JSONResponse(content=json_output)
+        yield "result", (json_output, 200)
 
     except Exception as e:
         logger.error(f"Error processing id: '{id}' (Generation id: '{generation_request_id}'). Error: {e}")
         traceback.print_exc()
-        return JSONResponse(
-            {"error": f"An unexpected error occurred in the AI server: {e}"},
-            status_code=500
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
+        yield "result", ({"error": f"An unexpected error occurred in the AI server: {e}"}, 500)
+    finally:
+        span.end()
+
+
+def resolve_model() -> str:
+    ''' local snapshot of MODEL_NAME in AI_MODEL_CACHE_DIR, downloaded only when it is not there yet '''
+    from huggingface_hub import snapshot_download
+    try:
+        return snapshot_download(MODEL_NAME, cache_dir=MODEL_CACHE_DIR, local_files_only=True)
+    except Exception:
+        logger.info(f"Downloading {MODEL_NAME} into {MODEL_CACHE_DIR}...")
+        return snapshot_download(MODEL_NAME, cache_dir=MODEL_CACHE_DIR)
+
+
+def build_engine():
+    ''' creates the configured engine. blocking: this is where the model gets loaded '''
+    if ENGINE_BACKEND == "stub":
+        logger.info("Initializing stub engine (CPU, canned outputs)...")
+        time.sleep(STUB_LOAD_SECONDS)
+        return StubEngine(
+            prefill_ms_per_token=float(os.getenv("AI_STUB_PREFILL_MS_PER_TOKEN", 0)),
+            decode_ms_per_token=float(os.getenv("AI_STUB_DECODE_MS_PER_TOKEN", 0)),
+            enable_prefix_caching=ENABLE_PREFIX_CACHING,
+            max_num_seqs=MAX_NUM_SEQS,
+            max_model_len=MAX_MODEL_LEN,
         )
+    logger.info("Initializing vLLM engine...")
+    engine_args = AsyncEngineArgs(
+        model=resolve_model(),
+        quantization="gptq",
+        gpu_memory_utilization=0.90,
+        max_model_len=MAX_MODEL_LEN,
+        enable_prefix_caching=ENABLE_PREFIX_CACHING,
+        max_num_seqs=MAX_NUM_SEQS,
+        scheduling_policy=SCHEDULING_POLICY
+    )
+    return AsyncLLMEngine.from_engine_args(engine_args)
+
+
+async def load_token_budget():
+    ''' token accounting with the loaded engine's tokenizer '''
+    global token_budget
+    token_budget = TokenBudget(
+        await engine.get_tokenizer(),
+        FEW_SHOT_PREFIX,
+        max_model_len=MAX_MODEL_LEN,
+        max_tokens=MAX_TOKENS,
+        max_input_tokens=MAX_INPUT_TOKENS,
+        adaptive=ADAPTIVE_MAX_TOKENS,
+        quantile=MAX_TOKENS_QUANTILE,
+        headroom=MAX_TOKENS_HEADROOM,
+    )
+    logger.info(f"Prompt prefix is {token_budget.prefix_tokens} tokens, customer text may use up to {token_budget.input_budget}")
+
+
+async def warm_up():
+    ''' primes the engine before it takes traffic: prefills the shared few-shot prefix (so it sits in
+    the prefix cache), then runs AI_WARMUP_TICKETS synthetic tickets through the whole path, which also
+    compiles the guided decoding grammar. fails when none of the tickets could be generated '''
+    prefix_params = SamplingParams(temperature=0.0, top_p=1.0, max_tokens=1)
+    async for _ in engine.generate(FEW_SHOT_PREFIX, prefix_params, f"warmup-{random_uuid()}"):
+        pass
+    if WARMUP_TICKETS <= 0:
+        return
+    inputs = [example["input"] for example in BankingPrompts.EXAMPLES]
+    outcomes = await asyncio.gather(*(
+        generate_ticket({"userInput": inputs[i % len(inputs)], "id": f"warmup-{i}"})
+        for i in range(WARMUP_TICKETS)
+    ))
+    if all(status_code >= 500 for _, status_code in outcomes):
+        raise RuntimeError(f"every warm-up ticket failed: {outcomes[0][0]}")
+
+
+async def start_engine():
+    ''' loading -> warming_up -> ready. an engine set before startup (tests, benchmarks) is only warmed up '''
+    global engine
+    try:
+        if engine is None:
+            lifecycle.advance(ServerLifecycle.LOADING)
+            engine = await asyncio.to_thread(build_engine)
+        lifecycle.advance(ServerLifecycle.WARMING_UP)
+        await load_token_budget()
+        await warm_up()
+        lifecycle.advance(ServerLifecycle.READY)
+    except Exception as e:
+        logger.error(f"AI server failed to start: {e}")
+        traceback.print_exc()
+        lifecycle.advance(ServerLifecycle.FAILED, str(e))
+    for phase, seconds in lifecycle.durations.items():
+        metrics.STARTUP_PHASE_SECONDS.labels(phase).set(seconds)
+
+
+def not_ready_response() -> JSONResponse:
+    return JSONResponse(
+        {"error": f"AI server is not ready ({lifecycle.state})"},
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+def engine_has_room() -> bool:
+    ''' admission control: whether the engine's waiting queue can take one more generation '''
+    if MAX_QUEUED_REQUESTS < 0:
+        return True
+    return engine_load - MAX_NUM_SEQS < MAX_QUEUED_REQUESTS
+
+
+def overload_headers(status_codes) -> Optional[dict]:
+    ''' tells shed clients when to come back '''
+    return {"Retry-After": str(RETRY_AFTER_SECONDS)} if 503 in status_codes else None
+
+
+def _record_generation(request_output, submitted_at: float, first_token_at: Optional[float]):
+    ''' token and timing metrics of one generation, from the last output the engine streamed '''
+    finished_at = time.perf_counter()
+    metrics.GENERATION_LATENCY.observe(finished_at - submitted_at)
+    if request_output is None:
+        return
+    completion_tokens = len(request_output.outputs[0].token_ids)
+    metrics.PROMPT_TOKENS.inc(len(request_output.prompt_token_ids or ()))
+    metrics.CACHED_PROMPT_TOKENS.inc(request_output.num_cached_tokens or 0)
+    metrics.COMPLETION_TOKENS.inc(completion_tokens)
+    if first_token_at is not None and completion_tokens > 1 and finished_at > first_token_at:
+        metrics.DECODE_TOKENS_PER_SECOND.observe((completion_tokens - 1) / (finished_at - first_token_at))
+
+
+def _trace_generation(span, request_output, submitted_ns: int, first_token_ns: Optional[int]):
+    ''' child spans splitting the engine time into waiting + prefill (until the first token) and decode '''
+    if not span.is_recording():
+        return
+    finished_ns = time.time_ns()
+    context = trace.set_span_in_context(span)
+    prefill_end_ns = first_token_ns or finished_ns
+    prefill = tracer.start_span("engine queue + prefill", context=context, start_time=submitted_ns)
+    if request_output is not None:
+        prefill.set_attribute("gen_ai.usage.input_tokens", len(request_output.prompt_token_ids or ()))
+        prefill.set_attribute("gen_ai.usage.cached_input_tokens", request_output.num_cached_tokens or 0)
+    prefill.end(end_time=prefill_end_ns)
+    if first_token_ns is not None:
+        decode = tracer.start_span("engine decode", context=context, start_time=first_token_ns)
+        if request_output is not None:
+            decode.set_attribute("gen_ai.usage.output_tokens", len(request_output.outputs[0].token_ids))
+        decode.end(end_time=finished_ns)
+
+
+async def generate_ticket(body: dict, trace_context=None) -> Tuple[dict, int]:
+    ''' runs one ticket request through the engine, returns (json content, http status) '''
+    async for kind, payload in stream_ticket(body, trace_context):
+        if kind == "result":
+            return payload
+    return {"error": "Failed to generate output from model"}, 500
+
+
+@app.post("/generate")
+async def generate(request: Request):
+    if not lifecycle.ready:
+        return not_ready_response()
+    try:
+        body = await request.json()
+    except ValueError as e:
+        return JSONResponse({"error": f"Request body is not valid JSON: {e}"}, status_code=400)
+
+    started = time.perf_counter()
+    content, status_code = await generate_ticket(body, context_from_carrier(request.headers))
+    metrics.REQUEST_LATENCY.labels("generate").observe(time.perf_counter() - started)
+    metrics.REQUESTS.labels("generate", status_code).inc()
+    return JSONResponse(content=content, status_code=status_code, headers=overload_headers([status_code]))
+
+
+@app.post("/generate_batch")
+async def generate_batch(request: Request):
+    ''' accepts {"items": [...]} (or a bare list) and submits every item to the engine at once,
+    so its scheduler can batch them. results come back in the same order '''
+    if not lifecycle.ready:
+        return not_ready_response()
+    try:
+        body = await request.json()
+    except ValueError as e:
+        return JSONResponse({"error": f"Request body is not valid JSON: {e}"}, status_code=400)
+
+    items = body.get("items") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        return JSONResponse({"error": "items must be a list"}, status_code=400)
+    if len(items) > MAX_BATCH_ITEMS:
+        return JSONResponse({"error": f"batch has {len(items)} items, the limit is {MAX_BATCH_ITEMS}"}, status_code=413)
+
+    started = time.perf_counter()
+    trace_context = context_from_carrier(request.headers)
+    outcomes = await asyncio.gather(*(
+        generate_ticket(item, trace_context) if isinstance(item, dict) else _invalid_batch_item()
+        for item in items
+    ))
+    metrics.REQUEST_LATENCY.labels("generate_batch").observe(time.perf_counter() - started)
+    for _, status_code in outcomes:
+        metrics.REQUESTS.labels("generate_batch", status_code).inc()
+    return JSONResponse(
+        {"results": [{"status": status_code, "result": content} for content, status_code in outcomes]},
+        headers=overload_headers([status_code for _, status_code in outcomes]),
+    )
+
+
+async def _invalid_batch_item() -> Tuple[dict, int]:
+    return {"error": "batch items must be JSON objects"}, 400
+
+
+@app.post("/generate_stream")
+async def generate_stream(request: Request):
+    ''' same as /generate, but streams the generated text as server-sent events:
+    "delta" events while decoding, then one "result" event with the final JSON and status '''
+    if not lifecycle.ready:
+        return not_ready_response()
+    try:
+        body = await request.json()
+    except ValueError as e:
+        return JSONResponse({"error": f"Request body is not valid JSON: {e}"}, status_code=400)
+
+    async def events():
+        started = time.perf_counter()
+        async for kind, payload in stream_ticket(body, context_from_carrier(request.headers)):
+            if kind == "delta":
+                data = {"text": payload}
+            else:
+                content, status_code = payload
+                data = {"status": status_code, "result": content}
+                metrics.REQUEST_LATENCY.labels("generate_stream").observe(time.perf_counter() - started)
+                metrics.REQUESTS.labels("generate_stream", status_code).inc()
+            yield f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
                     
+
+
+@app.get("/health/live")
+def health_live():
+    ''' liveness: the process is up and did not fail to start (it may still be loading) '''
+    return JSONResponse(lifecycle.describe(), status_code=200 if lifecycle.live else 503)
+
+
+@app.get("/health/ready")
+@app.get("/health")
+async def health_ready():
+    ''' readiness, for the worker's router and the container healthcheck: 200 once the engine is loaded
+    and warmed up and while it stays healthy, 503 otherwise. reports the engine load too '''
+    if not lifecycle.ready:
+        return JSONResponse(lifecycle.describe(), status_code=503)
+    try:
+        await engine.check_health()
+    except Exception as e:
+        logger.error(f"Engine health check failed: {e}")
+        return JSONResponse({"status": "unhealthy", "error": str(e)}, status_code=503)
+    return {"status": lifecycle.state, "engine_load": engine_load, "max_num_seqs": MAX_NUM_SEQS, "accepting": engine_has_room(),
+            "token_budget": token_budget.describe()}
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
     
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="vLLM inference server for banking tickets")
+    parser.add_argument("--download-only", action="store_true",
+                        help="fetch the model into AI_MODEL_CACHE_DIR and exit (e.g. while building the image)")
+    args = parser.parse_args()
     
     logging.basicConfig(
         level =logging.INFO,
@@ -110,14 +531,13 @@ if __name__ == "__main__":
         datefmt="%Y-%m-%d %H:%M:%S"
     )
     
-    logger.info("Initializing vLLM engine...")
-    engine_args = AsyncEngineArgs(
-        model=MODEL_NAME,
-        quantization="gptq",
-        gpu_memory_utilization=0.90,
-        max_model_len=4096
-    )
-    engine = AsyncLLMEngine.from_engine_args(engine_args)
+    if args.download_only:
+        logger.info(f"Model files ready at {resolve_model()}")
+        raise SystemExit(0)
+    if ENGINE_BACKEND != "stub" and AsyncLLMEngine is None:
+        raise SystemExit("vllm is not installed; set AI_ENGINE=stub to run the CPU stub engine")
 
-    logger.info("Starting Uvicorn server on 0.0.0.0:8001...")
-    uvicorn.run(app, host='0.0.0.0', port=8001)
\ No newline at end of file
+    setup_tracing("ai-server")
+    port = int(os.getenv("AI_SERVER_PORT", 8001))
+    logger.info(f"Starting Uvicorn server on 0.0.0.0:{port}, the engine loads in the background...")
+    uvicorn.run(app, host='0.0.0.0', port=port)
@@ -0,0 +1,276 @@
+''' offline bulk classification: streams tickets from a JSONL file straight into the engine, without the
+API, RabbitMQ, the worker or HTTP. every ticket goes through the same path as /generate (pre-classifier,
+few-shot prompt, early stop), with up to --max-in-flight tickets submitted at once so the engine can
+batch them.
+
+inputs repeating one already seen in this run are generated once; with --redis-host, tickets already in
+the worker's cache are not generated at all, and new results are written to that cache. results go to
+--output as JSONL, in input order, one line per input line, shaped like the worker's reason-queue message.
+a checkpoint file records how far the output is complete; --resume continues from it after a crash.
+
+    python batch_classify.py tickets.jsonl --output results.jsonl
+    python batch_classify.py tickets.jsonl --output results.jsonl --resume
+    python batch_classify.py tickets.jsonl --redis-host localhost --engine stub
+    python batch_classify.py ../../requests.jsonl --output out.jsonl --input-field body --id-field request_id
+'''
+from collections import OrderedDict, deque
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import orjson
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# cache keys and value format are the worker's, so the worker sees these results as cache hits
+sys.path.insert(0, os.path.join(HERE, "..", "..", "workers"))
+from cache_codec import CacheCodec  # noqa: E402
+from cache_keys import build_cache_key_strategy, personalize, shareable_part  # noqa: E402
+
+import ai_server  # noqa: E402
+
+logger = logging.getLogger("batch_classify")
+
+
+class Checkpoint:
+
+    ''' how far the input has been fully written out: the input byte offset and line number,
+    and the output size at that point. written atomically next to the output '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.input_offset = 0
+        self.lines = 0
+        self.output_offset = 0
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            state = orjson.loads(f.read())
+        self.input_offset, self.lines, self.output_offset = state["input_offset"], state["lines"], state["output_offset"]
+        return True
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps({"input_offset": self.input_offset, "lines": self.lines, "output_offset": self.output_offset}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class BatchClassifier:
+
+    def __init__(self, output, checkpoint: Checkpoint, max_in_flight: int = 1024, redis_conn=None,
+                 cache_key_strategy: str = "normalized", cache_ttl: int = 3600, dedupe_size: int = 100000,
+                 checkpoint_every: int = 1000, input_field: str = "userInput", id_field: str = "id"):
+        self.output = output
+        self.checkpoint = checkpoint
+        self.max_in_flight = max_in_flight
+        self.redis_conn = redis_conn
+        self.cache_keys = build_cache_key_strategy(cache_key_strategy)
+        self.cache_ttl = cache_ttl
+        self.codec = CacheCodec()
+        self.dedupe_size = dedupe_size
+        self.checkpoint_every = checkpoint_every
+        self.input_field = input_field
+        self.id_field = id_field
+        # cache key -> future of its AI result, for inputs seen in this run
+        self.known = OrderedDict()
+        self.stats = {"lines": 0, "generated": 0, "cached": 0, "deduplicated": 0, "failed": 0, "invalid": 0}
+
+    async def run(self, input_path: str):
+        started = time.monotonic()
+        last_report = started
+        window = deque()
+        with open(input_path, "rb") as source:
+            source.seek(self.checkpoint.input_offset)
+            while True:
+                # keep the engine fed: up to max_in_flight lines past the last one written out
+                while len(window) < self.max_in_flight:
+                    raw = source.readline()
+                    if not raw:
+                        break
+                    if raw.strip():
+                        window.append((source.tell(), self.submit(raw)))
+                    else:
+                        window.append((source.tell(), None))
+                if not window:
+                    break
+
+                input_offset, pending = window.popleft()
+                if pending is not None:
+                    record = await pending
+                    self.output.write(orjson.dumps(record) + b"\n")
+                    self.stats["lines"] += 1
+                self.checkpoint.input_offset = input_offset
+                self.checkpoint.lines += 1
+                if self.checkpoint.lines % self.checkpoint_every == 0:
+                    self.save_checkpoint()
+                if time.monotonic() - last_report > 10:
+                    last_report = time.monotonic()
+                    self.report(last_report - started)
+        self.save_checkpoint()
+        self.report(time.monotonic() - started)
+
+    def submit(self, raw: bytes) -> "asyncio.Future":
+        ''' schedules one input line, the future resolves to its output record '''
+        try:
+            ticket = orjson.loads(raw)
+            userInput, id = ticket.get(self.input_field), ticket.get(self.id_field)
+        except (orjson.JSONDecodeError, AttributeError):
+            userInput = id = None
+        if not userInput or not isinstance(userInput, str):
+            self.stats["invalid"] += 1
+            return self._done({"id": id, "status": 400, "error": f"line has no '{self.input_field}' text"})
+
+        key = self.cache_keys.key_for(userInput, ticket.get("customerName"))
+        shared = self.known.get(key)
+        if shared is not None:
+            self.stats["deduplicated"] += 1
+            self.known.move_to_end(key)
+        else:
+            shared = asyncio.ensure_future(self._ai_part(key, userInput, id))
+            self.known[key] = shared
+            self._evict()
+        return asyncio.ensure_future(self._record(id, shared, ticket))
+
+    async def _record(self, id, shared: "asyncio.Future", ticket: dict) -> dict:
+        ai_part, status_code = await shared
+        if status_code >= 400:
+            return {"id": id, "status": status_code, **ai_part}
+        # lines with the same key share a result, the customer fields are this line's own
+        return personalize(ai_part, id, ticket[self.input_field], ticket.get("customerName"),
+                           ticket.get("customerId") or ticket.get("customerid"))
+
+    async def _ai_part(self, key: str, userInput: str, id) -> tuple:
+        ''' (result without the ticket id and customer fields, status), from the worker's cache or the engine '''
+        if self.redis_conn is not None:
+            raw = await self.redis_conn.get(key)
+            if raw is not None:
+                try:
+                    value = self.codec.decode(raw)
+                    self.stats["cached"] += 1
+                    return value, 200
+                except ValueError:
+                    pass
+
+        content, status_code = await ai_server.generate_ticket({"userInput": userInput, "id": id})
+        if status_code >= 400:
+            self.stats["failed"] += 1
+            return content, status_code
+        self.stats["generated"] += 1
+        content = shareable_part(content)
+        if self.redis_conn is not None and "error" not in content:
+            await self.redis_conn.set(key, self.codec.encode(content), ex=self.cache_ttl)
+        return content, status_code
+
+    def _evict(self):
+        # finished results only: pending ones are still awaited by lines in the window
+        while len(self.known) > self.dedupe_size:
+            oldest_key, oldest = next(iter(self.known.items()))
+            if not oldest.done():
+                break
+            del self.known[oldest_key]
+
+    @staticmethod
+    def _done(record: dict) -> "asyncio.Future":
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(record)
+        return future
+
+    def save_checkpoint(self):
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        self.checkpoint.output_offset = self.output.tell()
+        self.checkpoint.save()
+
+    def report(self, elapsed: float):
+        rate = self.stats["lines"] / elapsed if elapsed > 0 else 0.0
+        logger.info(f"{self.checkpoint.lines} lines done ({rate:.1f}/s this run): " +
+                    ", ".join(f"{name} {count}" for name, count in self.stats.items()))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file, one ticket per line")
+    parser.add_argument("--output", help="JSONL results file (default: <input>.results.jsonl)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint instead of starting over")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="lines between checkpoints")
+    parser.add_argument("--input-field", default="userInput", help="field holding the ticket text")
+    parser.add_argument("--id-field", default="id", help="field holding the ticket id")
+
+    engine = parser.add_argument_group("engine")
+    engine.add_argument("--engine", choices=("vllm", "stub"), default=ai_server.ENGINE_BACKEND)
+    engine.add_argument("--max-in-flight", type=int, default=1024, help="tickets submitted to the engine at once")
+    engine.add_argument("--max-num-seqs", type=int, default=ai_server.MAX_NUM_SEQS, help="sequences the engine runs per step")
+
+    cache = parser.add_argument_group("worker cache")
+    cache.add_argument("--redis-host", help="skip tickets already in this redis and store new results there")
+    cache.add_argument("--redis-port", type=int, default=6379)
+    cache.add_argument("--cache-key-strategy", choices=("raw", "normalized"), default=os.getenv("CACHE_KEY_STRATEGY", "normalized"),
+                       help="must match the workers' CACHE_KEY_STRATEGY (simhash needs its redis index, not supported here)")
+    cache.add_argument("--cache-ttl", type=int, default=int(os.getenv("CACHE_TTL_SECONDS", 3600)))
+    cache.add_argument("--dedupe-size", type=int, default=100000, help="distinct inputs remembered for deduplication")
+    return parser.parse_args()
+
+
+async def main(args):
+    output_path = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+    checkpoint = Checkpoint(args.checkpoint or output_path + ".checkpoint")
+    if args.resume and checkpoint.load():
+        logger.info(f"Resuming after line {checkpoint.lines}")
+    elif args.resume:
+        logger.info("No checkpoint found, starting from the beginning")
+
+    redis_conn = None
+    if args.redis_host:
+        import redis.asyncio
+        redis_conn = redis.asyncio.Redis(host=args.redis_host, port=args.redis_port, db=0)
+        await redis_conn.ping()
+
+    # this process is the engine's only client: no admission limit, --max-in-flight bounds the queue
+    ai_server.ENGINE_BACKEND = args.engine
+    ai_server.MAX_NUM_SEQS = args.max_num_seqs
+    ai_server.MAX_QUEUED_REQUESTS = -1
+    if ai_server.engine is None:
+        if args.engine == "vllm" and ai_server.AsyncLLMEngine is None:
+            raise SystemExit("vllm is not installed; use --engine stub to run the CPU stub engine")
+        ai_server.engine = await asyncio.to_thread(ai_server.build_engine)
+    await ai_server.load_token_budget()
+
+    # "r+b" keeps what the checkpoint covers, anything after it is redone
+    mode = "r+b" if args.resume and os.path.exists(output_path) else "wb"
+    with open(output_path, mode) as output:
+        output.truncate(checkpoint.output_offset)
+        output.seek(checkpoint.output_offset)
+        classifier = BatchClassifier(
+            output, checkpoint,
+            max_in_flight=args.max_in_flight,
+            redis_conn=redis_conn,
+            cache_key_strategy=args.cache_key_strategy,
+            cache_ttl=args.cache_ttl,
+            dedupe_size=args.dedupe_size,
+            checkpoint_every=args.checkpoint_every,
+            input_field=args.input_field,
+            id_field=args.id_field,
+        )
+        await classifier.run(args.input)
+    if redis_conn is not None:
+        await redis_conn.aclose()
+    logger.info(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    # the per-ticket lines of the server are too much for a backfill
+    logging.getLogger("vllm_server").setLevel(logging.WARNING)
+    asyncio.run(main(parse_args()))
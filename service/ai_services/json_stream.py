@@ -0,0 +1,69 @@
+# incremental detection of the first complete JSON object in a model's token stream
+import json
+
+
+class JsonObjectScanner:
+    '''
+    feed it the generated text chunk by chunk. it skips whatever comes before the first '{',
+    tracks brace depth (ignoring braces inside strings) and reports as soon as that top-level
+    object closes, so the caller can stop decoding instead of waiting for the model to finish.
+    every character is looked at once, however many chunks arrive.
+    '''
+
+    def __init__(self):
+        self.text = ""
+        self.start = -1
+        self.end = -1
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def complete(self) -> bool:
+        return self.end != -1
+
+    def feed(self, chunk: str) -> bool:
+        '''adds newly generated text, returns True once the top-level object is complete'''
+        if self.complete:
+            return True
+
+        offset = len(self.text)
+        self.text += chunk
+        for index in range(offset, len(self.text)):
+            char = self.text[index]
+
+            if self.start == -1:
+                if char == '{':
+                    self.start = index
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = index + 1
+                    return True
+        return False
+
+    def feed_cumulative(self, text: str) -> bool:
+        '''same as feed, for engines that hand back the whole text generated so far'''
+        return self.feed(text[len(self.text):])
+
+    def object_text(self) -> str:
+        if not self.complete:
+            raise ValueError("The JSON object is not complete yet.")
+        return self.text[self.start:self.end]
+
+    def parse(self) -> dict:
+        return json.loads(self.object_text())
@@ -0,0 +1,54 @@
+from typing import Dict, Optional
+import logging
+import time
+
+logger = logging.getLogger("vllm_server")
+
+
+class ServerLifecycle:
+
+    ''' startup state machine of the AI server: starting -> loading -> warming_up -> ready,
+    or failed from any of them. the server is live unless it failed, and takes tickets only once ready.
+    records how long each phase took '''
+
+    STARTING = "starting"
+    LOADING = "loading"
+    WARMING_UP = "warming_up"
+    READY = "ready"
+    FAILED = "failed"
+
+    TRANSITIONS = {
+        STARTING: (LOADING, WARMING_UP, FAILED),  # warming_up directly when the engine was handed in
+        LOADING: (WARMING_UP, FAILED),
+        WARMING_UP: (READY, FAILED),
+        READY: (FAILED,),
+        FAILED: (),
+    }
+
+    def __init__(self):
+        self.state = self.STARTING
+        self.error: Optional[str] = None
+        self.durations: Dict[str, float] = {}
+        self._since = time.monotonic()
+
+    @property
+    def live(self) -> bool:
+        return self.state != self.FAILED
+
+    @property
+    def ready(self) -> bool:
+        return self.state == self.READY
+
+    def advance(self, state: str, error: Optional[str] = None):
+        if state not in self.TRANSITIONS[self.state]:
+            raise ValueError(f"AI server can't go from {self.state} to {state}")
+        now = time.monotonic()
+        self.durations[self.state] = now - self._since
+        logger.info(f"AI server {self.state} -> {state} after {now - self._since:.1f}s" + (f": {error}" if error else ""))
+        self.state, self.error, self._since = state, error, now
+
+    def describe(self) -> dict:
+        status = {"status": self.state, "phase_seconds": {k: round(v, 3) for k, v in self.durations.items()}}
+        if self.error:
+            status["error"] = self.error
+        return status
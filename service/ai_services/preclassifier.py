@@ -0,0 +1,108 @@
+# keyword pre-classification: answers clearly off-domain tickets without touching the GPU
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from prompts.prompt import BankingPrompts
+
+
+@dataclass
+class PreClassification:
+    is_banking: bool  # False: confidently off-domain, the model is skipped
+    score: float
+    department: Optional[str] = None
+    severity: Optional[str] = None
+    matched: List[str] = field(default_factory=list)
+
+
+class KeywordPreClassifier:
+    '''
+    one compiled regex over every keyword of BankingPrompts.get_banking_keywords() and
+    get_department_routing(), plus a tiny linear scoring model on top of the matches:
+    - banking score: sum of keyword weights. phrases ("credit card") count double, words
+      that show up in any support request ("help", "problem") count half.
+    - rejection: only on a positive off-domain signal. the text must name an off-domain topic
+      (OFF_DOMAIN_KEYWORDS: weather, recipes, sports ..) and score below `reject_below` without
+      the generic words. a ticket matching no keyword at all ("How do I order new cheques?") goes
+      to the model, which knows more banking words than this list.
+    - department prior: the department with the highest weighted hits, only when it has at
+      least `min_department_score` and beats the runner-up by `min_margin`.
+      fraud keywords count double here: a fraud report about a card belongs to Fraud
+      Prevention, not Credit Cards (see BankingPrompts.EXAMPLES).
+    - severity prior: Critical when the fraud keywords win, as in get_severity_guidelines().
+    '''
+
+    FRAUD_DEPARTMENT = "Fraud Prevention"
+
+    GENERIC_WORDS = {"help", "problem", "issue", "support", "error", "service", "system", "app", "website"}
+
+    # everyday topics of requests that are not about a bank
+    OFF_DOMAIN_KEYWORDS = [
+        "weather", "forecast", "movie", "film", "tv show", "song", "music", "concert", "recipe", "bake", "cook",
+        "restaurant", "joke", "poem", "story", "homework", "essay", "translate", "capital of", "football", "soccer",
+        "basketball", "tennis", "match", "sport", "game", "pharmacy", "doctor", "neighbour", "neighbor", "dog",
+        "cat", "pet", "laptop", "router", "internet provider", "wifi", "meaning of life",
+    ]
+
+    def __init__(self, banking_keywords: List[str], department_routing: Dict[str, List[str]],
+                 off_domain_keywords: Optional[List[str]] = None, reject_below: float = 0.5,
+                 min_department_score: float = 2.0, min_margin: float = 1.0):
+        self.reject_below = reject_below
+        self.min_department_score = min_department_score
+        self.min_margin = min_margin
+
+        self.weights = {}
+        for keyword in list(banking_keywords) + [k for keywords in department_routing.values() for k in keywords]:
+            keyword = keyword.lower()
+            self.weights[keyword] = 2.0 if " " in keyword else 0.5 if keyword in self.GENERIC_WORDS else 1.0
+
+        self.departments_by_keyword = {}
+        for department, keywords in department_routing.items():
+            for keyword in keywords:
+                self.departments_by_keyword.setdefault(keyword.lower(), []).append(department)
+
+        # longest first, so "credit card" wins over "card"; optional plural "s"
+        alternatives = sorted(self.weights, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(" + "|".join(re.escape(k) for k in alternatives) + r")s?\b", re.IGNORECASE)
+        off_domain = sorted((k.lower() for k in (self.OFF_DOMAIN_KEYWORDS if off_domain_keywords is None else off_domain_keywords)),
+                            key=len, reverse=True)
+        self.off_domain_pattern = re.compile(r"\b(" + "|".join(re.escape(k) for k in off_domain) + r")s?\b", re.IGNORECASE)
+
+    @classmethod
+    def from_banking_prompts(cls, **kwargs) -> "KeywordPreClassifier":
+        return cls(BankingPrompts.get_banking_keywords(), BankingPrompts.get_department_routing(), **kwargs)
+
+    def classify(self, text: str) -> PreClassification:
+        matched = [match.group(1).lower() for match in self.pattern.finditer(text)]
+        score = sum(self.weights[keyword] for keyword in matched)
+        banking_score = sum(self.weights[keyword] for keyword in matched if keyword not in self.GENERIC_WORDS)
+        if banking_score < self.reject_below and self.off_domain_pattern.search(text):
+            return PreClassification(is_banking=False, score=score, matched=matched)
+
+        department_scores = {}
+        for keyword in matched:
+            for department in self.departments_by_keyword.get(keyword, []):
+                weight = self.weights[keyword] * (2 if department == self.FRAUD_DEPARTMENT else 1)
+                department_scores[department] = department_scores.get(department, 0.0) + weight
+
+        department = severity = None
+        ranked = sorted(department_scores.items(), key=lambda item: item[1], reverse=True)
+        if ranked:
+            best, best_score = ranked[0]
+            runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+            if best_score >= self.min_department_score and best_score - runner_up >= self.min_margin:
+                department = best
+                if department == self.FRAUD_DEPARTMENT:
+                    severity = "Critical"
+
+        return PreClassification(is_banking=True, score=score, department=department, severity=severity, matched=matched)
+
+    @staticmethod
+    def routing_hint(result: PreClassification) -> Optional[str]:
+        '''short hint for the prompt tail when there is a confident prior'''
+        if result.department is None:
+            return None
+        hint = f"likely department: {result.department}"
+        if result.severity:
+            hint += f", likely severity: {result.severity}"
+        return hint
@@ -15,6 +15,12 @@ class BankingPrompts:
     Banking domain prompt templates for consistent AI responses
     """
     
+    # the departments a ticket can be routed to: listed in SYSTEM_PROMPT and enforced by the JSON schema
+    IMPACTED_DEPARTMENTS = [
+        "Account Management", "Credit Cards", "Loans and Mortgages", "Investment Services",
+        "Customer Service", "Technical Support", "Fraud Prevention", "Compliance",
+        "Wire Transfers", "Mobile Banking"
+    ]
     
     SYSTEM_PROMPT = """You are an expert AI assistant acting as a Senior Customer Support Specialist for a major financial institution. You have deep, comprehensive knowledge of all banking products, internal procedures, and customer resolution protocols.
 
@@ -41,7 +47,7 @@ Response must be in this exact JSON format:
   "originalInput": "Complete original customer text",
   "severity": "Low|Medium|High|Critical",
   "typeOfTicket": "Complaint|Inquiry|Assistance",
-  "impactedDepartment": "Account Management|Credit Cards|Loans and Mortgages|Investment Services|Customer Service|Technical Support|Fraud Prevention|Compliance|Wire Transfers|Mobile Banking",
+  "impactedDepartment": "{impactedDepartments}",
   "impactedService": "Specific service affected",
   "customerName": "Customer name if provided, otherwise an empty string \"\"",
   "customerId": "Customer's unique national ID or account identifier if provided, otherwise an empty string \"\"",
@@ -56,7 +62,7 @@ For non-banking queries, respond with:
   "message": "I can only assist with banking and financial services related inquiries.",
   "isBankingRelated": false,
   "confidenceScore": 0.0
-}"""
+}""".replace("{impactedDepartments}", "|".join(IMPACTED_DEPARTMENTS))
 
     USER_PROMPT_TEMPLATE = """Customer Request:
 {customerText}
@@ -107,6 +113,46 @@ Respond with only "BANKING" if related to financial services, or "NOT_BANKING" i
         """
         return cls.VALIDATION_PROMPT.format(customerText=customerText)
 
+    @classmethod
+    def get_few_shot_prefix(cls) -> str:
+        """
+        Static head of the ticket prompt: system prompt plus the few-shot examples.
+        It does not depend on the request, so it is byte-identical every time.
+        """
+        prefix = cls.SYSTEM_PROMPT
+        prefix += "\n\n---Examples---"
+        for example in cls.EXAMPLES:
+            # We provide a placeholder ID for the examples since they are static
+            example_prompt_text = cls.get_ticket_generation_prompt(example["input"], "Example-ID-123")
+            prefix += f"\n\n{example_prompt_text}\nResponse:\n{example['output']}"
+        prefix += "\n\n---Current request"
+        return prefix
+
+    @classmethod
+    def get_request_tail(cls, customerText: str, id: str,
+                         customerName: Optional[str] = None,
+                         customerId: Optional[str] = None,
+                         routingHint: Optional[str] = None) -> str:
+        """
+        Per-request part of the ticket prompt, appended after the few-shot prefix
+        """
+        final_user_prompt = cls.get_ticket_generation_prompt(customerText, id, customerName, customerId)
+        if routingHint:
+            final_user_prompt += f"\nRouting hint (keyword pre-classifier): {routingHint}"
+        return f"\n\n{final_user_prompt}\nResponse:\n"
+
+    @classmethod
+    def get_rejection_response(cls) -> Dict:
+        """
+        The answer for non-banking queries, as specified in SYSTEM_PROMPT
+        """
+        return {
+            "error": "Non-banking query rejected",
+            "message": "I can only assist with banking and financial services related inquiries.",
+            "isBankingRelated": False,
+            "confidenceScore": 0.0
+        }
+
     
     EXAMPLES = [
         {
@@ -235,6 +281,57 @@ Respond with only "BANKING" if related to financial services, or "NOT_BANKING" i
             ]
         }
 
+    @classmethod
+    def get_impacted_departments(cls) -> List[str]:
+        """
+        Get the departments a ticket can be routed to, as listed in SYSTEM_PROMPT
+        """
+        return list(cls.IMPACTED_DEPARTMENTS)
+
+    @classmethod
+    def get_ticket_json_schema(cls) -> Dict:
+        """
+        JSON schema of the model's answer (a ticket or a rejection), built from the
+        definitions above. Used to constrain generation to valid output.
+        """
+        text = {"type": "string"}
+        ticket = {
+            "type": "object",
+            "properties": {
+                "title": text,
+                "description": text,
+                "originalInput": text,
+                "severity": {"type": "string", "enum": list(cls.get_severity_guidelines())},
+                "typeOfTicket": {"type": "string", "enum": list(cls.get_ticket_type_definitions())},
+                "impactedDepartment": {"type": "string", "enum": cls.get_impacted_departments()},
+                "impactedService": text,
+                "customerName": text,
+                "customerId": text,
+                "resolutionSuggestion": text,
+                "preferredCommunication": text,
+                "confidenceScore": {"type": "number", "minimum": 0, "maximum": 1},
+                "id": text,
+            },
+            "required": [
+                "title", "description", "originalInput", "severity", "typeOfTicket",
+                "impactedDepartment", "impactedService", "customerName", "customerId",
+                "resolutionSuggestion", "preferredCommunication", "id"
+            ],
+            "additionalProperties": False,
+        }
+        rejection = {
+            "type": "object",
+            "properties": {
+                "error": {"type": "string", "enum": ["Non-banking query rejected"]},
+                "message": text,
+                "isBankingRelated": {"type": "boolean", "enum": [False]},
+                "confidenceScore": {"type": "number", "minimum": 0, "maximum": 1},
+            },
+            "required": ["error", "message", "isBankingRelated", "confidenceScore"],
+            "additionalProperties": False,
+        }
+        return {"anyOf": [ticket, rejection]}
+
     @classmethod
     def get_banking_keywords(cls) -> List[str]:
         """
@@ -0,0 +1,79 @@
+# prometheus metrics of the AI server, served on /metrics next to the API
+from prometheus_client import Counter, Gauge, Histogram
+
+# seconds, from well under a token to a long generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUESTS = Counter(
+    "ai_server_requests_total",
+    "Ticket requests by endpoint and HTTP status.",
+    ["endpoint", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "ai_server_request_seconds",
+    "Wall time of a ticket request, from the body being parsed to the result.",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "ai_server_generations_in_flight",
+    "Generations submitted to the engine and not finished yet.",
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    "ai_server_startup_phase_seconds",
+    "How long each startup phase took: starting, loading (model load), warming_up.",
+    ["phase"],
+)
+SHED = Counter(
+    "ai_server_shed_total",
+    "Tickets answered 503 because the engine queue was full (AI_MAX_QUEUED_REQUESTS).",
+)
+PRECLASSIFIED = Counter(
+    "ai_server_preclassifier_total",
+    "Pre-classifier decisions: rejected (answered without the model), hinted (routing hint added), passed.",
+    ["decision"],
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "ai_server_time_to_first_token_seconds",
+    "Time from submitting the prompt to the engine until the first generated text.",
+    buckets=LATENCY_BUCKETS,
+)
+GENERATION_LATENCY = Histogram(
+    "ai_server_generation_seconds",
+    "Time from submitting the prompt to the engine until decoding finished or was stopped.",
+    buckets=LATENCY_BUCKETS,
+)
+DECODE_TOKENS_PER_SECOND = Histogram(
+    "ai_server_decode_tokens_per_second",
+    "Completion tokens per second after the first token, per generation.",
+    buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600, 3200),
+)
+PROMPT_TOKENS = Counter(
+    "ai_server_prompt_tokens_total",
+    "Prompt tokens submitted to the engine.",
+)
+CACHED_PROMPT_TOKENS = Counter(
+    "ai_server_cached_prompt_tokens_total",
+    "Prompt tokens served from the engine's prefix cache instead of being prefilled.",
+)
+COMPLETION_TOKENS = Counter(
+    "ai_server_completion_tokens_total",
+    "Tokens generated by the engine.",
+)
+MAX_TOKENS = Histogram(
+    "ai_server_max_tokens",
+    "Decode budget (max_tokens) given to each generation.",
+    buckets=(64, 128, 192, 256, 384, 512, 768, 1024, 2048),
+)
+INPUT_TRUNCATED = Counter(
+    "ai_server_input_truncated_total",
+    "Tickets whose customer text was cut to fit AI_MAX_INPUT_TOKENS.",
+)
+OUTPUT_TRUNCATED = Counter(
+    "ai_server_output_truncated_total",
+    "Generations that used up their max_tokens before the ticket JSON was complete.",
+)
+EARLY_STOPS = Counter(
+    "ai_server_early_stops_total",
+    "Generations aborted as soon as the ticket JSON object was complete.",
+)
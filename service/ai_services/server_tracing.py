@@ -0,0 +1,21 @@
+import os
+import sys
+
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+
+# opentelemetry tracing of the AI server. a ticket's trace context comes in the traceparent HTTP header,
+# or per item in the body of /generate_batch. the tracer provider is set up by the helper the services
+# share: setup_tracing("ai-server"). the image copies it next to the server, in the repo it is in shared/
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared"))
+from tracing_setup import setup_tracing  # noqa: E402,F401
+
+tracer = trace.get_tracer("vllm_server")
+
+
+def context_from_carrier(carrier):
+    '''trace context from HTTP headers or a batch item carrying its own traceparent, None if there is none'''
+    if not carrier or "traceparent" not in carrier:
+        return None
+    return extract(carrier)
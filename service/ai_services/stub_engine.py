@@ -0,0 +1,204 @@
+# CPU stand-in for AsyncLLMEngine, so the server and its clients can be exercised without a GPU
+import asyncio
+import json
+import re
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from prompts.prompt import BankingPrompts
+
+
+@dataclass
+class StubGuidedDecodingParams:
+    json: Optional[Any] = None
+
+
+@dataclass
+class StubSamplingParams:
+    temperature: float = 1.0
+    top_p: float = 1.0
+    max_tokens: Optional[int] = 16
+    guided_decoding: Optional[StubGuidedDecodingParams] = None
+
+
+def random_uuid() -> str:
+    return uuid.uuid4().hex
+
+
+class StubTokenizer:
+    '''fixed-width pseudo tokenizer with the encode/decode calls of a HF tokenizer. a token is a
+    `chars_per_token` slice of the text, its id the slice's utf-8 bytes, so decode needs no vocabulary'''
+
+    def __init__(self, chars_per_token: int = 4):
+        self.chars_per_token = chars_per_token
+
+    def encode(self, text: str, add_special_tokens: bool = False) -> List[int]:
+        return [int.from_bytes(b"\x01" + text[i:i + self.chars_per_token].encode("utf-8"), "big")
+                for i in range(0, len(text), self.chars_per_token)]
+
+    def decode(self, token_ids: List[int]) -> str:
+        return "".join(token_id.to_bytes((token_id.bit_length() + 7) // 8, "big")[1:].decode("utf-8") for token_id in token_ids)
+
+
+@dataclass
+class StubCompletionOutput:
+    index: int
+    text: str
+    token_ids: List[int] = field(default_factory=list)
+    finish_reason: Optional[str] = None
+
+
+@dataclass
+class StubRequestOutput:
+    request_id: str
+    prompt: str
+    prompt_token_ids: List[int]
+    outputs: List[StubCompletionOutput]
+    finished: bool
+    num_cached_tokens: int = 0
+
+
+class StubEngine:
+    '''
+    mimics the parts of AsyncLLMEngine the server uses: an async `generate` that streams
+    cumulative RequestOutputs, and `abort`. the answer is one of the canned
+    BankingPrompts.EXAMPLES outputs, followed by some trailing chatter like a real model.
+    with guided decoding it answers with the JSON object only, checked against the guiding schema.
+    latency is modelled as prefill time per uncached prompt token plus decode time per output
+    token. with prefix caching, full blocks of prompt tokens already seen are not prefilled
+    again, like vLLM's automatic prefix caching. `max_num_seqs` caps how many requests run at
+    once, the rest wait their turn like in vLLM's scheduler. prompts longer than `max_model_len`
+    are refused and generation stops at it, like vLLM's.
+    '''
+
+    TRAILING_TEXT = "\n\nThis ticket has been generated based on the customer's request."
+
+    def __init__(self, prefill_ms_per_token: float = 0.0, decode_ms_per_token: float = 0.0,
+                 chars_per_token: int = 4, enable_prefix_caching: bool = False, block_size: int = 16,
+                 max_num_seqs: Optional[int] = None, max_model_len: Optional[int] = None):
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms_per_token = decode_ms_per_token
+        self.chars_per_token = chars_per_token
+        self.enable_prefix_caching = enable_prefix_caching
+        self.block_size = block_size
+        self.max_num_seqs = max_num_seqs
+        self.max_model_len = max_model_len
+        self.tokenizer = StubTokenizer(chars_per_token)
+        self._running = None
+        self.generate_calls = 0
+        self._aborted = set()
+        self._cached_blocks = set()
+        self._banking_pattern = re.compile(
+            "|".join(re.escape(keyword) for keyword in BankingPrompts.get_banking_keywords()), re.IGNORECASE
+        )
+
+    def tokenize(self, text: str) -> List[int]:
+        # fixed-width pseudo tokens: good enough for latency and budget accounting
+        return list(range((len(text) + self.chars_per_token - 1) // self.chars_per_token))
+
+    async def get_tokenizer(self, lora_request=None) -> StubTokenizer:
+        return self.tokenizer
+
+    def cached_prefix_tokens(self, prompt: str) -> int:
+        '''number of leading prompt tokens served from the prefix cache; caches the prompt's blocks'''
+        if not self.enable_prefix_caching:
+            return 0
+        block_chars = self.block_size * self.chars_per_token
+        cached = 0
+        still_cached = True
+        block_key = None
+        for end in range(block_chars, len(prompt) + 1, block_chars):
+            # a block is identified by its content and everything before it, like vLLM's chained block hashes
+            block_key = hash((block_key, prompt[end - block_chars:end]))
+            if still_cached and block_key in self._cached_blocks:
+                cached += self.block_size
+            else:
+                still_cached = False
+                self._cached_blocks.add(block_key)
+        return cached
+
+    def canned_output(self, prompt: str) -> str:
+        customer_text = prompt.rsplit("Customer Request:", 1)[-1].split("Customer Information:", 1)[0]
+        ticket_id = re.search(r"- ID: (.*)", prompt.rsplit("Customer Request:", 1)[-1])
+        if not self._banking_pattern.search(customer_text):
+            return BankingPrompts.EXAMPLES[-1]["output"]
+
+        output = json.loads(BankingPrompts.EXAMPLES[1]["output"])
+        output["originalInput"] = customer_text.strip()
+        output["id"] = ticket_id.group(1).strip() if ticket_id else ""
+        return json.dumps(output, indent=2)
+
+    def guided_output(self, prompt: str, schema) -> str:
+        '''canned output in schema form: the properties in schema order, nothing around the object'''
+        import jsonschema
+
+        schema = json.loads(schema) if isinstance(schema, str) else schema
+        output = json.loads(self.canned_output(prompt))
+        for option in schema.get("anyOf", [schema]):
+            properties = option.get("properties", {})
+            if set(option.get("required", [])) <= set(output) <= set(properties):
+                output = {name: output[name] for name in properties if name in output}
+                break
+        jsonschema.validate(output, schema)
+        return json.dumps(output, separators=(",", ":"))
+
+    async def generate(self, prompt: str, sampling_params, request_id: str, **kwargs):
+        if self.max_num_seqs is None:
+            async for output in self._generate(prompt, sampling_params, request_id):
+                yield output
+            return
+        if self._running is None:
+            self._running = asyncio.Semaphore(self.max_num_seqs)
+        async with self._running:
+            async for output in self._generate(prompt, sampling_params, request_id):
+                yield output
+
+    async def _generate(self, prompt: str, sampling_params, request_id: str):
+        self.generate_calls += 1
+        prompt_token_ids = self.tokenize(prompt)
+        if self.max_model_len is not None and len(prompt_token_ids) > self.max_model_len:
+            raise ValueError(f"Prompt length of {len(prompt_token_ids)} is longer than the maximum model length of {self.max_model_len}.")
+        num_cached_tokens = self.cached_prefix_tokens(prompt)
+        guided_decoding = getattr(sampling_params, "guided_decoding", None)
+        if guided_decoding is not None and guided_decoding.json is not None:
+            text = self.guided_output(prompt, guided_decoding.json)
+        else:
+            text = self.canned_output(prompt) + self.TRAILING_TEXT
+
+        max_tokens = getattr(sampling_params, "max_tokens", None) or len(text)
+        if self.max_model_len is not None:
+            max_tokens = min(max_tokens, self.max_model_len - len(prompt_token_ids))
+        pieces = [text[i:i + self.chars_per_token] for i in range(0, len(text), self.chars_per_token)][:max_tokens]
+
+        await asyncio.sleep((len(prompt_token_ids) - num_cached_tokens) * self.prefill_ms_per_token / 1000)
+
+        generated = ""
+        for index, piece in enumerate(pieces):
+            if request_id in self._aborted:
+                self._aborted.discard(request_id)
+                return
+            await asyncio.sleep(self.decode_ms_per_token / 1000)
+            generated += piece
+            finished = index == len(pieces) - 1
+            yield StubRequestOutput(
+                request_id=request_id,
+                prompt=prompt,
+                prompt_token_ids=prompt_token_ids,
+                outputs=[StubCompletionOutput(
+                    index=0,
+                    text=generated,
+                    token_ids=list(range(index + 1)),
+                    finish_reason=("length" if len(pieces) < len(text) / self.chars_per_token else "stop") if finished else None,
+                )],
+                finished=finished,
+                num_cached_tokens=num_cached_tokens,
+            )
+        self._aborted.discard(request_id)
+
+    async def abort(self, request_id: str):
+        self._aborted.add(request_id)
+
+    async def check_health(self):
+        '''same contract as AsyncLLMEngine.check_health: raises when the engine is dead'''
+        return None
@@ -0,0 +1,109 @@
+# token accounting for ticket prompts: keeps every request inside the model's context and sizes its decode budget
+import math
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+class TokenBudget:
+    '''
+    counts prompt tokens with the engine's tokenizer. the static few-shot prefix is counted once,
+    so a request only costs tokenizing its own tail.
+    - input budget: customer text longer than `max_input_tokens` keeps its beginning and its end,
+      the middle is cut. the ticket JSON repeats the customer text (originalInput), so the budget
+      is also small enough for the text to fit twice in `max_model_len` next to the prefix, the
+      template and OUTPUT_RESERVE. a ticket can't fail for being too long.
+    - decode budget: a completion is the input's length plus what the model writes around it.
+      that overhead is kept per kind of ticket (the pre-classifier's department), and over all
+      kinds for kinds with fewer than `min_samples`. max_tokens is the input length plus the
+      `quantile` of the overhead times `headroom`; the overhead is never more than `max_tokens`,
+      which is also used until there are samples. a generation cut off before its JSON was
+      complete doubles the kind's overhead, so a kind that grew longer recovers after one failed ticket.
+    `tokenizer` needs encode(text, add_special_tokens=False) and decode(ids), like the HF tokenizers.
+    '''
+
+    TRUNCATION_MARKER = "\n[...]\n"
+    # prompt template, id and routing hint around the customer's text
+    TAIL_RESERVE = 128
+    ALL_KINDS = "*"
+    # tokens of a ticket JSON besides the echoed customer text (the few-shot answers have ~270)
+    OUTPUT_RESERVE = 384
+
+    def __init__(self, tokenizer, prefix: str, max_model_len: int = 4096, max_tokens: int = 1024,
+                 max_input_tokens: int = 1024, adaptive: bool = True, quantile: float = 0.99,
+                 headroom: float = 1.25, min_tokens: int = 64, min_samples: int = 50, window: int = 1000):
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.prefix_tokens = self.count(prefix)
+        self.max_model_len = max_model_len
+        self.max_tokens = max_tokens
+        self.input_budget = min(max_input_tokens, (max_model_len - self.prefix_tokens - self.TAIL_RESERVE - self.OUTPUT_RESERVE) // 2)
+        if self.input_budget <= 0:
+            raise ValueError(f"the prompt prefix ({self.prefix_tokens} tokens) leaves no room for the ticket in {max_model_len} tokens")
+        self.marker_tokens = self.count(self.TRUNCATION_MARKER)
+        self.adaptive = adaptive
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.min_samples = min_samples
+        self.window = window
+        # completion tokens beyond the echoed input, and the budget derived from them, per kind
+        self._overheads: Dict[str, deque] = {}
+        self._budgets: Dict[str, int] = {}
+
+    def encode(self, text: str) -> List[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def count_prompt(self, prompt: str) -> int:
+        if prompt.startswith(self.prefix):
+            return self.prefix_tokens + self.count(prompt[len(self.prefix):])
+        return self.count(prompt)
+
+    def fit_input(self, userInput: str) -> Tuple[str, int]:
+        ''' (the text cut down to the input budget if it is longer, its original token count) '''
+        ids = self.encode(userInput)
+        if len(ids) <= self.input_budget:
+            return userInput, len(ids)
+        # the problem is usually stated first and the actual ask comes last
+        keep = self.input_budget - self.marker_tokens
+        head = keep * 2 // 3
+        tail = keep - head
+        text = self.tokenizer.decode(ids[:head]) + self.TRUNCATION_MARKER + self.tokenizer.decode(ids[-tail:])
+        return text, len(ids)
+
+    def max_tokens_for(self, kind: str, prompt_tokens: int, input_tokens: int) -> int:
+        overhead = self.max_tokens
+        if self.adaptive:
+            overhead = self._budgets.get(kind, self._budgets.get(self.ALL_KINDS, overhead))
+        return max(1, min(input_tokens + overhead, self.max_model_len - prompt_tokens))
+
+    def observe(self, kind: str, completion_tokens: int, input_tokens: int):
+        ''' a ticket of this kind was complete after `completion_tokens` '''
+        for key in (kind, self.ALL_KINDS):
+            self._add(key, completion_tokens - input_tokens)
+
+    def observe_truncated(self, kind: str, max_tokens: int, input_tokens: int):
+        ''' a ticket of this kind ran into its max_tokens before its JSON was complete '''
+        overhead = self._budgets.get(kind, self._budgets.get(self.ALL_KINDS, self.max_tokens))
+        grown = min(self.max_tokens, max(overhead, max_tokens - input_tokens) * 2)
+        self._overheads.setdefault(kind, deque(maxlen=self.window)).append(grown)
+        self._budgets[kind] = max(self._budgets.get(kind, 0), grown)
+
+    def _add(self, key: str, overhead: int):
+        overheads = self._overheads.setdefault(key, deque(maxlen=self.window))
+        overheads.append(overhead)
+        # re-deriving the budget every few tickets is plenty, no need to sort the window on each one
+        if len(overheads) >= self.min_samples and len(overheads) % 8 == 0:
+            ordered = sorted(overheads)
+            percentile = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+            self._budgets[key] = min(self.max_tokens, max(self.min_tokens, math.ceil(percentile * self.headroom)))
+
+    def describe(self) -> dict:
+        ''' learned tokens beyond the echoed input, per kind '''
+        return {
+            "prefix_tokens": self.prefix_tokens,
+            "input_budget": self.input_budget,
+            "output_overhead": dict(sorted(self._budgets.items())),
+        }
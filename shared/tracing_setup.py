@@ -0,0 +1,38 @@
+import os
+
+from opentelemetry import trace
+
+# opentelemetry tracer provider shared by the ticket API, the ticket worker and the AI server, each passing
+# its own service name. configured from the environment when it is called, after the service loaded its .env:
+#   TRACING_EXPORTER      none (every span is a no-op), file or otlp
+#   TRACING_FILE          where the file exporter writes, traces-<service name>.jsonl by default
+#   TRACING_SAMPLE_RATIO  share of new traces that are recorded; requests with a sampled parent always are
+
+
+def setup_tracing(service_name: str):
+    '''installs the SDK tracer provider for `service_name`, spans are exported in batches from a background thread'''
+    exporter_name = os.getenv("TRACING_EXPORTER", "none").lower()
+    if exporter_name == "none":
+        return
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    if exporter_name == "otlp":
+        # endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    else:
+        # one OTLP-style JSON span per line
+        exporter = ConsoleSpanExporter(
+            out=open(os.getenv("TRACING_FILE", f"traces-{service_name}.jsonl"), "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(float(os.getenv("TRACING_SAMPLE_RATIO", 0.05)))),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "workers"))
+sys.path.insert(0, os.path.join(ROOT, "service", "ai_services"))
+
+
+@pytest.fixture
+def redis_conn():
+    '''an in-process redis that runs the workers' lua scripts for real (fakeredis with lupa)'''
+    return fakeredis.FakeRedis()
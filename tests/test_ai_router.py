@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from ai_router import AiRouter, NoReplicaReady
+
+
+def make_router(count=3, **kwargs):
+    # no health checks: every replica starts out ready
+    return AiRouter.from_urls([f"http://ai-{i}:8000/generate" for i in range(count)], health_interval=0, **kwargs)
+
+
+def test_replica_is_ejected_after_max_failures_in_a_row():
+    router = make_router(max_failures=3, eject_seconds=30)
+    replica = router.replicas[0]
+    for _ in range(2):
+        router.release(replica, failed=True)
+    router.release(replica, latency=0.1)
+    for _ in range(2):
+        router.release(replica, failed=True)
+    assert replica.available(time.monotonic())
+    router.release(replica, failed=True)
+    assert not replica.available(time.monotonic())
+    for _ in range(20):
+        assert router.acquire() is not replica
+
+
+def test_last_available_replica_is_never_ejected():
+    router = make_router(count=2, max_failures=1)
+    first, second = router.replicas
+    router.release(first, failed=True)
+    router.release(second, failed=True)
+    assert not first.available(time.monotonic())
+    assert second.available(time.monotonic())
+    assert router.acquire() is second
+
+
+def test_slow_replica_is_ejected_once_all_have_enough_samples():
+    router = make_router(count=3, min_samples=5, slow_factor=3.0)
+    fast, other, slow = router.replicas
+    for _ in range(5):
+        router.release(fast, latency=0.1)
+        router.release(other, latency=0.12)
+    for _ in range(4):
+        router.release(slow, latency=1.0)
+    assert slow.available(time.monotonic())
+    router.release(slow, latency=1.0)
+    assert not slow.available(time.monotonic())
+    # judged afresh when it comes back
+    assert slow.samples == 0 and slow.latency is None
+
+
+def test_same_key_lands_on_the_same_replica():
+    router = make_router(count=4)
+    picks = {key: router.acquire(key) for key in ("alice", "bob", "carol")}
+    for key, replica in picks.items():
+        router.release(replica)
+        for _ in range(5):
+            chosen = router.acquire(key)
+            router.release(chosen)
+            assert chosen is replica
+
+
+def test_affinity_yields_to_the_runner_up_when_clearly_busier():
+    router = make_router(count=3, affinity_slack=2)
+    first, second = sorted(router.replicas, key=lambda r: router._rendezvous("key", r), reverse=True)[:2]
+    first.outstanding = 2
+    assert router.acquire("key") is first
+    first.outstanding = 4
+    assert router.acquire("key") is second
+
+
+def test_acquire_gives_up_when_no_replica_becomes_ready():
+    router = make_router(count=2, ready_wait=0.1)
+    for replica in router.replicas:
+        replica.healthy = False
+    started = time.monotonic()
+    with pytest.raises(NoReplicaReady):
+        router.acquire()
+    assert time.monotonic() - started >= 0.1
+
+
+def test_acquire_waits_for_a_replica_to_become_ready():
+    router = make_router(count=1, ready_wait=5, eject_seconds=0.05)
+    replica = router.replicas[0]
+    replica.healthy = False
+    picked = []
+    thread = threading.Thread(target=lambda: picked.append(router.acquire()))
+    thread.start()
+    time.sleep(0.1)
+    assert not picked
+    replica.healthy = True
+    thread.join(2)
+    assert picked == [replica]
+    assert replica.outstanding == 1
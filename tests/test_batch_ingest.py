@@ -0,0 +1,30 @@
+import os
+import sys
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import main  # noqa: E402
+
+# no lifespan: nothing here reaches the publisher
+client = TestClient(main.app)
+
+
+def test_empty_batch_is_unprocessable():
+    response = client.post("/api/v1/tickets:batch", json=[])
+    assert response.status_code == 422
+    assert response.json()["status"] == "error"
+
+
+def test_empty_ndjson_batch_is_unprocessable():
+    response = client.post("/api/v1/tickets:batch", content=b"\n\n", headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 422
+    assert response.json()["status"] == "error"
+
+
+def test_batch_without_a_valid_ticket_is_rejected():
+    response = client.post("/api/v1/tickets:batch", json=[{"userInput": "my card was blocked"}])
+    assert response.status_code == 400
+    body = response.json()
+    assert body["status"] == "rejected"
+    assert body["rejected"] == 1
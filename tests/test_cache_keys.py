@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workers"))
+from cache_keys import NormalizedHashKeyStrategy, normalize_text, personalize, shareable_part  # noqa: E402
+
+
+def test_name_inside_other_words_is_kept():
+    assert normalize_text("My balance is wrong", "Al") == "my balance is wrong"
+
+
+def test_name_that_is_a_word_of_the_complaint_is_kept():
+    keys = NormalizedHashKeyStrategy()
+    assert normalize_text("I did not authorize this payment", "Not") == "i did not authorize this payment"
+    assert keys.key_for("I did not authorize this payment", "Not") != keys.key_for("I did authorize this payment", "Not")
+
+
+def test_name_introducing_the_sender_is_removed():
+    keys = NormalizedHashKeyStrategy()
+    assert keys.key_for("Hi, I'm Al. My card was blocked. Regards, Al", "Al") == \
+        keys.key_for("Hi, I'm Jean Dupont. My card was blocked. Regards, Jean Dupont", "Jean Dupont")
+
+
+def test_cached_part_keeps_no_customer_fields():
+    ticket = {"title": "Blocked card", "originalInput": "my card ..", "customerName": "Al", "customerId": "42", "id": "t1"}
+    assert shareable_part(ticket) == {"title": "Blocked card"}
+
+
+def test_shared_part_gets_the_current_customer_fields():
+    cached = {"title": "Blocked card", "customerName": "Al", "customerId": "42", "originalInput": "Al's text"}
+    ticket = personalize(cached, "t2", "Jean's text", "Jean", None)
+    assert ticket == {"title": "Blocked card", "customerName": "Jean", "customerId": "", "originalInput": "Jean's text", "id": "t2"}
+
+
+def test_rejection_is_not_given_ticket_fields():
+    assert personalize({"error": "Non-banking query rejected"}, "t3", "weather?") == {"error": "Non-banking query rejected", "id": "t3"}
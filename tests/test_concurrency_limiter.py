@@ -0,0 +1,71 @@
+import threading
+import time
+
+from concurrency_limiter import AIMDLimiter
+
+
+def run(limiter, overloaded=False):
+    limiter.release(limiter.acquire(), overloaded=overloaded)
+
+
+def test_successes_grow_the_limit_by_about_one_per_window():
+    limiter = AIMDLimiter(initial=4, max_limit=64)
+    for _ in range(4):
+        run(limiter)
+    assert limiter.limit == 4
+    assert 4.9 < limiter._limit < 5
+    run(limiter)
+    assert limiter.limit == 5
+
+
+def test_overload_multiplies_the_limit_by_backoff():
+    limiter = AIMDLimiter(initial=10, backoff=0.5)
+    run(limiter, overloaded=True)
+    assert limiter.limit == 5
+    assert limiter.in_flight == 0
+
+
+def test_one_burst_of_failures_counts_once():
+    limiter = AIMDLimiter(initial=16, backoff=0.5)
+    started = [limiter.acquire() for _ in range(8)]
+    for start in started:
+        limiter.release(start, overloaded=True)
+    assert limiter.limit == 8
+    # a request started after that decrease may lower it again
+    run(limiter, overloaded=True)
+    assert limiter.limit == 4
+
+
+def test_success_slower_than_the_target_is_overload():
+    limiter = AIMDLimiter(initial=10, backoff=0.5, latency_target=0.5)
+    limiter.release(limiter.acquire() - 1.0)
+    assert limiter.limit == 5
+    run(limiter)
+    assert limiter.limit == 5
+
+
+def test_limit_stays_within_min_and_max():
+    limiter = AIMDLimiter(initial=100, min_limit=2, max_limit=3, backoff=0.1)
+    assert limiter.limit == 3
+    for _ in range(20):
+        run(limiter)
+    assert limiter.limit == 3
+    for _ in range(5):
+        run(limiter, overloaded=True)
+    assert limiter.limit == 2
+
+
+def test_acquire_gives_up_at_the_limit():
+    limiter = AIMDLimiter(initial=1)
+    started = limiter.acquire()
+    assert limiter.acquire(timeout=0.05) is None
+    assert limiter.in_flight == 1
+
+    waiter = []
+    thread = threading.Thread(target=lambda: waiter.append(limiter.acquire(timeout=2)))
+    thread.start()
+    time.sleep(0.05)
+    limiter.release(started)
+    thread.join(2)
+    assert waiter and waiter[0] is not None
+    assert limiter.in_flight == 1
@@ -0,0 +1,57 @@
+import json
+import re
+
+import jsonschema
+import pytest
+
+from prompts.prompt import BankingPrompts
+from stub_engine import StubEngine
+
+SCHEMA = BankingPrompts.get_ticket_json_schema()
+TICKET, REJECTION = SCHEMA["anyOf"]
+
+
+def prompt_field(name):
+    '''the "a|b|c" choices the system prompt offers for `name`'''
+    return re.search(rf'"{name}": "([^"]*)"', BankingPrompts.SYSTEM_PROMPT).group(1).split("|")
+
+
+def test_enums_match_the_choices_in_the_prompt():
+    assert set(TICKET["properties"]["severity"]["enum"]) == set(prompt_field("severity"))
+    assert set(TICKET["properties"]["typeOfTicket"]["enum"]) == set(prompt_field("typeOfTicket"))
+    assert set(TICKET["properties"]["impactedDepartment"]["enum"]) == set(prompt_field("impactedDepartment"))
+
+
+def test_routing_only_names_known_departments():
+    assert set(BankingPrompts.get_department_routing()) <= set(BankingPrompts.get_impacted_departments())
+
+
+def test_few_shot_examples_use_known_values():
+    for example in BankingPrompts.EXAMPLES[:-1]:
+        output = json.loads(example["output"])
+        for name in ("severity", "typeOfTicket", "impactedDepartment"):
+            assert output[name] in TICKET["properties"][name]["enum"]
+    jsonschema.validate(json.loads(BankingPrompts.EXAMPLES[-1]["output"]), SCHEMA)
+    jsonschema.validate(BankingPrompts.get_rejection_response(), SCHEMA)
+
+
+@pytest.mark.parametrize("customer_text", [
+    "I was charged twice on my credit card, please call me",
+    "What's the best pizza topping?",
+])
+def test_guided_output_is_valid(customer_text):
+    prompt = BankingPrompts.get_ticket_generation_prompt(customer_text, "T-1")
+    output = json.loads(StubEngine().guided_output(prompt, json.dumps(SCHEMA)))
+    jsonschema.validate(output, SCHEMA)
+
+
+def test_unknown_values_and_fields_are_refused():
+    prompt = BankingPrompts.get_ticket_generation_prompt("my card was stolen", "T-2")
+    ticket = json.loads(StubEngine().guided_output(prompt, SCHEMA))
+    for change in ({"impactedDepartment": "Marketing"}, {"severity": "Urgent"}, {"priority": "High"}):
+        with pytest.raises(jsonschema.ValidationError):
+            jsonschema.validate({**ticket, **change}, SCHEMA)
+    missing = dict(ticket)
+    del missing["originalInput"]
+    with pytest.raises(jsonschema.ValidationError):
+        jsonschema.validate(missing, SCHEMA)
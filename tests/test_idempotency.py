@@ -0,0 +1,27 @@
+from idempotency import IdempotencyStore
+
+KEY = "ticket:id:t1"
+
+
+def test_finished_ticket_is_reused(redis_conn):
+    store = IdempotencyStore(redis_conn)
+    ticket = {"id": "t1", "summary": "card blocked"}
+    assert store.run("t1", "my card was blocked", lambda: ticket) == (ticket, IdempotencyStore.PROCESSED)
+    assert store.run("t1", "my card was blocked", lambda: None) == (ticket, IdempotencyStore.DONE)
+
+
+def test_failed_ticket_releases_its_marker(redis_conn):
+    store = IdempotencyStore(redis_conn)
+    assert store.run("t1", "my card was blocked", lambda: None) == (None, IdempotencyStore.PROCESSED)
+    assert redis_conn.get(KEY) is None
+
+
+def test_failed_ticket_leaves_a_marker_claimed_by_another_delivery(redis_conn):
+    store = IdempotencyStore(redis_conn)
+
+    def process():
+        # the marker ran out and another delivery of the id claimed it
+        redis_conn.set(KEY, IdempotencyStore.PENDING_MARKER + b"other")
+        return None
+    store.run("t1", "my card was blocked", process)
+    assert redis_conn.get(KEY) == IdempotencyStore.PENDING_MARKER + b"other"
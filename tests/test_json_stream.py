@@ -0,0 +1,44 @@
+import pytest
+
+from json_stream import JsonObjectScanner
+
+
+def feed_all(chunks):
+    scanner = JsonObjectScanner()
+    for count, chunk in enumerate(chunks, 1):
+        if scanner.feed(chunk):
+            return scanner, count
+    return scanner, None
+
+
+def test_object_completes_on_its_closing_brace():
+    scanner, fed = feed_all(['Here is the ticket: {"summ', 'ary": "card blocked", ', '"sentiment": "Negative"}', ' and more'])
+    assert fed == 3
+    assert scanner.parse() == {"summary": "card blocked", "sentiment": "Negative"}
+
+
+def test_nested_objects_keep_it_open():
+    scanner, _ = feed_all(['{"a": {"b": 1}', ', "c": 2}'])
+    assert scanner.parse() == {"a": {"b": 1}, "c": 2}
+
+
+def test_braces_and_escaped_quotes_inside_strings_are_ignored():
+    text = '{"summary": "customer wrote \\"}{\\" twice", "tags": ["{"]}'
+    scanner, fed = feed_all(list(text))
+    assert fed == len(text)
+    assert scanner.parse() == {"summary": 'customer wrote "}{" twice', "tags": ["{"]}
+
+
+def test_incomplete_object_cannot_be_read():
+    scanner, fed = feed_all(['{"summary": "card'])
+    assert fed is None and not scanner.complete
+    with pytest.raises(ValueError):
+        scanner.object_text()
+
+
+def test_cumulative_text_is_only_scanned_once():
+    scanner = JsonObjectScanner()
+    assert not scanner.feed_cumulative('{"a": ')
+    assert scanner.feed_cumulative('{"a": 1}')
+    assert scanner.feed_cumulative('{"a": 1} trailing')
+    assert scanner.object_text() == '{"a": 1}'
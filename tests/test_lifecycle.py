@@ -0,0 +1,51 @@
+import pytest
+
+from lifecycle import ServerLifecycle
+
+
+def test_normal_startup_ends_ready():
+    lifecycle = ServerLifecycle()
+    assert lifecycle.live and not lifecycle.ready
+    for state in (ServerLifecycle.LOADING, ServerLifecycle.WARMING_UP):
+        lifecycle.advance(state)
+        assert lifecycle.live and not lifecycle.ready
+    lifecycle.advance(ServerLifecycle.READY)
+    assert lifecycle.live and lifecycle.ready
+    status = lifecycle.describe()
+    assert status["status"] == "ready"
+    assert set(status["phase_seconds"]) == {"starting", "loading", "warming_up"}
+    assert "error" not in status
+
+
+def test_handed_in_engine_skips_loading():
+    lifecycle = ServerLifecycle()
+    lifecycle.advance(ServerLifecycle.WARMING_UP)
+    lifecycle.advance(ServerLifecycle.READY)
+    assert lifecycle.ready
+
+
+@pytest.mark.parametrize("path", [[], ["loading"], ["loading", "warming_up"], ["loading", "warming_up", "ready"]])
+def test_any_state_can_fail(path):
+    lifecycle = ServerLifecycle()
+    for state in path:
+        lifecycle.advance(state)
+    lifecycle.advance(ServerLifecycle.FAILED, error="CUDA out of memory")
+    assert not lifecycle.live and not lifecycle.ready
+    assert lifecycle.describe()["error"] == "CUDA out of memory"
+
+
+@pytest.mark.parametrize("path, state", [
+    ([], "ready"),
+    (["loading"], "ready"),
+    (["loading", "warming_up", "ready"], "loading"),
+    (["failed"], "ready"),
+    (["failed"], "failed"),
+])
+def test_illegal_transitions_are_refused(path, state):
+    lifecycle = ServerLifecycle()
+    for step in path:
+        lifecycle.advance(step)
+    before = lifecycle.state
+    with pytest.raises(ValueError):
+        lifecycle.advance(state)
+    assert lifecycle.state == before
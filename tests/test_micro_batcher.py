@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from micro_batcher import MicroBatcher
+
+
+def test_items_waiting_together_go_out_as_one_batch():
+    batches = []
+    batcher = MicroBatcher(lambda items: batches.append(items) or [item * 2 for item in items],
+                           max_items=8, max_wait_ms=200, max_concurrent_batches=1)
+    futures = [batcher.submit(i) for i in range(5)]
+    assert [future.result(timeout=2) for future in futures] == [0, 2, 4, 6, 8]
+    batcher.close()
+    assert batches == [[0, 1, 2, 3, 4]]
+
+
+def test_batches_are_capped_at_max_items():
+    batches = []
+    batcher = MicroBatcher(lambda items: batches.append(items) or items, max_items=3, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(7)]
+    assert [future.result(timeout=2) for future in futures] == list(range(7))
+    batcher.close()
+    assert max(len(batch) for batch in batches) <= 3
+    assert sorted(item for batch in batches for item in batch) == list(range(7))
+
+
+def test_items_pile_up_while_every_sender_is_busy():
+    release = threading.Event()
+    batches = []
+
+    def send(items):
+        batches.append(items)
+        release.wait(2)
+        return items
+    batcher = MicroBatcher(send, max_items=16, max_wait_ms=0, max_concurrent_batches=1)
+    first = batcher.submit("first")
+    while not batches:
+        time.sleep(0.001)
+    rest = [batcher.submit(i) for i in range(4)]
+    release.set()
+    assert first.result(timeout=2) == "first"
+    assert [future.result(timeout=2) for future in rest] == [0, 1, 2, 3]
+    batcher.close()
+    assert batches == [["first"], [0, 1, 2, 3]]
+
+
+def test_a_failed_batch_fails_every_item():
+    def send(items):
+        raise ConnectionError("AI server unreachable")
+    batcher = MicroBatcher(send, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result(timeout=2)
+    batcher.close()
+
+
+def test_a_wrong_number_of_results_fails_the_batch():
+    batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(2)]
+    with pytest.raises(ValueError, match="2 items"):
+        futures[0].result(timeout=2)
+    batcher.close()
+
+
+def test_close_flushes_what_is_queued():
+    batcher = MicroBatcher(lambda items: items, max_wait_ms=1000)
+    future = batcher.submit("last")
+    batcher.close()
+    assert future.result(timeout=0) == "last"
@@ -0,0 +1,83 @@
+import os
+import sys
+
+import pika
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from publisher import PublishError, RabbitPublisher, _PooledChannel  # noqa: E402
+
+
+class FakeChannel:
+
+    '''a transactional channel whose broker routes nothing when `unroutable`'''
+
+    def __init__(self, connection, unroutable):
+        self.connection = connection
+        self.unroutable = unroutable
+        self.is_open = True
+        self.on_return = None
+        self.committed = []
+        self._transaction = []
+
+    def tx_select(self):
+        pass
+
+    def add_on_return_callback(self, callback):
+        self.on_return = callback
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self._transaction.append((routing_key, body, properties, mandatory))
+
+    def tx_commit(self):
+        for routing_key, body, properties, mandatory in self._transaction:
+            if self.unroutable and mandatory:
+                method = pika.spec.Basic.Return(312, "NO_ROUTE", "exchange", routing_key)
+                self.connection.pending.append(lambda m=method, p=properties, b=body: self.on_return(self, m, p, b))
+            elif not self.unroutable:
+                self.committed.append(body)
+        self._transaction = []
+
+
+class FakeConnection:
+
+    def __init__(self, unroutable):
+        self.unroutable = unroutable
+        self.is_open = True
+        self.pending = []
+
+    def channel(self):
+        return FakeChannel(self, self.unroutable)
+
+    def process_data_events(self, time_limit=0):
+        pending, self.pending = self.pending, []
+        for event in pending:
+            event()
+
+
+def publisher_with(unroutable):
+    publisher = RabbitPublisher(None, "exchange", "queue", "key", max_retries=0)
+    slot = _PooledChannel.__new__(_PooledChannel)
+    slot.connection = FakeConnection(unroutable)
+    slot.channel = slot.connection.channel()
+    slot.tx_channel = None
+    slot.returned = []
+    released = []
+    publisher._acquire = lambda: slot
+    publisher._release = released.append
+    publisher._discard = lambda slot: pytest.fail("a returned batch must not discard its slot")
+    return publisher, slot, released
+
+
+def test_batch_is_committed():
+    publisher, slot, released = publisher_with(unroutable=False)
+    publisher.publish_batch([b"a", b"b"])
+    assert slot.tx_channel.committed == [b"a", b"b"]
+    assert released == [slot]
+
+
+def test_unroutable_batch_raises_and_keeps_the_slot():
+    publisher, slot, released = publisher_with(unroutable=True)
+    with pytest.raises(PublishError, match="2 of 2 messages as unroutable"):
+        publisher.publish_batch([b"a", b"b"])
+    assert released == [slot]
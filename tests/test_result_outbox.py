@@ -0,0 +1,61 @@
+from result_publisher import ResultOutbox
+
+
+def messages(count, start=0):
+    return [(f"ticket {i}".encode(), {"traceparent": str(i)}) for i in range(start, start + count)]
+
+
+def test_replay_publishes_in_order_and_empties_the_outbox(redis_conn):
+    outbox = ResultOutbox(redis_conn, batch_size=2)
+    outbox.add(messages(5))
+    published = []
+    assert outbox.replay(published.extend) == 5
+    assert published == messages(5)
+    assert redis_conn.llen(ResultOutbox.KEY) == 0
+    assert redis_conn.get(ResultOutbox.LOCK_KEY) is None
+
+
+def test_replay_stops_without_trimming_once_the_lock_is_lost(redis_conn):
+    outbox = ResultOutbox(redis_conn, batch_size=2)
+    outbox.add(messages(4))
+
+    def publish_slowly(batch):
+        # the lock ran out during the publish and another worker took it
+        redis_conn.set(ResultOutbox.LOCK_KEY, "other worker")
+    assert outbox.replay(publish_slowly) == 2
+    assert redis_conn.llen(ResultOutbox.KEY) == 4
+    assert redis_conn.get(ResultOutbox.LOCK_KEY) == b"other worker"
+
+
+def test_replay_is_skipped_while_another_worker_holds_the_lock(redis_conn):
+    outbox = ResultOutbox(redis_conn)
+    outbox.add(messages(1))
+    redis_conn.set(ResultOutbox.LOCK_KEY, "other worker", nx=True, px=30000)
+    assert outbox.replay(lambda batch: None) == 0
+    assert redis_conn.llen(ResultOutbox.KEY) == 1
+
+
+def test_every_batch_renews_the_lock(redis_conn):
+    outbox = ResultOutbox(redis_conn, lock_ttl_ms=30000, batch_size=1)
+    outbox.add(messages(2))
+    ttls = []
+
+    def publish(batch):
+        if ttls:
+            # the first batch's trim renewed the lock the test shortened
+            ttls.append(redis_conn.pttl(ResultOutbox.LOCK_KEY))
+        else:
+            redis_conn.pexpire(ResultOutbox.LOCK_KEY, 50)
+            ttls.append(redis_conn.pttl(ResultOutbox.LOCK_KEY))
+    assert outbox.replay(publish) == 2
+    assert ttls[0] <= 50 < 29000 < ttls[1]
+
+
+def test_release_leaves_a_lock_taken_over_by_another_worker(redis_conn):
+    outbox = ResultOutbox(redis_conn)
+    outbox.add(messages(1))
+
+    def publish(batch):
+        redis_conn.set(ResultOutbox.LOCK_KEY, "other worker")
+    outbox.replay(publish)
+    assert redis_conn.get(ResultOutbox.LOCK_KEY) == b"other worker"
@@ -0,0 +1,54 @@
+import sys
+import time
+
+from supervisor import WorkerPool
+
+CRASHING = [sys.executable, "-c", "raise SystemExit(1)"]
+SLEEPING = [sys.executable, "-c", "import time; time.sleep(30)"]
+
+
+def wait_for_exit(pool):
+    for process in pool.running.values():
+        process.wait()
+
+
+def test_crashed_worker_restarts_after_a_growing_backoff():
+    pool = WorkerPool(CRASHING, restart_backoff=0.2, restart_backoff_max=0.4, crash_alert_after=3)
+    pool.scale_to(1)
+    delays = []
+    for _ in range(3):
+        wait_for_exit(pool)
+        pool.reap()
+        assert pool.running == {} and pool.size == 1
+        delays.append(pool.restarting[0] - time.monotonic())
+        pool.reap()  # too early: still waiting
+        assert pool.running == {}
+        time.sleep(pool.restarting[0] - time.monotonic())
+        pool.reap()
+        assert list(pool.running) == [0]
+    assert 0.1 < delays[0] < 0.2 < delays[1] <= 0.4
+    assert delays[2] <= 0.4
+    assert pool.crashes[0] == 3
+    pool.stop_all()
+
+
+def test_scaling_down_cancels_a_pending_restart():
+    pool = WorkerPool(CRASHING, restart_backoff=60)
+    pool.scale_to(1)
+    wait_for_exit(pool)
+    pool.reap()
+    assert pool.restarting
+    pool.scale_to(0)
+    assert pool.size == 0 and not pool.restarting
+
+
+def test_worker_that_stayed_up_starts_the_crash_count_over():
+    pool = WorkerPool(SLEEPING, restart_backoff=0.2, stable_seconds=0)
+    pool.crashes[0] = 4
+    pool.scale_to(1)
+    pool.running[0].kill()
+    wait_for_exit(pool)
+    pool.reap()
+    assert pool.crashes[0] == 1
+    assert pool.restarting[0] - time.monotonic() <= 0.2
+    pool.scale_to(0)
@@ -0,0 +1,29 @@
+import time
+
+from ticket_cache import TicketCache
+
+PENDING_KEY = "ticket:pending:key"
+
+
+def test_marker_is_renewed_while_the_generation_runs(redis_conn):
+    cache = TicketCache(redis_conn, lock_ttl_ms=150)
+    held = []
+
+    def compute():
+        time.sleep(0.5)
+        held.append(redis_conn.get(PENDING_KEY))
+        return {"summary": "card blocked"}
+    assert cache.get_or_compute("key", compute) == ({"summary": "card blocked"}, TicketCache.GENERATED)
+    assert held[0] is not None
+    assert redis_conn.get(PENDING_KEY) is None
+
+
+def test_marker_taken_over_by_another_worker_is_left_alone(redis_conn):
+    cache = TicketCache(redis_conn, lock_ttl_ms=30000)
+
+    def compute():
+        # the marker ran out and another worker claimed the key
+        redis_conn.set(PENDING_KEY, b"other worker")
+        return {"error": "not cacheable"}
+    cache.get_or_compute("key", compute)
+    assert redis_conn.get(PENDING_KEY) == b"other worker"
@@ -0,0 +1,94 @@
+import pytest
+
+from stub_engine import StubTokenizer
+from token_budget import TokenBudget
+
+PREFIX = "few-shot prefix " * 25  # 400 characters, 100 tokens of 4
+
+
+class CountingTokenizer(StubTokenizer):
+
+    def __init__(self):
+        super().__init__(chars_per_token=4)
+        self.encoded = []
+
+    def encode(self, text, add_special_tokens=False):
+        self.encoded.append(text)
+        return super().encode(text, add_special_tokens)
+
+
+def make_budget(**kwargs):
+    kwargs.setdefault("max_model_len", 1024)
+    return TokenBudget(CountingTokenizer(), PREFIX, **kwargs)
+
+
+def test_prefix_is_tokenized_once():
+    budget = make_budget()
+    assert budget.prefix_tokens == 100
+    budget.tokenizer.encoded.clear()
+    assert budget.count_prompt(PREFIX + "the customer's text") == 100 + 5
+    assert budget.tokenizer.encoded == ["the customer's text"]
+
+
+def test_input_budget_leaves_room_for_the_text_twice():
+    budget = make_budget(max_input_tokens=1024)
+    assert budget.input_budget == (1024 - 100 - TokenBudget.TAIL_RESERVE - TokenBudget.OUTPUT_RESERVE) // 2
+    assert make_budget(max_input_tokens=50).input_budget == 50
+    with pytest.raises(ValueError):
+        make_budget(max_model_len=600)
+
+
+def test_long_input_keeps_its_beginning_and_end():
+    budget = make_budget(max_input_tokens=40)
+    short = "my card was declined"
+    assert budget.fit_input(short) == (short, 5)
+
+    text = "B" * 200 + "M" * 400 + "E" * 200
+    fitted, tokens = budget.fit_input(text)
+    assert tokens == 200
+    assert budget.count(fitted) <= budget.input_budget
+    head, tail = fitted.split(TokenBudget.TRUNCATION_MARKER)
+    assert text.startswith(head) and text.endswith(tail)
+    assert len(head) > len(tail)
+
+
+def test_decode_budget_is_learned_per_kind():
+    budget = make_budget(max_tokens=512, min_samples=8, headroom=1.25)
+    # nothing learned yet: input plus max_tokens, within what is left of the context
+    assert budget.max_tokens_for("cards", prompt_tokens=300, input_tokens=50) == 50 + 512
+    assert budget.max_tokens_for("cards", prompt_tokens=900, input_tokens=50) == 1024 - 900
+
+    for _ in range(8):
+        budget.observe("cards", completion_tokens=150, input_tokens=50)
+    assert budget.max_tokens_for("cards", prompt_tokens=300, input_tokens=50) == 50 + 125
+    # kinds without enough samples of their own use the budget over all kinds
+    assert budget.max_tokens_for("loans", prompt_tokens=300, input_tokens=20) == 20 + 125
+    assert budget.describe()["output_overhead"] == {"*": 125, "cards": 125}
+
+
+def test_learned_overhead_is_clamped():
+    budget = make_budget(max_tokens=200, min_tokens=64, min_samples=8)
+    for _ in range(8):
+        budget.observe("short", completion_tokens=10, input_tokens=5)
+        budget.observe("long", completion_tokens=1000, input_tokens=5)
+    assert budget.max_tokens_for("short", prompt_tokens=300, input_tokens=5) == 5 + 64
+    assert budget.max_tokens_for("long", prompt_tokens=300, input_tokens=5) == 5 + 200
+
+
+def test_truncated_ticket_doubles_its_kinds_overhead():
+    budget = make_budget(max_tokens=512, min_samples=8)
+    for _ in range(8):
+        budget.observe("cards", completion_tokens=150, input_tokens=50)
+    max_tokens = budget.max_tokens_for("cards", prompt_tokens=300, input_tokens=50)
+    budget.observe_truncated("cards", max_tokens, input_tokens=50)
+    assert budget.max_tokens_for("cards", prompt_tokens=300, input_tokens=50) == 50 + 250
+    budget.observe_truncated("cards", 50 + 250, input_tokens=50)
+    budget.observe_truncated("cards", 50 + 500, input_tokens=50)
+    assert budget.max_tokens_for("cards", prompt_tokens=300, input_tokens=50) == 50 + 512
+
+
+def test_fixed_budget_when_not_adaptive():
+    budget = make_budget(max_tokens=300, adaptive=False, min_samples=8)
+    for _ in range(8):
+        budget.observe("cards", completion_tokens=60, input_tokens=50)
+    assert budget.max_tokens_for("cards", prompt_tokens=300, input_tokens=50) == 50 + 300
@@ -0,0 +1,162 @@
+from typing import List, Optional, Union
+import time
+import orjson
+import requests
+
+from ai_router import AiRouter, NoReplicaReady
+from cache_keys import normalize_text
+from concurrency_limiter import AIMDLimiter
+from micro_batcher import MicroBatcher
+import worker_metrics as metrics
+from worker_tracing import tracer, inject_headers
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+from opentelemetry.trace import Link, SpanKind
+
+
+# statuses the AI server answers with when it sheds load
+OVERLOAD_STATUSES = (429, 503)
+
+
+class AiServerOverloaded(Exception):
+    '''the AI server refused a ticket because it is saturated (429/503)'''
+
+
+class AiClient:
+
+    '''talks to the AI server replicas through an AiRouter. with batch_max_items > 1, concurrent calls to
+    `generate` are grouped by a MicroBatcher and sent together to a replica's /generate_batch.
+    with a `limiter`, every ticket takes a slot first, so the number of tickets in flight on the
+    AI servers follows their latency and overload answers instead of the worker's thread count'''
+
+    def __init__(self, generate_urls: Union[str, List[str]], batch_urls: Union[str, List[str], None] = None, timeout: float = 30,
+                 batch_max_items: int = 1, batch_max_wait_ms: float = 10, max_concurrent_batches: int = 4,
+                 limiter: Optional[AIMDLimiter] = None, limiter_wait: Optional[float] = None,
+                 router_options: Optional[dict] = None):
+        if isinstance(generate_urls, str):
+            generate_urls = [generate_urls]
+        if isinstance(batch_urls, str):
+            batch_urls = [batch_urls]
+        self.router = AiRouter.from_urls(generate_urls, batch_urls, **(router_options or {}))
+        # even a single AI server answers 503 while its model loads: tickets wait for it to be ready
+        # instead of spending their retries
+        self.router.start_health_checks()
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+        self.limiter = limiter
+        self.limiter_wait = timeout if limiter_wait is None else limiter_wait
+
+        self.batcher = None
+        if batch_max_items > 1:
+            self.batcher = MicroBatcher(
+                self._send_batch,
+                max_items=batch_max_items,
+                max_wait_ms=batch_max_wait_ms,
+                max_concurrent_batches=max_concurrent_batches,
+                name="ai-batcher",
+            )
+
+    def generate(self, payload: dict) -> Optional[dict]:
+        '''returns the generated ticket json, or None if the AI server could not produce one'''
+        started = self.limiter.acquire(self.limiter_wait) if self.limiter is not None else 0.0
+        if started is None:
+            print(f"ERROR : no AI request slot freed up within {self.limiter_wait}s, the AI server is saturated")
+            return None
+
+        overloaded = False
+        try:
+            if self.batcher is None:
+                return self._send_one(payload)
+            # one HTTP call carries many tickets, so each item takes its own traceparent along
+            result = self.batcher.submit(inject_headers(payload)).result()
+            if isinstance(result, Exception):
+                raise result
+            return result
+        except NoReplicaReady as e:
+            print(f"ERROR : {e}")
+            return None
+        except (AiServerOverloaded, requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            overloaded = True
+            print(f"ERROR : AI server is overloaded or unreachable : {e}")
+            return None
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"ERROR : Cloud not get response from vLLM : {e}")
+            return None
+        finally:
+            if self.limiter is not None:
+                self.limiter.release(started, overloaded)
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+        self.router.close()
+
+    def _send_one(self, payload: dict) -> dict:
+        # the same wording goes to the same replica, whose prefix cache already holds it
+        replica = self.router.acquire(affinity_key=normalize_text(payload.get("userInput") or ""))
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracer.start_as_current_span("POST /generate", kind=SpanKind.CLIENT,
+                                              attributes={"server.address": replica.base_url}):
+                response = replica.session.post(replica.generate_url, headers=inject_headers(self.headers), data=orjson.dumps(payload), timeout=self.timeout)
+                if response.status_code in OVERLOAD_STATUSES:
+                    outcome = "overloaded"
+                    raise AiServerOverloaded(f"/generate answered {response.status_code}")
+                outcome = "error" if response.status_code >= 500 else "ok"
+                response.raise_for_status()
+                try:
+                    result = orjson.loads(response.content)
+                except orjson.JSONDecodeError:
+                    raise ValueError(f"AI server returned a non-JSON response: {response.text}") from None
+        except (AiServerOverloaded, requests.exceptions.RequestException, ValueError):
+            metrics.AI_REQUESTS.labels("generate", "error").inc()
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            metrics.AI_REQUEST_LATENCY.labels("generate").observe(latency)
+            self.router.release(replica, latency=latency if outcome == "ok" else None, failed=outcome == "error")
+        metrics.AI_REQUESTS.labels("generate", "ok").inc()
+        return result
+
+    def _send_batch(self, payloads: List[dict]) -> List[Optional[dict]]:
+        '''results in payload order; None for a failed ticket, AiServerOverloaded for one the server shed'''
+        metrics.AI_BATCH_SIZE.observe(len(payloads))
+        started = time.perf_counter()
+        # runs on the batcher's thread: linked to every ticket in the batch rather than parented by one
+        links = []
+        for payload in payloads:
+            span_context = trace.get_current_span(extract(payload)).get_span_context()
+            if span_context.is_valid:
+                links.append(Link(span_context))
+        replica = self.router.acquire(weight=len(payloads))
+        outcome = "error"
+        try:
+            with tracer.start_as_current_span("POST /generate_batch", kind=SpanKind.CLIENT, links=links,
+                                              attributes={"batch.size": len(payloads), "server.address": replica.base_url}):
+                response = replica.session.post(replica.batch_url, headers=inject_headers(self.headers), data=orjson.dumps({"items": payloads}), timeout=self.timeout)
+                if response.status_code in OVERLOAD_STATUSES:
+                    outcome = "overloaded"
+                    raise AiServerOverloaded(f"/generate_batch answered {response.status_code}")
+                outcome = "error" if response.status_code >= 500 else "ok"
+                response.raise_for_status()
+        except (AiServerOverloaded, requests.exceptions.RequestException):
+            metrics.AI_REQUESTS.labels("generate_batch", "error").inc()
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            metrics.AI_REQUEST_LATENCY.labels("generate_batch").observe(latency)
+            self.router.release(replica, weight=len(payloads), latency=latency if outcome == "ok" else None,
+                                failed=outcome == "error")
+        metrics.AI_REQUESTS.labels("generate_batch", "ok").inc()
+
+        results = []
+        for payload, item in zip(payloads, orjson.loads(response.content)["results"]):
+            if item["status"] in OVERLOAD_STATUSES:
+                results.append(AiServerOverloaded(f"ticket {payload.get('id')} was shed ({item['status']})"))
+            elif item["status"] >= 400:
+                print(f"ERROR : AI server failed ticket {payload.get('id')} ({item['status']}): {item['result']}")
+                results.append(None)
+            else:
+                results.append(item["result"])
+        return results
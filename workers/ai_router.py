@@ -0,0 +1,189 @@
+from typing import List, Optional
+import hashlib
+import random
+import statistics
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class NoReplicaReady(Exception):
+    '''no AI server replica passed its readiness probe within the router's `ready_wait`'''
+
+
+class Replica:
+
+    '''one AI server: its endpoints, a keep-alive session, and what the router knows about it'''
+
+    def __init__(self, generate_url: str, batch_url: Optional[str] = None, pool_size: int = 16):
+        self.generate_url = generate_url
+        self.base_url = generate_url.rstrip("/").rsplit("/", 1)[0]
+        self.batch_url = batch_url or self.base_url + "/generate_batch"
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.outstanding = 0
+        self.requests = 0
+        self.latency = None  # EWMA of successful request latencies, seconds
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.ejected_until <= now
+
+    def __repr__(self):
+        return f"Replica({self.base_url})"
+
+
+class AiRouter:
+
+    '''spreads requests over several AI server replicas.
+    picks by power of two choices on outstanding requests. with an affinity key the two candidates are the
+    key's top two replicas by rendezvous hashing, and the first wins unless it is clearly busier, so the same
+    input keeps landing on the replica that already has it in its prefix cache.
+    replicas that are not ready (their /health/ready probe fails, e.g. still loading or warming up)
+    are skipped until it passes again. with health checks on, replicas start out not ready, and while none is,
+    `acquire` waits (up to `ready_wait` seconds) rather than sending tickets to be refused; replicas failing
+    `max_failures` requests in a row, or whose latency is `slow_factor` times the median of the others
+    (once they all have `min_samples` latencies), are ejected for `eject_seconds`. the last available replica is never ejected'''
+
+    def __init__(self, replicas: List[Replica], health_path: str = "/health/ready", health_interval: float = 5,
+                 health_timeout: float = 2, max_failures: int = 3, slow_factor: float = 3.0,
+                 eject_seconds: float = 30, min_samples: int = 20, affinity_slack: int = 2, latency_decay: float = 0.1,
+                 ready_wait: float = 600):
+        if not replicas:
+            raise ValueError("at least one AI server endpoint is required")
+        self.replicas = replicas
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_failures = max_failures
+        self.slow_factor = slow_factor
+        self.eject_seconds = eject_seconds
+        self.min_samples = min_samples
+        self.affinity_slack = affinity_slack
+        self.latency_decay = latency_decay
+        self.ready_wait = ready_wait
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    @classmethod
+    def from_urls(cls, generate_urls: List[str], batch_urls: Optional[List[str]] = None, pool_size: int = 16, **kwargs) -> "AiRouter":
+        batch_urls = batch_urls or [None] * len(generate_urls)
+        if len(batch_urls) != len(generate_urls):
+            raise ValueError(f"{len(batch_urls)} batch URLs for {len(generate_urls)} AI server endpoints")
+        return cls([Replica(url, batch_url, pool_size) for url, batch_url in zip(generate_urls, batch_urls)], **kwargs)
+
+    def start_health_checks(self):
+        '''probes every replica's readiness endpoint on a background thread. the replicas count as not ready
+        until their first probe passes'''
+        if self._health_thread is None and self.health_interval > 0:
+            with self._lock:
+                for replica in self.replicas:
+                    replica.healthy = False
+            self._health_thread = threading.Thread(target=self._health_loop, name="ai-health", daemon=True)
+            self._health_thread.start()
+
+    def close(self):
+        self._stop.set()
+        with self._ready:
+            self._ready.notify_all()
+        if self._health_thread is not None:
+            self._health_thread.join()
+        for replica in self.replicas:
+            replica.session.close()
+
+    def acquire(self, affinity_key: Optional[str] = None, weight: int = 1) -> Replica:
+        '''picks a replica and counts `weight` requests as outstanding on it until `release`.
+        raises NoReplicaReady if none is ready within `ready_wait` seconds, or the router is closed meanwhile'''
+        deadline = time.monotonic() + self.ready_wait
+        with self._ready:
+            replica = self._pick(affinity_key)
+            if replica is None:
+                print("no AI server is ready, holding the ticket until one is")
+            while replica is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop.is_set():
+                    raise NoReplicaReady(f"no AI server was ready within {self.ready_wait:g}s")
+                # ejections run out on their own, so wake up now and then even without a probe passing
+                self._ready.wait(min(remaining, self.eject_seconds, self.health_interval or remaining))
+                replica = self._pick(affinity_key)
+            replica.outstanding += weight
+            replica.requests += weight
+            return replica
+
+    def release(self, replica: Replica, weight: int = 1, latency: Optional[float] = None, failed: bool = False):
+        '''ends requests started by `acquire`. `latency` is for successes, `failed` for errors and timeouts'''
+        now = time.monotonic()
+        with self._lock:
+            replica.outstanding -= weight
+            if failed:
+                replica.consecutive_failures += 1
+                if replica.consecutive_failures >= self.max_failures:
+                    self._eject(replica, now, f"{replica.consecutive_failures} failed requests in a row")
+                return
+            replica.consecutive_failures = 0
+            if latency is not None:
+                if replica.latency is None:
+                    replica.latency = latency
+                else:
+                    replica.latency += self.latency_decay * (latency - replica.latency)
+                replica.samples += 1
+                self._eject_if_slow(replica, now)
+
+    def _pick(self, affinity_key: Optional[str]) -> Optional[Replica]:
+        now = time.monotonic()
+        candidates = [r for r in self.replicas if r.available(now)]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        if affinity_key is None:
+            first, second = random.sample(candidates, 2)
+            return first if first.outstanding <= second.outstanding else second
+        first, second = sorted(candidates, key=lambda r: self._rendezvous(affinity_key, r), reverse=True)[:2]
+        return first if first.outstanding <= second.outstanding + self.affinity_slack else second
+
+    @staticmethod
+    def _rendezvous(key: str, replica: Replica) -> int:
+        digest = hashlib.blake2b(f"{replica.base_url}|{key}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def _eject_if_slow(self, replica: Replica, now: float):
+        if replica.samples < self.min_samples:
+            return
+        others = [r.latency for r in self.replicas if r is not replica and r.samples >= self.min_samples and r.available(now)]
+        if others and replica.latency > self.slow_factor * statistics.median(others):
+            self._eject(replica, now, f"latency {replica.latency:.2f}s vs {statistics.median(others):.2f}s median")
+
+    def _eject(self, replica: Replica, now: float, reason: str):
+        if not any(r.available(now) for r in self.replicas if r is not replica):
+            return
+        replica.ejected_until = now + self.eject_seconds
+        replica.consecutive_failures = 0
+        # judged afresh when it comes back
+        replica.latency = None
+        replica.samples = 0
+        print(f"ejecting AI server {replica.base_url} for {self.eject_seconds:.0f}s: {reason}")
+
+    def _health_loop(self):
+        # first round right away, so a replica that is still starting gets no tickets
+        while not self._stop.is_set():
+            for replica in self.replicas:
+                try:
+                    healthy = replica.session.get(replica.base_url + self.health_path, timeout=self.health_timeout).ok
+                except requests.exceptions.RequestException:
+                    healthy = False
+                if healthy != replica.healthy:
+                    print(f"AI server {replica.base_url} is {'ready' if healthy else 'not ready'}")
+                with self._ready:
+                    replica.healthy = healthy
+                    if healthy:
+                        self._ready.notify_all()
+            self._stop.wait(self.health_interval)
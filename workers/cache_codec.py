@@ -0,0 +1,44 @@
+from typing import Optional
+import zlib
+
+import msgpack
+import orjson
+
+
+class CacheCodec:
+
+    '''compact encoding of cached AI results: one version byte, then the payload.
+    0x01 is msgpack, 0x02 is zlib-compressed msgpack, used once the value is larger than
+    `compress_above` bytes (the long resolutionSuggestion texts compress well).
+    values written as plain JSON text before this format are still read'''
+
+    MSGPACK = b"\x01"
+    MSGPACK_ZLIB = b"\x02"
+
+    def __init__(self, compress_above: Optional[int] = 256, compression_level: int = 6):
+        self.compress_above = compress_above
+        self.compression_level = compression_level
+
+    def encode(self, value: dict) -> bytes:
+        packed = msgpack.packb(value, use_bin_type=True)
+        if self.compress_above is not None and len(packed) > self.compress_above:
+            compressed = zlib.compress(packed, self.compression_level)
+            if len(compressed) < len(packed):
+                return self.MSGPACK_ZLIB + compressed
+        return self.MSGPACK + packed
+
+    def decode(self, raw) -> dict:
+        '''raises ValueError for data it can't read'''
+        if isinstance(raw, str):
+            raw = raw.encode()
+        version, payload = raw[:1], raw[1:]
+        try:
+            if version == self.MSGPACK:
+                return msgpack.unpackb(payload, raw=False)
+            if version == self.MSGPACK_ZLIB:
+                return msgpack.unpackb(zlib.decompress(payload), raw=False)
+            if version in (b"{", b"["):
+                return orjson.loads(raw)
+        except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, zlib.error, UnicodeDecodeError) as e:
+            raise ValueError(f"Corrupt cache value: {e}") from e
+        raise ValueError(f"Unknown cache value version {version!r}")
@@ -0,0 +1,157 @@
+from typing import Optional
+import hashlib
+import re
+import unicodedata
+
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+# words after which a message names its sender: "i'm al", "my name is al", "regards al"
+_NAME_INTRODUCTIONS = ("my name is", "name is", "i am", "i m", "im", "this is", "it s", "regards", "thanks",
+                       "thank you", "sincerely", "cheers", "best", "from", "hi", "hello", "dear")
+
+# fields of a generated ticket that belong to the customer who sent it, not to the complaint
+CUSTOMER_FIELDS = ("customerName", "customerId", "originalInput")
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def normalize_text(text: str, customerName: Optional[str] = None) -> str:
+    '''folds the trivial differences between two wordings of the same complaint:
+    unicode forms, case, punctuation, whitespace and the customer's own name. the name is only dropped
+    as whole words where a message introduces or signs off its sender ("my name is al", "regards al"),
+    so "Al" leaves "balance" alone and "Not" leaves "i did not authorize" alone'''
+    text = _fold(text)
+    name = _fold(customerName) if customerName else ""
+    if name:
+        name = re.escape(name)
+        introductions = "|".join(re.escape(words) for words in _NAME_INTRODUCTIONS)
+        text = re.sub(rf"\b((?:{introductions}) ){name}(?= |$)", r"\1", text)
+        text = _WHITESPACE.sub(" ", text).strip()
+    return text
+
+
+def shareable_part(ticket: dict) -> dict:
+    '''the AI result as it may be cached: tickets of different customers share keys, so it keeps
+    neither the ticket id nor the customer's own fields'''
+    return {field: value for field, value in ticket.items() if field != "id" and field not in CUSTOMER_FIELDS}
+
+
+def personalize(ai_part: dict, id, userInput: str, customerName: Optional[str] = None, customerId: Optional[str] = None) -> dict:
+    '''a cached AI result made into this customer's ticket. the customer fields are always set from the
+    message, which also covers results cached with another customer's fields'''
+    ticket = dict(ai_part)
+    if "error" not in ticket:
+        ticket["originalInput"] = userInput
+        ticket["customerName"] = customerName or ""
+        ticket["customerId"] = customerId or ""
+    ticket["id"] = id
+    return ticket
+
+
+class CacheKeyStrategy:
+
+    '''maps a ticket's text to the redis key its AI result is cached under'''
+
+    name = "base"
+
+    def key_for(self, userInput: str, customerName: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    def remember(self, userInput: str, key: str, customerName: Optional[str] = None):
+        '''called once a result has been cached under `key`'''
+
+
+class RawKeyStrategy(CacheKeyStrategy):
+
+    '''the original behaviour: the raw user text is the key'''
+
+    name = "raw"
+
+    def key_for(self, userInput: str, customerName: Optional[str] = None) -> str:
+        return f"ticket:{userInput}"
+
+
+class NormalizedHashKeyStrategy(CacheKeyStrategy):
+
+    '''normalized text hashed to a fixed-size key, so long inputs don't make huge keys'''
+
+    name = "normalized"
+
+    def key_for(self, userInput: str, customerName: Optional[str] = None) -> str:
+        normalized = normalize_text(userInput, customerName)
+        return f"ticket:n:{hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()}"
+
+
+class SimHashKeyStrategy(CacheKeyStrategy):
+
+    '''near-duplicate matching: texts whose 64-bit simhash differ in at most `max_distance` bits share a key.
+    fingerprints are indexed in redis by four 16-bit bands; two fingerprints within 3 bits of each other
+    always agree on at least one band, so a lookup only has to check four small sets'''
+
+    name = "simhash"
+    BANDS = 4
+    BAND_BITS = 16
+
+    def __init__(self, redis_conn, max_distance: int = 3, index_ttl: int = 3600):
+        self.redis_conn = redis_conn
+        self.max_distance = max_distance
+        self.index_ttl = index_ttl
+
+    @staticmethod
+    def fingerprint(normalized: str) -> int:
+        words = normalized.split()
+        # words and word pairs, so word order still matters a little
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        weights = [0] * 64
+        for feature in features:
+            feature_hash = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), "big")
+            for bit in range(64):
+                weights[bit] += 1 if feature_hash >> bit & 1 else -1
+        return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self.BAND_BITS) - 1
+        for band in range(self.BANDS):
+            value = fingerprint >> (band * self.BAND_BITS) & mask
+            yield f"ticket:simhash:{band}:{value:04x}"
+
+    def key_for(self, userInput: str, customerName: Optional[str] = None) -> str:
+        fingerprint = self.fingerprint(normalize_text(userInput, customerName))
+
+        pipe = self.redis_conn.pipeline(transaction=False)
+        for band_key in self._band_keys(fingerprint):
+            pipe.smembers(band_key)
+        candidates = set().union(*pipe.execute())
+
+        best, best_distance = fingerprint, self.max_distance + 1
+        for candidate in candidates:
+            candidate = int(candidate, 16)
+            distance = bin(candidate ^ fingerprint).count("1")
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return f"ticket:s:{best:016x}"
+
+    def remember(self, userInput: str, key: str, customerName: Optional[str] = None):
+        fingerprint = key.rsplit(":", 1)[-1]
+        pipe = self.redis_conn.pipeline(transaction=False)
+        for band_key in self._band_keys(int(fingerprint, 16)):
+            pipe.sadd(band_key, fingerprint)
+            pipe.expire(band_key, self.index_ttl)
+        pipe.execute()
+
+
+def build_cache_key_strategy(name: str, redis_conn=None, simhash_max_distance: int = 3, index_ttl: int = 3600) -> CacheKeyStrategy:
+    '''picks the strategy named by CACHE_KEY_STRATEGY'''
+    name = (name or "normalized").lower()
+    if name == RawKeyStrategy.name:
+        return RawKeyStrategy()
+    if name == NormalizedHashKeyStrategy.name:
+        return NormalizedHashKeyStrategy()
+    if name == SimHashKeyStrategy.name:
+        return SimHashKeyStrategy(redis_conn, max_distance=simhash_max_distance, index_ttl=index_ttl)
+    raise ValueError(f"Unknown cache key strategy '{name}' (expected raw, normalized or simhash)")
@@ -0,0 +1,55 @@
+from typing import Optional
+import threading
+import time
+
+
+class AIMDLimiter:
+
+    '''adaptive cap on concurrent requests to the AI server: additive increase, multiplicative decrease.
+    a request that succeeds within `latency_target` seconds grows the limit by 1/limit (about +1 once the
+    whole window completed); an overload signal (429/503, timeout, refused connection, or a success slower
+    than the target) multiplies it by `backoff`. only requests started after the last decrease can lower
+    it again, so one burst of failures counts as one signal instead of collapsing the limit to the minimum'''
+
+    def __init__(self, initial: int = 8, min_limit: int = 1, max_limit: int = 64, backoff: float = 0.7,
+                 latency_target: Optional[float] = None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._changed = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[float]:
+        '''blocks until a request may start. returns its start time, to hand back to `release`,
+        or None if no slot freed up within `timeout`'''
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._in_flight < self.limit, timeout):
+                return None
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, overloaded: bool = False):
+        '''ends a request started by `acquire`, adjusting the limit from how it went'''
+        now = time.monotonic()
+        if not overloaded and self.latency_target is not None and now - started > self.latency_target:
+            overloaded = True
+        with self._changed:
+            self._in_flight -= 1
+            if overloaded:
+                if started >= self._last_decrease:
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._changed.notify_all()
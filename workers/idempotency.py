@@ -0,0 +1,106 @@
+from typing import Callable, Optional, Tuple
+import hashlib
+import time
+import uuid
+
+from cache_codec import CacheCodec
+from local_cache import SingleFlight
+import redis_lock
+from worker_metrics import REDIS_LATENCY
+from worker_tracing import tracer
+
+
+class IdempotencyStore:
+
+    '''per-ticket record in redis, keyed by the ticket id, so a redelivered or re-submitted ticket is
+    not generated again. `ticket:id:<id>` holds either a pending marker (b"P" + owner token, expiring
+    after `pending_ttl_ms` in case its worker dies) while the ticket is processed, or the finished
+    ticket for `ttl` seconds (codec encoded, with a fingerprint of its input).
+    `run` returns the finished ticket of an earlier delivery, waits for one being processed elsewhere,
+    or processes the ticket itself. a failed ticket leaves no record, so its retry runs normally'''
+
+    # what run() did, besides processing the ticket itself
+    PROCESSED = "processed"
+    DONE = "done"  # an earlier delivery had finished it
+    PENDING = "pending"  # waited for a delivery being processed
+    PENDING_MARKER = b"P"
+
+    def __init__(self, redis_conn, ttl: int = 86400, pending_ttl_ms: int = 90000, wait_timeout: float = 90,
+                 poll_interval_ms: float = 50, codec: Optional[CacheCodec] = None):
+        self.redis_conn = redis_conn
+        self.codec = codec or CacheCodec()
+        self.ttl = ttl
+        self.pending_ttl_ms = pending_ttl_ms
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval_ms / 1000
+        self.single_flight = SingleFlight()
+
+    @staticmethod
+    def fingerprint(userInput: str) -> str:
+        return hashlib.blake2b(userInput.encode("utf-8"), digest_size=8).hexdigest()
+
+    def run(self, id: str, userInput: str, process: Callable[[], Optional[dict]]) -> Tuple[Optional[dict], str]:
+        '''returns (processed ticket or None, how it was obtained)'''
+        # two deliveries of one id in this worker share a call, across workers the redis record decides
+        (ticket, state), shared = self.single_flight.do(id, lambda: self._run_across_workers(id, userInput, process))
+        return ticket, self.PENDING if shared else state
+
+    def _run_across_workers(self, id: str, userInput: str, process) -> Tuple[Optional[dict], str]:
+        key = f"ticket:id:{id}"
+        fingerprint = self.fingerprint(userInput)
+        token = self.PENDING_MARKER + uuid.uuid4().hex.encode()
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+
+        while True:
+            with REDIS_LATENCY.labels("claim").time(), tracer.start_as_current_span("redis claim ticket id"):
+                claimed = self.redis_conn.set(key, token, nx=True, px=self.pending_ttl_ms)
+            if claimed:
+                return self._process(key, fingerprint, token, process), self.PROCESSED
+
+            ticket, state = self._read(key, fingerprint)
+            if ticket is not None:
+                return ticket, self.PENDING if waited else self.DONE
+            if state is None:
+                continue  # the record expired or its delivery failed: try to take over
+            if state != self.PENDING:
+                # a record for another input under the same id: process this one
+                return self._process(key, fingerprint, token, process, claimed=False), self.PROCESSED
+            if time.monotonic() >= deadline:
+                # waited long enough, process it ourselves rather than failing the ticket
+                return self._process(key, fingerprint, token, process, claimed=False), self.PROCESSED
+
+            # another delivery is being processed: wait for its result, or for its marker to go away
+            waited = True
+            time.sleep(self.poll_interval)
+
+    def _read(self, key: str, fingerprint: str) -> Tuple[Optional[dict], Optional[str]]:
+        '''(finished ticket for this input or None, record state: pending, done or None when there is none)'''
+        with REDIS_LATENCY.labels("get").time(), tracer.start_as_current_span("redis get ticket id"):
+            raw = self.redis_conn.get(key)
+        if raw is None:
+            return None, None
+        if raw.startswith(self.PENDING_MARKER):
+            return None, self.PENDING
+        try:
+            record = self.codec.decode(raw)
+        except ValueError as e:
+            print(f"ignoring ticket record {key}: {e}")
+            return None, self.DONE
+        if record.get("input") != fingerprint:
+            print(f"ticket id {key[len('ticket:id:'):]} was already used for another input, processing it again")
+            return None, self.DONE
+        return record["ticket"], self.DONE
+
+    def _process(self, key: str, fingerprint: str, token: bytes, process, claimed: bool = True) -> Optional[dict]:
+        ticket = None
+        try:
+            ticket = process()
+            return ticket
+        finally:
+            if ticket is not None:
+                with REDIS_LATENCY.labels("set").time(), tracer.start_as_current_span("redis set ticket id"):
+                    self.redis_conn.set(key, self.codec.encode({"input": fingerprint, "ticket": ticket}), ex=self.ttl)
+            elif claimed:
+                # only our own marker: another delivery may have claimed the id since it ran out
+                redis_lock.release(self.redis_conn, key, token)
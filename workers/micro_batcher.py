@@ -0,0 +1,82 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List
+import queue
+import threading
+import time
+
+
+class MicroBatcher:
+
+    '''collects items submitted from many threads and hands them to `send_batch` in groups.
+    up to `max_concurrent_batches` groups can be in flight at once. a group is formed when a sender
+    is free: it takes everything already waiting, then keeps collecting until it has `max_items`
+    items or `max_wait_ms` have passed. with max_wait_ms=0 nothing is delayed, items only get
+    grouped when they pile up while every sender is busy.
+    `send_batch` gets a list of items and must return a list of results in the same order'''
+
+    _STOP = object()
+
+    def __init__(self, send_batch: Callable[[List[Any]], List[Any]], max_items: int = 16, max_wait_ms: float = 10,
+                 max_concurrent_batches: int = 4, name: str = "micro-batcher"):
+        self.send_batch = send_batch
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000
+        self._pending = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix=name)
+        self._free_senders = threading.Semaphore(max_concurrent_batches)
+        self._collector = threading.Thread(target=self._collect_loop, name=name, daemon=True)
+        self._collector.start()
+
+    def submit(self, item) -> Future:
+        '''queues one item, the returned future resolves to its result from `send_batch`'''
+        future = Future()
+        self._pending.put((item, future))
+        return future
+
+    def close(self):
+        '''flushes what is already queued and stops the batcher'''
+        self._pending.put(self._STOP)
+        self._collector.join()
+        self._senders.shutdown(wait=True)
+
+    def _collect_loop(self):
+        while True:
+            first = self._pending.get()
+            if first is self._STOP:
+                return
+
+            # while every sender is busy, new items queue up and join this group
+            self._free_senders.acquire()
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_items:
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._pending.get(timeout=remaining) if remaining > 0 else self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is self._STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+
+            self._senders.submit(self._send, batch)
+            if stopping:
+                return
+
+    def _send(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.send_batch(items)
+            if len(results) != len(items):
+                raise ValueError(f"send_batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._free_senders.release()
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,54 @@
+from concurrent.futures import Future
+import itertools
+import queue
+import threading
+
+
+class PriorityExecutor:
+
+    '''fixed pool of threads that always picks the most urgent waiting task next.
+    higher priority runs first (same as AMQP message priority), equal priorities run in submission order'''
+
+    _STOP = object()
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "priority"):
+        self._tasks = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{thread_name_prefix}_{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, priority: int, fn, *args, **kwargs) -> Future:
+        future = Future()
+        self._tasks.put((-priority, next(self._sequence), (future, fn, args, kwargs)))
+        return future
+
+    def pending(self) -> int:
+        return self._tasks.qsize()
+
+    def shutdown(self, wait: bool = True):
+        '''lets the threads finish every task already submitted, then stops them'''
+        for _ in self._threads:
+            # after all real tasks, whatever their priority
+            self._tasks.put((float("inf"), next(self._sequence), self._STOP))
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self):
+        while True:
+            _, _, task = self._tasks.get()
+            if task is self._STOP:
+                return
+            future, fn, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+from typing import Dict
+import threading
+import time
+
+import redis
+
+
+# KEYS: lock. ARGV: token
+RELEASE_IF_HOLDER = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# KEYS: lock. ARGV: token, ttl (ms)
+RENEW_IF_HOLDER = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def release(redis_conn, key: str, token) -> bool:
+    '''deletes the lock only while `token` holds it: one that ran out may be another worker's by now'''
+    return bool(redis_conn.eval(RELEASE_IF_HOLDER, 1, key, token))
+
+
+class LockRenewer:
+
+    '''keeps the redis locks (SET NX PX markers) this process holds from running out while their work
+    runs: every third of `ttl_ms` a background thread sets each one back to `ttl_ms`, as long as its
+    token still holds it. a worker that dies stops renewing, so its locks still expire'''
+
+    def __init__(self, redis_conn, ttl_ms: int, name: str = "lock-renewer"):
+        self.redis_conn = redis_conn
+        self.ttl_ms = ttl_ms
+        self.name = name
+        self._held: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @contextmanager
+    def hold(self, key: str, token: bytes):
+        '''renews `key`, taken with `token`, until the block exits, then releases it'''
+        with self._lock:
+            self._held[key] = token
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._renew_loop, name=self.name, daemon=True)
+                self._thread.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._held.pop(key, None)
+            release(self.redis_conn, key, token)
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(self.ttl_ms / 3000)
+            with self._lock:
+                held = list(self._held.items())
+            for key, token in held:
+                try:
+                    renewed = self.redis_conn.eval(RENEW_IF_HOLDER, 1, key, token, self.ttl_ms)
+                except redis.exceptions.RedisError as e:
+                    print(f"couldn't renew {key}, retrying : {e}")
+                    continue
+                if not renewed:
+                    print(f"{key} ran out before it was renewed, another worker may be on it too")
+                    with self._lock:
+                        if self._held.get(key) == token:
+                            del self._held[key]
@@ -0,0 +1,46 @@
+from typing import Any, List, Tuple
+
+from micro_batcher import MicroBatcher
+from worker_metrics import REDIS_PIPELINE_SIZE
+
+
+class PipelinedRedis:
+
+    '''wraps a redis client so that get/set/exists/delete calls made at the same time from different
+    executor threads share one pipeline round trip. nothing is delayed while redis keeps up
+    (max_wait_ms=0): commands are grouped only when they pile up behind pipelines in flight.
+    every other method goes straight to the wrapped client'''
+
+    PIPELINED = ("get", "set", "exists", "delete")
+
+    def __init__(self, redis_conn, max_commands: int = 64, max_wait_ms: float = 0, max_concurrent_pipelines: int = 2):
+        self.redis_conn = redis_conn
+        self.batcher = MicroBatcher(
+            self._execute,
+            max_items=max_commands,
+            max_wait_ms=max_wait_ms,
+            max_concurrent_batches=max_concurrent_pipelines,
+            name="redis-pipeline",
+        )
+
+    def __getattr__(self, name):
+        if name in self.PIPELINED:
+            return lambda *args, **kwargs: self._call(name, args, kwargs)
+        return getattr(self.redis_conn, name)
+
+    def close(self):
+        self.batcher.close()
+
+    def _call(self, name: str, args, kwargs):
+        result = self.batcher.submit((name, args, kwargs)).result()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _execute(self, commands: List[Tuple[str, tuple, dict]]) -> List[Any]:
+        REDIS_PIPELINE_SIZE.observe(len(commands))
+        pipe = self.redis_conn.pipeline(transaction=False)
+        for name, args, kwargs in commands:
+            getattr(pipe, name)(*args, **kwargs)
+        # one failing command must not fail the others queued with it
+        return pipe.execute(raise_on_error=False)
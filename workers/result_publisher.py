@@ -0,0 +1,189 @@
+from typing import Callable, List, Optional, Tuple
+import time
+import uuid
+
+import pika
+import redis
+from opentelemetry.trace import SpanKind
+
+from cache_codec import CacheCodec
+import redis_lock
+import worker_metrics as metrics
+from worker_tracing import tracer
+
+
+# a processed ticket on its way out: message body and its headers (trace context)
+Message = Tuple[bytes, Optional[dict]]
+
+
+class ResultOutbox:
+
+    '''processed tickets the broker didn't take, in a redis list (`ticket:outbox`) shared by the workers.
+    replaying holds a lock (SET NX PX) so two workers don't publish the same entries, and entries leave
+    the list only once the broker took them: a worker dying mid-replay leaves them for the next one.
+    the lock is renewed with every batch, and only while this worker still holds it: one whose lock ran
+    out (a batch slower than `lock_ttl_ms`) stops without trimming what the new holder is replaying'''
+
+    KEY = "ticket:outbox"
+    LOCK_KEY = "ticket:outbox:lock"
+
+    # KEYS: outbox, lock. ARGV: token, entries published, lock ttl (ms)
+    TRIM_IF_HOLDER = """
+if redis.call("get", KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call("ltrim", KEYS[1], ARGV[2], -1)
+redis.call("pexpire", KEYS[2], ARGV[3])
+return 1
+"""
+
+    def __init__(self, redis_conn, codec: Optional[CacheCodec] = None, lock_ttl_ms: int = 30000, batch_size: int = 100):
+        self.redis_conn = redis_conn
+        self.codec = codec or CacheCodec()
+        self.lock_ttl_ms = lock_ttl_ms
+        self.batch_size = batch_size
+
+    def add(self, messages: List[Message]):
+        '''raises redis errors: the caller must not ack tickets the outbox didn't take'''
+        self.redis_conn.rpush(self.KEY, *(self.codec.encode({"body": body, "headers": headers}) for body, headers in messages))
+
+    def replay(self, publish: Callable[[List[Message]], None]) -> int:
+        '''hands the entries to `publish` in order, batch by batch, and returns how many went out.
+        `publish` raising stops the replay, the entries it didn't take stay in the outbox'''
+        token = uuid.uuid4().hex
+        if not self.redis_conn.set(self.LOCK_KEY, token, nx=True, px=self.lock_ttl_ms):
+            return 0  # another worker is replaying
+        replayed = 0
+        try:
+            while True:
+                raw = self.redis_conn.lrange(self.KEY, 0, self.batch_size - 1)
+                if not raw:
+                    return replayed
+                messages = []
+                for entry in raw:
+                    try:
+                        record = self.codec.decode(entry)
+                    except ValueError as e:
+                        print(f"dropping unreadable outbox entry : {e}")
+                        continue
+                    messages.append((record["body"], record.get("headers")))
+                publish(messages)
+                replayed += len(messages)
+                # new entries are appended at the tail, the head is what was just published
+                if not self.redis_conn.eval(self.TRIM_IF_HOLDER, 2, self.KEY, self.LOCK_KEY, token, len(raw), self.lock_ttl_ms):
+                    print("the outbox lock ran out mid-replay, leaving the rest to the worker holding it now")
+                    return replayed
+        finally:
+            redis_lock.release(self.redis_conn, self.LOCK_KEY, token)
+
+
+class ResultPublisher:
+
+    '''publishes processed tickets to the outgoing queue in batches. runs on the connection thread only.
+    a batch goes out on a transactional channel of its own: BlockingChannel waits for every publisher
+    confirm separately, tx_commit answers for the whole batch in one round trip, once the broker has
+    taken (and, the queue being durable, written) every message. a batch is sent once it has
+    `max_batch` tickets or its first ticket waited `max_wait_ms`; more tickets finishing during a
+    commit make the next batch bigger.
+    each ticket's `on_done(safe)` runs after its batch: safe is True once the broker or, failing that,
+    the outbox has the result, and only then may its delivery be acked'''
+
+    def __init__(self, exchange: str, routing_key: str, outbox: Optional[ResultOutbox] = None,
+                 max_batch: int = 64, max_wait_ms: float = 5):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.outbox = outbox
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.connection = None
+        self.channel = None
+        self.pending: List[Tuple[bytes, Optional[dict], Callable[[bool], None]]] = []
+        self._timer = None
+        self._spilled = False
+
+    def open(self, connection):
+        '''binds to the worker's connection, at startup and after every reconnect'''
+        self.connection = connection
+        self._timer = None
+        self._open_channel()
+
+    def publish(self, body: bytes, headers: Optional[dict], on_done: Callable[[bool], None]):
+        self.pending.append((body, headers, on_done))
+        if len(self.pending) >= self.max_batch or self.max_wait <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.connection.call_later(self.max_wait, self._on_timer)
+
+    def flush(self):
+        '''sends the pending tickets now, spilling them to the outbox if the broker doesn't take them'''
+        if self._timer is not None:
+            self.connection.remove_timeout(self._timer)
+            self._timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            self._send([(body, headers) for body, headers, _ in batch])
+            safe = True
+        except pika.exceptions.AMQPError as e:
+            print(f"!! Failed to publish {len(batch)} processed tickets to RabbitMQ : {e!r}")
+            safe = self._spill(batch)
+        for _, _, on_done in batch:
+            on_done(safe)
+        if safe and self._spilled and self.channel is not None and self.channel.is_open:
+            self.replay_outbox()
+
+    def replay_outbox(self):
+        '''publishes what the outbox holds, from this worker or another one'''
+        if self.outbox is None:
+            return
+        try:
+            replayed = self.outbox.replay(self._send)
+            self._spilled = False
+        except (pika.exceptions.AMQPError, redis.exceptions.RedisError) as e:
+            print(f"!! Failed to replay the result outbox, retrying after the next batch : {e!r}")
+            self._spilled = True
+            return
+        if replayed:
+            metrics.RESULT_OUTBOX.labels("replayed").inc(replayed)
+            print(f"replayed {replayed} processed tickets from the outbox to '{self.routing_key}'")
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
+
+    def _open_channel(self):
+        self.channel = self.connection.channel()
+        self.channel.tx_select()
+
+    def _send(self, messages: List[Message]):
+        if self.channel is None or not self.channel.is_open:
+            # the broker closed the channel (the connection may still be fine): a new one, or an AMQP error
+            self._open_channel()
+        with tracer.start_as_current_span("publish reasons", kind=SpanKind.PRODUCER,
+                                          attributes={"messaging.destination.name": self.routing_key,
+                                                      "messaging.batch.message_count": len(messages)}):
+            for body, headers in messages:
+                self.channel.basic_publish(
+                    exchange=self.exchange,
+                    routing_key=self.routing_key,
+                    body=body,
+                    properties=pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE, headers=headers),
+                )
+            started = time.perf_counter()
+            self.channel.tx_commit()
+        metrics.RESULT_COMMIT_LATENCY.observe(time.perf_counter() - started)
+        metrics.RESULT_BATCH_SIZE.observe(len(messages))
+
+    def _spill(self, batch) -> bool:
+        if self.outbox is None:
+            return False
+        try:
+            self.outbox.add([(body, headers) for body, headers, _ in batch])
+        except redis.exceptions.RedisError as e:
+            print(f"!! Failed to spill {len(batch)} processed tickets to the outbox, they will be redelivered : {e!r}")
+            return False
+        self._spilled = True
+        metrics.RESULT_OUTBOX.labels("spilled").inc(len(batch))
+        print(f"spilled {len(batch)} processed tickets to the outbox, they go out once RabbitMQ takes them again")
+        return True
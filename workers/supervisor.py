@@ -0,0 +1,339 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+import math
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pika
+import requests
+from dotenv import load_dotenv
+from prometheus_client import start_http_server
+
+import supervisor_metrics as metrics
+
+
+load_dotenv()
+
+
+@dataclass
+class QueueStats:
+
+    '''what the scaling policy knows about the incoming queue. the rates are messages per second,
+    None when the source can't tell'''
+
+    ready: int
+    consumers: int = 0
+    publish_rate: Optional[float] = None
+    ack_rate: Optional[float] = None
+
+
+class ManagementApiStats:
+
+    '''queue stats from the RabbitMQ management API (the rabbitmq:3-management image, port 15672).
+    the broker refreshes them every few seconds (collect_statistics_interval)'''
+
+    def __init__(self, url: str, user: str, password: str, queue: str, vhost: str = "/", timeout: float = 5):
+        self.queue_url = f"{url.rstrip('/')}/api/queues/{quote(vhost, safe='')}/{quote(queue, safe='')}"
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.timeout = timeout
+
+    def __call__(self) -> QueueStats:
+        response = self.session.get(self.queue_url, timeout=self.timeout)
+        response.raise_for_status()
+        queue = response.json()
+        message_stats = queue.get("message_stats", {})
+        return QueueStats(
+            ready=queue.get("messages_ready", 0),
+            consumers=queue.get("consumers", 0),
+            publish_rate=message_stats.get("publish_details", {}).get("rate", 0.0),
+            ack_rate=message_stats.get("ack_details", {}).get("rate", 0.0),
+        )
+
+
+class AmqpQueueStats:
+
+    '''fallback without the management plugin: a passive queue declare over AMQP, which tells only
+    the ready messages and the consumer count, so the policy scales on the backlog alone'''
+
+    def __init__(self, parameters: pika.ConnectionParameters, queue: str):
+        self.parameters = parameters
+        self.queue = queue
+        self.connection = None
+        self.channel = None
+
+    def __call__(self) -> QueueStats:
+        try:
+            if self.connection is None or self.connection.is_closed:
+                self.connection = pika.BlockingConnection(self.parameters)
+                self.channel = self.connection.channel()
+            declared = self.channel.queue_declare(queue=self.queue, passive=True)
+        except pika.exceptions.AMQPError:
+            self.connection = None
+            raise
+        return QueueStats(ready=declared.method.message_count, consumers=declared.method.consumer_count)
+
+
+class ScalingPolicy:
+
+    '''how many worker processes the incoming queue needs.
+    with publish and ack rates: enough workers to take the arrival rate at `target_utilization` of
+    their throughput, plus enough to work off the backlog within `drain_seconds`. the throughput of
+    one worker is learned from the ack rate while messages are waiting (the workers are saturated),
+    `initial_capacity` until then. without rates, or before the throughput is known: one worker
+    per `backlog_per_worker` waiting messages.
+    scaling up is immediate, `max_step` workers at a time. scaling down only goes to the highest
+    count wanted over the last `scale_down_delay` seconds, so a short lull doesn't drain workers
+    that are needed again a minute later'''
+
+    def __init__(self, min_workers: int = 1, max_workers: int = 8, target_utilization: float = 0.8,
+                 drain_seconds: float = 60, backlog_per_worker: int = 20, initial_capacity: Optional[float] = None,
+                 scale_down_delay: float = 300, max_step: int = 4, capacity_decay: float = 0.2):
+        if not 0 < min_workers <= max_workers:
+            raise ValueError(f"need 0 < min_workers <= max_workers, got {min_workers} and {max_workers}")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.target_utilization = target_utilization
+        self.drain_seconds = drain_seconds
+        self.backlog_per_worker = backlog_per_worker
+        self.capacity = initial_capacity  # tickets per second of one worker
+        self.scale_down_delay = scale_down_delay
+        self.max_step = max_step
+        self.capacity_decay = capacity_decay
+        self._wanted = deque()  # (time, workers wanted)
+
+    def desired(self, current: int, stats: QueueStats, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        self._learn_capacity(stats)
+        wanted = min(self.max_workers, max(self.min_workers, self._workers_for(stats)))
+
+        self._wanted.append((now, wanted))
+        while self._wanted[0][0] < now - self.scale_down_delay:
+            self._wanted.popleft()
+        if wanted >= current:
+            return min(wanted, current + self.max_step)
+        return min(current, max(workers for _, workers in self._wanted))
+
+    def _learn_capacity(self, stats: QueueStats):
+        # while messages wait, the ack rate is what the consumers can do, not what is asked of them
+        if stats.ack_rate is None or stats.ready <= 0 or stats.consumers <= 0 or stats.ack_rate <= 0:
+            return
+        measured = stats.ack_rate / stats.consumers
+        if self.capacity is None:
+            self.capacity = measured
+        else:
+            self.capacity += self.capacity_decay * (measured - self.capacity)
+
+    def _workers_for(self, stats: QueueStats) -> int:
+        if stats.publish_rate is None or self.capacity is None:
+            return math.ceil(stats.ready / self.backlog_per_worker)
+        for_arrivals = stats.publish_rate / (self.capacity * self.target_utilization)
+        for_backlog = stats.ready / (self.capacity * self.drain_seconds)
+        return math.ceil(for_arrivals + for_backlog)
+
+
+class WorkerPool:
+
+    '''the ticket worker processes. each one gets its own metrics port (`metrics_port_base` + its slot).
+    stopping a worker sends it SIGTERM: it stops consuming, finishes and acks the tickets it already
+    holds, then exits. one that takes longer than `drain_timeout` is killed, RabbitMQ then hands its
+    unacked tickets to the other workers. a worker that dies on its own is started again after
+    `restart_backoff` seconds, doubled with every crash in a row up to `restart_backoff_max` (one that stayed
+    up `stable_seconds` starts the count over), so one exiting at once (e.g. redis is down) doesn't restart
+    in a loop. a slot crashing `crash_alert_after` times in a row is reported as crash looping'''
+
+    def __init__(self, command: List[str], drain_timeout: float = 120, metrics_port_base: int = 0,
+                 env: Optional[Dict[str, str]] = None, restart_backoff: float = 5, restart_backoff_max: float = 300,
+                 stable_seconds: float = 60, crash_alert_after: int = 5):
+        self.command = command
+        self.drain_timeout = drain_timeout
+        self.metrics_port_base = metrics_port_base
+        self.env = env or {}
+        self.restart_backoff = restart_backoff
+        self.restart_backoff_max = restart_backoff_max
+        self.stable_seconds = stable_seconds
+        self.crash_alert_after = crash_alert_after
+        self.running: Dict[int, subprocess.Popen] = {}  # slot -> process
+        self.draining: List[Tuple[int, subprocess.Popen, float]] = []  # (slot, process, kill deadline)
+        self.restarting: Dict[int, float] = {}  # slot -> when its crashed worker is started again
+        self.crashes: Dict[int, int] = {}  # slot -> crashes in a row
+        self.started_at: Dict[int, float] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.running) + len(self.restarting)
+
+    def scale_to(self, workers: int):
+        while self.size < workers:
+            # a draining worker still holds its slot's metrics port
+            taken = set(self.running) | set(self.restarting) | {slot for slot, _, _ in self.draining}
+            self._start(min(slot for slot in range(len(taken) + 1) if slot not in taken))
+        while self.size > workers:
+            # the newest workers go first, slot 0 stays up across the day
+            slot = max(set(self.running) | set(self.restarting))
+            if slot in self.restarting:
+                del self.restarting[slot]
+            else:
+                self._stop(slot)
+        self._update_metrics()
+
+    def reap(self):
+        '''restarts workers that died once their backoff is over, collects drained ones and kills those
+        past their drain deadline'''
+        now = time.monotonic()
+        for slot, process in list(self.running.items()):
+            if process.poll() is not None:
+                del self.running[slot]
+                metrics.WORKER_EXITS.labels("crashed").inc()
+                stable = now - self.started_at.get(slot, now) >= self.stable_seconds
+                self.crashes[slot] = 1 if stable else self.crashes.get(slot, 0) + 1
+                delay = min(self.restart_backoff * 2 ** (self.crashes[slot] - 1), self.restart_backoff_max)
+                self.restarting[slot] = now + delay
+                print(f"worker {slot} (pid {process.pid}) exited with {process.returncode}, starting it again in {delay:.0f}s")
+                if self.crashes[slot] == self.crash_alert_after:
+                    print(f"!! worker {slot} crashed {self.crashes[slot]} times in a row, it is crash looping")
+        for slot, restart_at in list(self.restarting.items()):
+            if now >= restart_at:
+                del self.restarting[slot]
+                self._start(slot)
+        still_draining = []
+        for slot, process, deadline in self.draining:
+            if process.poll() is not None:
+                print(f"worker pid {process.pid} drained and exited")
+                metrics.WORKER_EXITS.labels("drained").inc()
+            elif now > deadline:
+                print(f"worker pid {process.pid} did not drain within {self.drain_timeout:.0f}s, killing it")
+                process.kill()
+                process.wait()
+                metrics.WORKER_EXITS.labels("killed").inc()
+            else:
+                still_draining.append((slot, process, deadline))
+        self.draining = still_draining
+        self._update_metrics()
+
+    def stop_all(self):
+        self.scale_to(0)
+        while self.draining:
+            time.sleep(0.5)
+            self.reap()
+
+    def _start(self, slot: int):
+        env = dict(os.environ, **self.env)
+        env["WORKER_METRICS_PORT"] = str(self.metrics_port_base + slot) if self.metrics_port_base else "0"
+        self.running[slot] = subprocess.Popen(self.command, env=env)
+        self.started_at[slot] = time.monotonic()
+        print(f"started worker {slot} (pid {self.running[slot].pid})")
+
+    def _stop(self, slot: int):
+        process = self.running.pop(slot)
+        print(f"draining worker {slot} (pid {process.pid})")
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            self.draining.append((slot, process, time.monotonic() + self.drain_timeout))
+
+    def _update_metrics(self):
+        metrics.WORKERS.labels("running").set(len(self.running))
+        metrics.WORKERS.labels("draining").set(len(self.draining))
+        metrics.WORKERS.labels("restarting").set(len(self.restarting))
+        metrics.CRASH_LOOPING.set(sum(
+            1 for slot, crashes in self.crashes.items()
+            if crashes >= self.crash_alert_after and (slot in self.restarting or slot in self.running)
+        ))
+
+
+class Supervisor:
+
+    '''polls the queue stats every `interval` seconds and scales the pool to what the policy asks for.
+    SIGTERM or CTRL+C drains every worker before exiting'''
+
+    def __init__(self, pool: WorkerPool, stats: Callable[[], QueueStats], policy: ScalingPolicy, interval: float = 15):
+        self.pool = pool
+        self.stats = stats
+        self.policy = policy
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.pool.scale_to(self.policy.min_workers)
+        while not self._stop.is_set():
+            self.pool.reap()
+            self.poll()
+            self._stop.wait(self.interval)
+        print("supervisor stopping, draining all workers ..")
+        self.pool.stop_all()
+        print("all workers drained. Exiting")
+
+    def poll(self):
+        try:
+            stats = self.stats()
+        except (requests.exceptions.RequestException, pika.exceptions.AMQPError, ValueError) as e:
+            # keep the pool as it is rather than scaling on missing data
+            print(f"couldn't read queue stats : {e}")
+            metrics.STATS_ERRORS.inc()
+            return
+        desired = self.policy.desired(self.pool.size, stats)
+        metrics.QUEUE_READY.set(stats.ready)
+        metrics.DESIRED_WORKERS.set(desired)
+        if self.policy.capacity is not None:
+            metrics.WORKER_CAPACITY.set(self.policy.capacity)
+        if desired != self.pool.size:
+            print(f"queue: {stats.ready} ready, {stats.consumers} consumers, publish {stats.publish_rate} /s, "
+                  f"ack {stats.ack_rate} /s -> scaling from {self.pool.size} to {desired} workers")
+            self.pool.scale_to(desired)
+
+
+def build_supervisor() -> Supervisor:
+    '''the supervisor as configured by the environment, next to the workers' own settings'''
+    rabbit_host = os.getenv("RABBITMQ_HOST", "localhost")
+    rabbit_user = os.getenv("RABBITMQ_USER", "user")
+    rabbit_pass = os.getenv("RABBITMQ_PASS", "password")
+    queue = os.getenv("RABBITMQ_INCOMING_QUEUE", "arena.assistance.classification.queue")
+
+    # "management" (rates and depth, needs the management plugin) or "amqp" (depth only)
+    if os.getenv("SUPERVISOR_STATS", "management").lower() == "amqp":
+        credentials = pika.PlainCredentials(rabbit_user, rabbit_pass)
+        stats = AmqpQueueStats(pika.ConnectionParameters(rabbit_host, 5672, '/', credentials), queue)
+    else:
+        stats = ManagementApiStats(os.getenv("RABBITMQ_MANAGEMENT_URL", f"http://{rabbit_host}:15672"), rabbit_user, rabbit_pass, queue)
+
+    capacity = os.getenv("SUPERVISOR_WORKER_CAPACITY")
+    policy = ScalingPolicy(
+        min_workers=int(os.getenv("SUPERVISOR_MIN_WORKERS", 1)),
+        max_workers=int(os.getenv("SUPERVISOR_MAX_WORKERS", 8)),
+        target_utilization=float(os.getenv("SUPERVISOR_TARGET_UTILIZATION", 0.8)),
+        drain_seconds=float(os.getenv("SUPERVISOR_BACKLOG_DRAIN_SECONDS", 60)),
+        backlog_per_worker=int(os.getenv("SUPERVISOR_BACKLOG_PER_WORKER", 20)),
+        initial_capacity=float(capacity) if capacity else None,
+        scale_down_delay=float(os.getenv("SUPERVISOR_SCALE_DOWN_DELAY_SECONDS", 300)),
+        max_step=int(os.getenv("SUPERVISOR_MAX_STEP", 4)),
+    )
+    pool = WorkerPool(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ticket_worker.py")],
+        drain_timeout=float(os.getenv("WORKER_DRAIN_TIMEOUT_SECONDS", 120)),
+        metrics_port_base=int(os.getenv("WORKER_METRICS_PORT", 8002)),
+        restart_backoff=float(os.getenv("WORKER_RESTART_BACKOFF_SECONDS", 5)),
+        restart_backoff_max=float(os.getenv("WORKER_RESTART_BACKOFF_MAX_SECONDS", 300)),
+        crash_alert_after=int(os.getenv("WORKER_CRASH_ALERT_AFTER", 5)),
+    )
+    return Supervisor(pool, stats, policy, interval=float(os.getenv("SUPERVISOR_INTERVAL_SECONDS", 15)))
+
+
+if __name__ == "__main__":
+    supervisor = build_supervisor()
+    metrics_port = int(os.getenv("SUPERVISOR_METRICS_PORT", 8010))
+    if metrics_port:
+        start_http_server(metrics_port)
+        print(f"supervisor metrics exposed on port {metrics_port}")
+    print(f"supervising {supervisor.policy.min_workers}-{supervisor.policy.max_workers} ticket workers. To exit press CTRL+C")
+    supervisor.run()
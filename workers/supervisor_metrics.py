@@ -0,0 +1,35 @@
+from prometheus_client import Counter, Gauge
+
+# prometheus metrics of the worker supervisor, served on SUPERVISOR_METRICS_PORT by supervisor.py
+
+WORKERS = Gauge(
+    "supervisor_workers",
+    "Worker processes by state: running (consuming), draining (finishing their tickets before exiting) "
+    "or restarting (crashed, waiting out their restart backoff).",
+    ["state"],
+)
+DESIRED_WORKERS = Gauge(
+    "supervisor_desired_workers",
+    "Worker processes the scaling policy asked for at the last poll.",
+)
+QUEUE_READY = Gauge(
+    "supervisor_queue_ready_messages",
+    "Messages waiting in the incoming queue at the last poll.",
+)
+WORKER_CAPACITY = Gauge(
+    "supervisor_worker_capacity_per_second",
+    "Tickets per second one worker process handles, as learned from the ack rate while the workers were saturated.",
+)
+WORKER_EXITS = Counter(
+    "supervisor_worker_exits_total",
+    "Worker processes that ended, by reason: drained, killed (drain timed out) or crashed (restarted).",
+    ["reason"],
+)
+CRASH_LOOPING = Gauge(
+    "supervisor_crash_looping_workers",
+    "Worker slots that crashed WORKER_CRASH_ALERT_AFTER times in a row without staying up; alert when above 0.",
+)
+STATS_ERRORS = Counter(
+    "supervisor_stats_errors_total",
+    "Polls where the queue stats could not be read; the pool is left as it is.",
+)
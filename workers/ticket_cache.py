@@ -0,0 +1,108 @@
+from typing import Callable, Optional, Tuple
+import time
+import uuid
+
+from cache_codec import CacheCodec
+from local_cache import LocalTTLCache, SingleFlight
+from redis_lock import LockRenewer
+from worker_metrics import REDIS_LATENCY
+from worker_tracing import tracer
+
+
+class TicketCache:
+
+    '''two-tier cache for AI results: an in-process LRU/TTL cache in front of redis.
+    misses go through `get_or_compute`, which makes sure only one generation runs per key:
+    callers in the same process share the call (SingleFlight), and workers in other processes
+    see a short `ticket:pending:` marker in redis and wait for the result instead of generating it too.
+    the marker is renewed for as long as the generation runs (which may include waiting for the limiter
+    or for an AI server to be ready), and expires `lock_ttl_ms` after a worker died with it.
+    values are stored in redis with `codec` (versioned msgpack), the client must not decode responses'''
+
+    # where a result came from, as returned by get_or_compute
+    LOCAL = "local hit"
+    REDIS = "redis hit"
+    COALESCED = "coalesced"
+    GENERATED = "generated"
+
+    def __init__(self, redis_conn, ttl: int = 3600, local_maxsize: int = 10000, local_ttl: float = 60,
+                 lock_ttl_ms: int = 35000, wait_timeout: float = 35, poll_interval_ms: float = 50,
+                 cacheable: Callable[[dict], bool] = lambda result: "error" not in result,
+                 codec: Optional[CacheCodec] = None):
+        self.redis_conn = redis_conn
+        self.codec = codec or CacheCodec()
+        self.ttl = ttl
+        self.local = LocalTTLCache(maxsize=local_maxsize, ttl=local_ttl)
+        self.single_flight = SingleFlight()
+        self.lock_ttl_ms = lock_ttl_ms
+        self.locks = LockRenewer(redis_conn, lock_ttl_ms, name="cache-lock-renewer")
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval_ms / 1000
+        self.cacheable = cacheable
+
+    def get(self, key: str) -> Tuple[Optional[dict], Optional[str]]:
+        value = self.local.get(key)
+        if value is not None:
+            return value, self.LOCAL
+
+        with REDIS_LATENCY.labels("get").time(), tracer.start_as_current_span("redis get"):
+            raw = self.redis_conn.get(key)
+        if raw is None:
+            return None, None
+        try:
+            value = self.codec.decode(raw)
+        except ValueError as e:
+            # unreadable entry (e.g. written by a newer worker): treat as a miss, it gets overwritten
+            print(f"ignoring cache value for {key}: {e}")
+            return None, None
+        self.local.set(key, value)
+        return value, self.REDIS
+
+    def set(self, key: str, value: dict):
+        with REDIS_LATENCY.labels("set").time(), tracer.start_as_current_span("redis set"):
+            self.redis_conn.set(key, self.codec.encode(value), ex=self.ttl)
+        self.local.set(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Optional[dict]]) -> Tuple[Optional[dict], Optional[str]]:
+        '''returns (result, source). `compute` runs at most once per key across the fleet at a time;
+        its result is cached when `cacheable` says so'''
+        value, source = self.get(key)
+        if value is not None:
+            return value, source
+
+        (value, source), shared = self.single_flight.do(key, lambda: self._compute_across_workers(key, compute))
+        return value, self.COALESCED if shared else source
+
+    def _compute_across_workers(self, key: str, compute) -> Tuple[Optional[dict], Optional[str]]:
+        pending_key = f"ticket:pending:{key}"
+        token = uuid.uuid4().hex.encode()  # bytes, as redis returns it
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            with REDIS_LATENCY.labels("claim").time(), tracer.start_as_current_span("redis claim"):
+                claimed = self.redis_conn.set(pending_key, token, nx=True, px=self.lock_ttl_ms)
+            if claimed:
+                with self.locks.hold(pending_key, token):
+                    # another worker may have finished between our miss and taking the marker
+                    value, source = self.get(key)
+                    if value is not None:
+                        return value, source
+                    value = compute()
+                    if value is not None and self.cacheable(value):
+                        self.set(key, value)
+                    return value, self.GENERATED
+
+            # someone else is generating this key: wait for their result
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                value, _ = self.get(key)
+                if value is not None:
+                    return value, self.COALESCED
+                if not self.redis_conn.exists(pending_key):
+                    break  # they finished without a cacheable result (or died), try to take over
+            else:
+                # waited long enough, generate it ourselves rather than failing the ticket
+                value = compute()
+                if value is not None and self.cacheable(value):
+                    self.set(key, value)
+                return value, self.GENERATED
@@ -1,16 +1,38 @@
 from typing import Optional
+import functools
+import signal
+import threading
 import pika
 import time
-import json
+import orjson
 import redis
-import requests
 import os
 from dotenv import load_dotenv
+from prometheus_client import start_http_server
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from ai_client import AiClient
+from concurrency_limiter import AIMDLimiter
+from cache_keys import build_cache_key_strategy, personalize, shareable_part
+from ticket_cache import TicketCache
+from idempotency import IdempotencyStore
+from result_publisher import ResultOutbox, ResultPublisher
+from cache_codec import CacheCodec
+from redis_pipeline import PipelinedRedis
+from priority_executor import PriorityExecutor
+import worker_metrics as metrics
+from worker_tracing import tracer, setup_tracing, context_from_headers, inject_headers
 
 
 
 load_dotenv()
 
+
+class InvalidTicket(ValueError):
+    '''a delivery that can never be processed, it goes straight to the dead-letter queue'''
+
+
 class TicketWorker:
     
     '''class presenting a worker that consumes ticket requests from RabbitMQ, process them using AI model, and caches the results on reids'''
@@ -20,9 +42,12 @@ class TicketWorker:
         self.rabbit_host = os.getenv("RABBITMQ_HOST","localhost")
         self.rabbit_user = os.getenv("RABBITMQ_USER","user")
         self.rabbit_pass = os.getenv("RABBITMQ_PASS","password")
-        self.vllm_api_url = os.getenv("VLLM_API_URL","http://localhost:8001/generate")
+        # one or more AI server replicas, comma separated; requests are balanced between them
+        self.vllm_api_urls = [url.strip() for url in os.getenv("VLLM_API_URL","http://localhost:8001/generate").split(",") if url.strip()]
+        batch_urls = os.getenv("VLLM_BATCH_API_URL")
+        self.vllm_batch_api_urls = [url.strip() for url in batch_urls.split(",")] if batch_urls else None
         
-        print(f"--- Worker configured to use AI Server at: {self.vllm_api_url} ---")
+        print(f"--- Worker configured to use AI Server at: {', '.join(self.vllm_api_urls)} ---")
         
         self.exchange_name = os.getenv("RABBITMQ_EXCHANGE", "arena.assistance.exchange")
         self.incoming_queue = os.getenv("RABBITMQ_INCOMING_QUEUE", "arena.assistance.classification.queue")
@@ -30,6 +55,86 @@ class TicketWorker:
         self.outgoing_queue = os.getenv("RABBITMQ_OUTGOING_QUEUE", "arena.assistance.reason.queue")
         self.outgoing_routing_key = os.getenv("RABBITMQ_OUTGOING_ROUTING_KEY", "assistance.reason")
         
+        # tickets that failed wait in the retry queue (a TTL queue dead-lettering back into the incoming one)
+        # and land in the dead-letter queue once they used up their retries or can't be processed at all
+        self.retry_queue = os.getenv("RABBITMQ_RETRY_QUEUE", "arena.assistance.classification.retry.queue")
+        self.retry_routing_key = os.getenv("RABBITMQ_RETRY_ROUTING_KEY", "assistance.classify.retry")
+        self.dead_letter_queue = os.getenv("RABBITMQ_DEAD_LETTER_QUEUE", "arena.assistance.classification.dead.queue")
+        self.dead_letter_routing_key = os.getenv("RABBITMQ_DEAD_LETTER_ROUTING_KEY", "assistance.classify.dead")
+        self.retry_delay_ms = int(os.getenv("TICKET_RETRY_DELAY_MS", 5000))
+        self.max_retries = int(os.getenv("TICKET_MAX_RETRIES", 5))
+        
+        # how many tickets are processed at once, and how many unacked messages RabbitMQ may push to us.
+        # a prefetch above the concurrency lets the executor pick the most urgent of the waiting tickets
+        self.concurrency = int(os.getenv("WORKER_CONCURRENCY", 1))
+        self.prefetch_count = int(os.getenv("WORKER_PREFETCH", self.concurrency))
+        self.executor = None
+        
+        # how many of those tickets may wait on the AI server at once, adapted to its latency and 429/503 answers
+        self.ai_limiter = AIMDLimiter(
+            initial=int(os.getenv("AI_CONCURRENCY_INITIAL", self.concurrency)),
+            min_limit=int(os.getenv("AI_CONCURRENCY_MIN", 1)),
+            max_limit=int(os.getenv("AI_CONCURRENCY_MAX", self.concurrency)),
+            latency_target=float(os.getenv("AI_LATENCY_TARGET_MS", 10000)) / 1000,
+        )
+        metrics.AI_CONCURRENCY_LIMIT.set_function(lambda: self.ai_limiter.limit)
+        
+        # cache misses are grouped into /generate_batch calls when AI_BATCH_MAX_ITEMS > 1
+        self.ai_client = AiClient(
+            self.vllm_api_urls,
+            batch_urls=self.vllm_batch_api_urls,
+            timeout=30,
+            batch_max_items=int(os.getenv("AI_BATCH_MAX_ITEMS", 1)),
+            batch_max_wait_ms=float(os.getenv("AI_BATCH_MAX_WAIT_MS", 10)),
+            limiter=self.ai_limiter,
+            router_options={
+                "pool_size": self.concurrency,
+                "health_interval": float(os.getenv("AI_HEALTH_INTERVAL_SECONDS", 5)),
+                "slow_factor": float(os.getenv("AI_EJECT_SLOW_FACTOR", 3.0)),
+                "eject_seconds": float(os.getenv("AI_EJECT_SECONDS", 30)),
+                "ready_wait": float(os.getenv("AI_READY_WAIT_SECONDS", 600)),
+            },
+        )
+        
+        # x-max-priority of the incoming queue (0 = plain FIFO queue), must match the API's setting
+        self.max_priority = int(os.getenv("RABBITMQ_MAX_PRIORITY", 0))
+        
+        # how the redis cache key is derived from the ticket text: raw, normalized or simhash
+        self.cache_key_strategy_name = os.getenv("CACHE_KEY_STRATEGY", "normalized")
+        self.simhash_max_distance = int(os.getenv("CACHE_SIMHASH_MAX_DISTANCE", 3))
+        self.cache_ttl = int(os.getenv("CACHE_TTL_SECONDS", 3600))
+        self.cache_keys = None
+        self.ticket_cache = None
+        
+        # finished tickets are kept by id, so redeliveries and re-submitted ids reuse them (0 disables).
+        # the reused ticket is published again: the first publish may never have reached the broker
+        self.idempotency_ttl = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+        self.idempotency = None
+        
+        # processed tickets go out in transactions of up to RESULT_BATCH_MAX_ITEMS, a delivery is acked once its
+        # result is committed. results the broker doesn't take wait in a redis outbox (RESULT_OUTBOX=none disables)
+        self.result_batch_max_items = int(os.getenv("RESULT_BATCH_MAX_ITEMS", 64))
+        self.result_batch_max_wait_ms = float(os.getenv("RESULT_BATCH_MAX_WAIT_MS", 5))
+        self.result_outbox = os.getenv("RESULT_OUTBOX", "redis").lower() != "none"
+        self.results = None
+        # failed tickets are parked through a transactional channel of their own: acked once it committed
+        self.reroute_channel = None
+        
+        # deliveries received and not acked yet, (channel, delivery tag) -> span. connection thread only,
+        # a drain waits for them
+        self.in_flight = {}
+        self.draining = False
+        
+        # prometheus scrape port, 0 disables the metrics server
+        self.metrics_port = int(os.getenv("WORKER_METRICS_PORT", 8002))
+        # prints every ticket's progress and the processed ticket in full, off the hot path unless debugging
+        self.debug = os.getenv("WORKER_DEBUG", "false").lower() in ("1", "true", "yes")
+        
+        # one pooled client shared by the executor threads; their cache get/set calls share pipelines
+        self.redis_max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", max(4, self.concurrency)))
+        self.redis_pipeline_max_commands = int(os.getenv("REDIS_PIPELINE_MAX_COMMANDS", 64))
+        self.redis_pipeline_max_wait_ms = float(os.getenv("REDIS_PIPELINE_MAX_WAIT_MS", 0))
+        
         self.redis_conn = None
         self.rabbit_conn = None
         self.rabbit_channel = None
@@ -38,9 +143,40 @@ class TicketWorker:
     def _connect_redis(self):
         print("Attempting to Connect Redis .. ")
         try:
-            self.redis_conn  = redis.Redis(host=self.redis_host,port=6379,db=0,decode_responses=True)
+            pool = redis.ConnectionPool(host=self.redis_host, port=6379, db=0, max_connections=self.redis_max_connections)
+            self.redis_conn  = redis.Redis(connection_pool=pool)
             self.redis_conn.ping()
+            if self.redis_pipeline_max_commands > 1:
+                self.redis_conn = PipelinedRedis(
+                    self.redis_conn,
+                    max_commands=self.redis_pipeline_max_commands,
+                    max_wait_ms=self.redis_pipeline_max_wait_ms,
+                )
             print("successfully connected to redis")
+            self.cache_keys = build_cache_key_strategy(
+                self.cache_key_strategy_name,
+                self.redis_conn,
+                simhash_max_distance=self.simhash_max_distance,
+                index_ttl=self.cache_ttl,
+            )
+            # in-process LRU in front of redis, plus single-flight so a burst of identical tickets costs one generation
+            self.ticket_cache = TicketCache(
+                self.redis_conn,
+                ttl=self.cache_ttl,
+                local_maxsize=int(os.getenv("LOCAL_CACHE_SIZE", 10000)),
+                local_ttl=float(os.getenv("LOCAL_CACHE_TTL_SECONDS", 60)),
+                lock_ttl_ms=int(os.getenv("CACHE_PENDING_TTL_MS", 35000)),
+                wait_timeout=float(os.getenv("CACHE_WAIT_TIMEOUT_SECONDS", 35)),
+                codec=CacheCodec(compress_above=int(os.getenv("CACHE_COMPRESS_ABOVE_BYTES", 256))),
+            )
+            if self.idempotency_ttl > 0:
+                self.idempotency = IdempotencyStore(
+                    self.redis_conn,
+                    ttl=self.idempotency_ttl,
+                    pending_ttl_ms=int(os.getenv("IDEMPOTENCY_PENDING_TTL_MS", 90000)),
+                    wait_timeout=float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT_SECONDS", 90)),
+                    codec=self.ticket_cache.codec,
+                )
         except redis.exceptions.ConnectionError as e:
             print(f"couldn't connect to Redis:{e}")
             exit(1)
@@ -60,126 +196,340 @@ class TicketWorker:
                 time.sleep(5)
                 
         self.rabbit_channel = self.rabbit_conn.channel()
+        self.rabbit_channel.basic_qos(prefetch_count=self.prefetch_count)
         self.rabbit_channel.exchange_declare(exchange=self.exchange_name, exchange_type='direct', durable=True)
 
-        self.rabbit_channel.queue_declare(queue=self.incoming_queue, durable=True)
+        incoming_arguments = {"x-max-priority": self.max_priority} if self.max_priority > 0 else None
+        self.rabbit_channel.queue_declare(queue=self.incoming_queue, durable=True, arguments=incoming_arguments)
         self.rabbit_channel.queue_bind(exchange=self.exchange_name, queue=self.incoming_queue, routing_key=self.incoming_routing_key)
 
         self.rabbit_channel.queue_declare(queue=self.outgoing_queue, durable=True)
         self.rabbit_channel.queue_bind(exchange=self.exchange_name, queue=self.outgoing_queue, routing_key=self.outgoing_routing_key)
+
+        retry_arguments = {
+            "x-message-ttl": self.retry_delay_ms,
+            "x-dead-letter-exchange": self.exchange_name,
+            "x-dead-letter-routing-key": self.incoming_routing_key,
+        }
+        self.rabbit_channel.queue_declare(queue=self.retry_queue, durable=True, arguments=retry_arguments)
+        self.rabbit_channel.queue_bind(exchange=self.exchange_name, queue=self.retry_queue, routing_key=self.retry_routing_key)
+        self.rabbit_channel.queue_declare(queue=self.dead_letter_queue, durable=True)
+        self.rabbit_channel.queue_bind(exchange=self.exchange_name, queue=self.dead_letter_queue, routing_key=self.dead_letter_routing_key)
         
         
-    def _publish_processed_ticket(self,processed_ticket:dict):
-        try:
-            message_body=json.dumps(processed_ticket)
-            self.rabbit_channel.basic_publish(
-                exchange=self.exchange_name,
-                routing_key=self.outgoing_routing_key,
-                body=message_body.encode('utf-8'),
-                properties=pika.BasicProperties(delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE)
-            )
+    def _publish_processed_ticket(self, processed_ticket: dict, on_done):
+        '''queues the ticket for the next result batch, `on_done(safe)` runs once the batch is sent'''
+        message_body = orjson.dumps(processed_ticket)
+        with tracer.start_as_current_span("publish reason", kind=SpanKind.PRODUCER,
+                                          attributes={"messaging.destination.name": self.outgoing_routing_key}):
+            headers = inject_headers()
+        if self.debug:
             id = processed_ticket.get('id','[N/A]')
             print(f"publish process ticket {id} to exchange '{self.exchange_name}' with key '{self.outgoing_routing_key}'.")
-        except Exception as e:
-            print(f"!! Failed to publish process ticket to RabbitMQ : {e}")
+        self.results.publish(message_body, headers, on_done)
         
         
         
-    def _get_ai_ticket(self, userInput: str, customerName: Optional[str], customerid: Optional[str]) -> str:
+    def _reroute_failed_ticket(self, properties, body: bytes, retry: bool = True) -> bool:
+        '''republishes a failed delivery, unchanged, to the retry queue (it comes back after TICKET_RETRY_DELAY_MS)
+        or, when it can't be retried, to the dead-letter queue. returns whether the broker committed it'''
+        headers = dict(properties.headers or {})
+        attempts = int(headers.get("x-retry-count", 0))
+        if retry and attempts < self.max_retries:
+            destination, routing_key = "retry", self.retry_routing_key
+            headers["x-retry-count"] = attempts + 1
+        else:
+            destination, routing_key = "dead_letter", self.dead_letter_routing_key
+        try:
+            if self.reroute_channel is None or not self.reroute_channel.is_open:
+                # first failure, or the channel went with a reconnect
+                self.reroute_channel = self.rabbit_conn.channel()
+                self.reroute_channel.tx_select()
+            self.reroute_channel.basic_publish(
+                exchange=self.exchange_name,
+                routing_key=routing_key,
+                body=body,
+                properties=pika.BasicProperties(
+                    delivery_mode=pika.spec.PERSISTENT_DELIVERY_MODE, priority=properties.priority, headers=headers
+                ),
+            )
+            self.reroute_channel.tx_commit()
+            metrics.TICKETS_REROUTED.labels(destination).inc()
+            print(f"sent failed ticket to the {destination.replace('_', '-')} queue (attempt {attempts + 1})")
+            return True
+        except Exception as e:
+            print(f"!! Failed to reroute failed ticket : {e}")
+            return False
+    
+    def _get_ai_ticket(self, userInput: str, customerName: Optional[str], customerid: Optional[str], id: Optional[str], priority: int = 0) -> Optional[dict]:
         '''calls vllm server to generate the  structured ticket'''
-        headers = {"Content-Type":"application/json"}
         data = {
             "userInput": userInput,
             "customerName": customerName,
-            "customerid": customerid
+            "customerid": customerid,
+            "id": id,
+            "priority": priority
         }
-        try:
-            response = requests.post(self.vllm_api_url,headers=headers,json=data,timeout=30)
-            response.raise_for_status()
-            return response.text
-        except requests.exceptions.RequestException as e:
-            print(f"ERROR : Cloud not get response from vLLM : {e}")
-            return None
+        return self.ai_client.generate(data)
     
-    def process_user_request(self, userInput: str, customerName: Optional[str], customerid: Optional[str], id: Optional[str]):
-        '''main processing logic including caching'''
-        cache_key = f"ticket:{userInput}"
-        cached_results = self.redis_conn.get(cache_key)
-        
-        if cached_results :
-            print(f"Cache hit for key : '{cache_key}'")
-            processed_ticket = json.loads(cached_results)
-            processed_ticket["id"] = id
-            print(json.dumps(json.loads(cached_results),indent=2))
-            self._publish_processed_ticket(processed_ticket)
-            return
+    def process_user_request(self, userInput: str, customerName: Optional[str], customerid: Optional[str], id: Optional[str], priority: int = 0) -> Optional[dict]:
+        '''main processing logic including caching, returns the processed ticket to publish (runs on an executor thread)'''
+        with tracer.start_as_current_span("ticket cache") as span:
+            cache_key = self.cache_keys.key_for(userInput, customerName)
+            
+            ai_part, source = self.ticket_cache.get_or_compute(
+                cache_key, lambda: self._generate_ai_part(userInput, customerName, customerid, id, priority)
+            )
+            span.set_attribute("cache.source", source or "none")
+        metrics.CACHE_LOOKUPS.labels(source.replace(" hit", "")).inc()
         
-        print(f"cache miss for key :'{cache_key}'")
-        print("Calling vLLM inference Server ..")        
+        if ai_part is None:
+            print("Failed to get a valid response from AI server.")
+            return None
         
-        result_json_str = self._get_ai_ticket(userInput, customerName, customerid)
+        if source == TicketCache.GENERATED:
+            if "error" not in ai_part:
+                self.cache_keys.remember(userInput, cache_key, customerName)
+                if self.debug:
+                    print("Stored new AI result in cache.")
+        elif self.debug:
+            print(f"Cache {source} for key : '{cache_key}'")
         
-        if result_json_str:
-            try:
-                parsed_json = json.loads(result_json_str)
-                
-                if id:
-                    parsed_json["id"] = id
-                    
-                print("vLLM processing complete!")
-                print(json.dumps(parsed_json, indent=2))
-
-                self._publish_processed_ticket(parsed_json)
-                
+        # the part may come from another customer's ticket with the same key
+        processed_ticket = personalize(ai_part, id, userInput, customerName, customerid)
+        if self.debug:
+            print(orjson.dumps(processed_ticket, option=orjson.OPT_INDENT_2).decode())
+        return processed_ticket
+    
+    def _generate_ai_part(self, userInput: str, customerName: Optional[str], customerid: Optional[str], id: Optional[str], priority: int = 0) -> Optional[dict]:
+        '''cache miss: asks the AI server, returns the result without the ticket id and customer fields so it can be shared'''
+        if self.debug:
+            print("cache miss, calling vLLM inference Server ..")
+        parsed_json = self._get_ai_ticket(userInput, customerName, customerid, id, priority)
+        if parsed_json is None:
+            return None
         
-                if "error" not in parsed_json:
-                    ai_part_to_cache = parsed_json.copy()
-                    ai_part_to_cache.pop("id", None)
-                    self.redis_conn.set(cache_key, json.dumps(ai_part_to_cache), ex=3600)
-                    print("Stored new AI result in cache.")
-
-            except json.JSONDecodeError:
-                print(f"ERROR: AI server returned a non-JSON response: {result_json_str}")
-        else:
-            print("Failed to get a valid response from AI server.")
+        if self.debug:
+            print("vLLM processing complete!")
+        return shareable_part(parsed_json)
             
     
-    def callback(self,ch,method,properties,body):
-        
+    def _handle_message(self, body, priority: int = 0, received_at: Optional[float] = None, span=None) -> Optional[dict]:
+        '''runs on an executor thread: processes the delivery inside its "process ticket" span'''
+        if received_at is not None:
+            metrics.EXECUTOR_WAIT.observe(time.perf_counter() - received_at)
+        if span is None:
+            return self._process_message(body, priority)
+        span.add_event("executor thread picked up the ticket")
+        with trace.use_span(span, end_on_exit=False):
+            return self._process_message(body, priority)
+    
+    def _process_message(self, body, priority: int = 0) -> Optional[dict]:
+        '''decodes one delivery and processes it'''
         try:
-            message_data = json.loads(body.decode())
+            message_data = orjson.loads(body)
             userInput = message_data.get("userInput")
             customerName = message_data.get("customerName")
-            customerid = message_data.get("customerid")
-            id = message_data.get("id")
+            # the API publishes its UserRequest model as is: "Id" and "customerId"
+            customerid = message_data.get("customerid") or message_data.get("customerId")
+            id = message_data.get("id") or message_data.get("Id")
             
             if userInput and id:
-                print(f"\n Received ticket {id} for input: '{userInput}'")
-                self.process_user_request(userInput, customerName, customerid, id)
+                trace.get_current_span().set_attribute("ticket.id", id)
+                if self.debug:
+                    print(f"\n Received ticket {id} (priority {priority}) for input: '{userInput}'")
+                process = lambda: self.process_user_request(userInput, customerName, customerid, id, priority)
+                if self.idempotency is None:
+                    return process()
+                processed_ticket, state = self.idempotency.run(id, userInput, process)
+                if state != IdempotencyStore.PROCESSED:
+                    metrics.DUPLICATE_TICKETS.labels(state).inc()
+                    trace.get_current_span().set_attribute("ticket.duplicate", state)
+                    print(f"ticket {id} was already {'processed' if state == IdempotencyStore.DONE else 'being processed'}, reusing its result")
+                return processed_ticket
             else:
-                print("Received message without 'userInput' or 'id'. Discarding.")
+                raise InvalidTicket("message without 'userInput' or 'id'")
         
-        except json.JSONDecodeError:
-            print(f"Received invalid JSON message. Discarding: {body.decode()}")
-        
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-        print("Task Acknowledged!")
+        except orjson.JSONDecodeError:
+            raise InvalidTicket(f"invalid JSON message: {body.decode(errors='replace')}")
+    
+    def callback(self,ch,method,properties,body):
+        '''runs on the connection thread: hands the ticket to the executor, the ack is sent once it completes'''
+        priority = properties.priority or 0
+        received_at = time.perf_counter()
+        metrics.IN_FLIGHT.inc()
+        # child of the API's publish span when the message carries a traceparent header; ends at the ack
+        span = tracer.start_span(
+            "process ticket",
+            context=context_from_headers(properties.headers),
+            kind=SpanKind.CONSUMER,
+            attributes={"messaging.destination.name": self.incoming_queue, "ticket.priority": priority},
+        )
+        self.in_flight[(ch, method.delivery_tag)] = span
+        future = self.executor.submit(priority, self._handle_message, body, priority, received_at, span)
+        future.add_done_callback(functools.partial(self._on_ticket_done, ch, method.delivery_tag, properties, body, received_at, span))
+    
+    def _on_ticket_done(self, ch, delivery_tag, properties, body, received_at, span, future):
+        # pika is not thread safe, so publishing, acking and the in-flight bookkeeping hop back onto the connection thread
+        connection = self.rabbit_conn
+        try:
+            if connection is None:
+                raise pika.exceptions.ConnectionWrongStateError("reconnecting")
+            connection.add_callback_threadsafe(
+                functools.partial(self._finish_ticket, ch, delivery_tag, properties, body, received_at, span, future)
+            )
+        except pika.exceptions.AMQPError:
+            # the connection is gone: the reconnect forgets the delivery, RabbitMQ hands it out again and
+            # its idempotency record spares the generation
+            print("!! RabbitMQ connection lost before the ticket finished, it will be redelivered")
+    
+    def _finish_ticket(self, ch, delivery_tag, properties, body, received_at, span, future):
+        '''publishes the result, or parks a failed ticket in the retry / dead-letter queue, then acks exactly
+        this delivery, so tickets may finish in any order. a result is acked once its batch is committed'''
+        if (ch, delivery_tag) not in self.in_flight:
+            # received before a reconnect, RabbitMQ has requeued it already
+            return
+        try:
+            processed_ticket = future.result()
+            outcome = "published" if processed_ticket else "failed"
+        except InvalidTicket as e:
+            print(f"!! Received an unprocessable ticket : {e}")
+            processed_ticket = None
+            outcome = "invalid"
+        except Exception as e:
+            print(f"!! Unexpected error while processing ticket : {e}")
+            span.record_exception(e)
+            processed_ticket = None
+            outcome = "error"
         
+        with trace.use_span(span, end_on_exit=False):
+            if processed_ticket:
+                self._publish_processed_ticket(
+                    processed_ticket, functools.partial(self._ack_ticket, ch, delivery_tag, received_at, span, outcome)
+                )
+                return
+            span.set_status(Status(StatusCode.ERROR, f"ticket {outcome}"))
+            # one that can't be parked goes back to RabbitMQ rather than being lost
+            parked = self._reroute_failed_ticket(properties, body, retry=outcome != "invalid")
+        self._ack_ticket(ch, delivery_tag, received_at, span, outcome, parked)
+    
+    def _ack_ticket(self, ch, delivery_tag, received_at, span, outcome: str, safe: bool = True):
+        '''acks the delivery once its result is safe, or hands it back to RabbitMQ. ends the ticket's span'''
+        try:
+            if safe:
+                ch.basic_ack(delivery_tag=delivery_tag)
+            else:
+                ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+                if outcome == "published":
+                    outcome = "unpublished"
+            acked = "acked" if safe else "nacked, back in the queue"
+        except pika.exceptions.AMQPError as e:
+            # the channel it came on is gone: RabbitMQ has already put the delivery back in the queue
+            print(f"!! Couldn't ack ticket {outcome}, it will be redelivered : {e!r}")
+            acked = None
+        if self.in_flight.pop((ch, delivery_tag), None) is None:
+            return  # forgotten by a reconnect, which ended its span
+        span.end()
+        metrics.IN_FLIGHT.dec()
+        metrics.CONSUME_TO_ACK.observe(time.perf_counter() - received_at)
+        metrics.TICKETS.labels(outcome).inc()
+        if acked and self.debug:
+            print(f"ticket {outcome}, {acked}")
+    
+    def _forget_deliveries(self):
+        '''the connection they came on is gone and RabbitMQ requeued them: a drain no longer waits for them'''
+        if self.in_flight:
+            print(f"{len(self.in_flight)} tickets in flight will be redelivered")
+        for span in self.in_flight.values():
+            span.end()
+            metrics.IN_FLIGHT.dec()
+        self.in_flight.clear()
         
+    def _reconnect_rabbitmq(self, error):
+        '''the connection or the consuming channel broke. unacked deliveries go back to the queue on the
+        broker's side, the results not sent yet go to the outbox and are replayed once reconnected'''
+        print(f"!! Lost RabbitMQ connection : {error!r}, reconnecting ..")
+        self.results.flush()
+        self._forget_deliveries()
+        if self.rabbit_conn.is_open:
+            # only the channel broke: start over on a fresh connection, so its deliveries are requeued too
+            try:
+                self.rabbit_conn.close()
+            except pika.exceptions.AMQPError:
+                pass
+        self.rabbit_conn = None
+        self._connect_rabbitmq()
+        self.results.open(self.rabbit_conn)
+        self.results.replay_outbox()
+    
     def run(self):
         '''this start woker and begins consumung messages'''
         self._connect_rabbitmq()
         self._connect_redis()
+        outbox = ResultOutbox(self.redis_conn, codec=self.ticket_cache.codec) if self.result_outbox else None
+        self.results = ResultPublisher(
+            self.exchange_name,
+            self.outgoing_routing_key,
+            outbox=outbox,
+            max_batch=self.result_batch_max_items,
+            max_wait_ms=self.result_batch_max_wait_ms,
+        )
+        self.results.open(self.rabbit_conn)
+        # results another worker (or this one, before a restart) couldn't publish
+        self.results.replay_outbox()
+        self.executor = PriorityExecutor(max_workers=self.concurrency, thread_name_prefix="ticket")
+        setup_tracing("ticket-worker")
+        if self.metrics_port:
+            start_http_server(self.metrics_port)
+            print(f"metrics exposed on port {self.metrics_port}")
         
-        print(f"waiting for messages in queue \"{self.incoming_queue}\". To exit press CTRL+C")
-        self.rabbit_channel.basic_consume(queue=self.incoming_queue, on_message_callback=self.callback)
+        print(f"waiting for messages in queue \"{self.incoming_queue}\" ({self.concurrency} in flight, prefetch {self.prefetch_count}). To exit press CTRL+C")
+        # the supervisor (and docker stop) ask for the same drain as CTRL+C with SIGTERM
+        # (signal handlers can only be set on the main thread, the benchmarks run the worker on another one)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._request_drain)
+            signal.signal(signal.SIGINT, self._request_drain)
         
         try:
-            self.rabbit_channel.start_consuming()
+            while not self.draining:
+                self.rabbit_channel.basic_consume(queue=self.incoming_queue, on_message_callback=self.callback)
+                try:
+                    self.rabbit_channel.start_consuming()
+                    break
+                except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                    self._reconnect_rabbitmq(e)
+            if self.draining:
+                self._drain()
         except KeyboardInterrupt:
-            if self.rabbit_conn and self.rabbit_conn.is_open:
+            print("drain abandoned, RabbitMQ redelivers the tickets that weren't acked")
+        print("RabbitMQ connection Closed. Exiting")
+    
+    def _request_drain(self, signum, frame):
+        '''signal handler: only asks the connection thread to stop consuming, so nothing is cut off mid-publish.
+        a second signal gives up on the drain'''
+        if self.draining:
+            raise KeyboardInterrupt
+        self.draining = True
+        print("draining: finishing the tickets already received ..")
+        if self.rabbit_conn is not None and self.rabbit_conn.is_open:
+            self.rabbit_conn.add_callback_threadsafe(self.rabbit_channel.stop_consuming)
+    
+    def _drain(self):
+        '''lets the tickets already received finish. the connection keeps running meanwhile (heartbeats,
+        acks, result batches), the executor threads hop their results onto it as usual'''
+        if self.rabbit_conn is not None and self.rabbit_conn.is_open:
+            try:
+                while self.in_flight:
+                    self.rabbit_conn.process_data_events(time_limit=0.1)
+                # results still waiting for their batch timer
+                self.results.flush()
                 self.rabbit_channel.close()
-            print("RabbitMQ connection Closed. Exiting")
+            except pika.exceptions.AMQPError as e:
+                print(f"!! Lost RabbitMQ connection while draining, the tickets not acked will be redelivered : {e!r}")
+        self.executor.shutdown(wait=False)
+        self.ai_client.close()
+        if isinstance(self.redis_conn, PipelinedRedis):
+            self.redis_conn.close()
             
 if __name__ == "__main__":
     try:
@@ -0,0 +1,88 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# prometheus metrics of the ticket worker, served on WORKER_METRICS_PORT by TicketWorker.run
+
+# seconds: redis round trips sit at the low end, AI generations at the high end
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+TICKETS = Counter(
+    "worker_tickets_total",
+    "Deliveries handled, by outcome: published, unpublished (neither the broker nor the outbox took the result, requeued), "
+    "failed (no result), invalid (unreadable message) or error (exception).",
+    ["outcome"],
+)
+CONSUME_TO_ACK = Histogram(
+    "worker_consume_to_ack_seconds",
+    "Time from a delivery reaching the worker until it is acked.",
+    buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_WAIT = Histogram(
+    "worker_executor_wait_seconds",
+    "Time a delivery waits for a free executor thread.",
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "worker_tickets_in_flight",
+    "Deliveries received and not acked yet (waiting or processing).",
+)
+CACHE_LOOKUPS = Counter(
+    "worker_cache_lookups_total",
+    "Ticket cache lookups by source: local, redis, coalesced (shared another generation) or generated (miss).",
+    ["source"],
+)
+DUPLICATE_TICKETS = Counter(
+    "worker_duplicate_tickets_total",
+    "Deliveries of a ticket id seen before, by the state of its record: done (result reused) or pending (waited for it).",
+    ["state"],
+)
+REDIS_LATENCY = Histogram(
+    "worker_redis_seconds",
+    "Latency of redis calls made by the ticket cache.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+REDIS_PIPELINE_SIZE = Histogram(
+    "worker_redis_pipeline_commands",
+    "Cache commands sent together in one redis pipeline.",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+AI_REQUEST_LATENCY = Histogram(
+    "worker_ai_request_seconds",
+    "Latency of HTTP calls to the AI server.",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+AI_REQUESTS = Counter(
+    "worker_ai_requests_total",
+    "HTTP calls to the AI server by endpoint and outcome (ok or error).",
+    ["endpoint", "outcome"],
+)
+AI_BATCH_SIZE = Histogram(
+    "worker_ai_batch_size",
+    "Tickets per /generate_batch call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+AI_CONCURRENCY_LIMIT = Gauge(
+    "worker_ai_concurrency_limit",
+    "Current adaptive limit on tickets waiting on the AI server at once.",
+)
+TICKETS_REROUTED = Counter(
+    "worker_tickets_rerouted_total",
+    "Failed deliveries sent to the retry queue or, out of retries or unprocessable, to the dead-letter queue.",
+    ["destination"],
+)
+RESULT_BATCH_SIZE = Histogram(
+    "worker_result_batch_size",
+    "Processed tickets published together in one transaction.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+RESULT_COMMIT_LATENCY = Histogram(
+    "worker_result_commit_seconds",
+    "Time for the broker to take a batch of processed tickets (tx.commit round trip).",
+    buckets=LATENCY_BUCKETS,
+)
+RESULT_OUTBOX = Counter(
+    "worker_result_outbox_total",
+    "Processed tickets spilled to the redis outbox because the broker didn't take them, and replayed from it.",
+    ["event"],
+)
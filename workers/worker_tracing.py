@@ -0,0 +1,26 @@
+from typing import Optional
+import os
+import sys
+
+from opentelemetry import trace
+from opentelemetry.propagate import extract, inject
+
+# opentelemetry tracing of the ticket worker. the trace context arrives in the AMQP headers of each
+# delivery and is passed on to the AI server (HTTP headers) and the outgoing reason message (AMQP headers).
+# the tracer provider is set up by the helper the services share: setup_tracing("ticket-worker")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from tracing_setup import setup_tracing  # noqa: E402,F401
+
+tracer = trace.get_tracer("ticket_worker")
+
+
+def context_from_headers(headers: Optional[dict]):
+    return extract(headers or {})
+
+
+def inject_headers(headers: Optional[dict] = None) -> dict:
+    '''adds the current trace context (traceparent) to a header dict'''
+    headers = dict(headers or {})
+    inject(headers)
+    return headers